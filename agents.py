@@ -0,0 +1,395 @@
+
+import os
+import argparse
+from controller import GameController
+from navigation import NavigationGraph
+from settings import Direction, GameModes, TILEMAP
+
+
+class GameAgent():
+    '''
+    Base class for anything that can play the game instead of a human. Each
+    frame the agent looks at the engine state and decides which buttons to
+    press on its controller. The engine never knows the difference between a
+    human and an agent because both produce a GameController.
+    '''
+
+    def __init__(self):
+        '''
+        Initializes the agent with its own controller.
+        '''
+        self.controller = GameController()
+
+    def reset(self, engine):
+        '''
+        Called whenever a level is (re)loaded so the agent can clear any
+        state that it keeps between frames.
+        '''
+        self.controller.reset()
+
+    def act(self, engine) -> GameController:
+        '''
+        Returns the controller state to use for the next engine update. The
+        base agent just stands still.
+        '''
+        self.controller.reset()
+        return self.controller
+
+
+class HeuristicAgent(GameAgent):
+    '''
+    A simple scripted bot. It follows a route to the level exit through a
+    NavigationGraph built for the player's speed, steering in the air so it
+    comes down on the span it jumped for. If the exit can't be reached, it
+    goes as far as it can and holds its ground there. Along the way it
+    stops to shoot enemies that are in front of it and lobs a grenade when a
+    group of enemies gets close. Off the graph (e.g., while dropping in at
+    the start), it runs at the exit and jumps over walls and water.
+    '''
+
+    SHOOT_RANGE = 450       # pixels, matches the enemy vision rect
+    THROW_RANGE = 250       # pixels
+    THROW_CROWD = 2         # enemies within range before throwing
+    STUCK_FRAMES = 30       # frames without progress before forcing a jump
+    DODGE_RANGE = (60, 120) # pixels; closer bullets can't be jumped in time
+
+    def reset(self, engine):
+        '''
+        Finds the exit and builds the navigation graph for the new level.
+        The route is planned once the player first stands on solid ground.
+        '''
+        super().reset(engine)
+        self.world_data = engine.world_data
+        self.exit_x = engine.world_width
+        exit_cell = None
+        for idx_y, row_of_tiles in enumerate(engine.world_data):
+            for idx_x, tile in enumerate(row_of_tiles):
+                if tile == TILEMAP.LEVEL_EXIT_TILE_ID:
+                    self.exit_x = idx_x * TILEMAP.TILE_SIZE
+                    exit_cell = (idx_y, idx_x)
+        self.navigation = NavigationGraph(engine.world_data,
+                                          engine.player.speed, env=engine.env)
+        self.exit_span = self._span_near(exit_cell)
+        self.goal = None
+        self.route = {}
+        self.link = None
+        self.dodging = False
+        self.last_x = None
+        self.stuck_counter = 0
+
+    def _span_near(self, cell):
+        '''
+        Returns the span on or right next to a cell, or None.
+        '''
+        if cell is None:
+            return None
+        row, col = cell
+        for idx_y in (row, row + 1, row - 1):
+            for idx_x in (col, col - 1, col + 1):
+                span = self.navigation.span_of_cell.get((idx_y, idx_x))
+                if span is not None:
+                    return span
+        return None
+
+    def _plan(self, source):
+        '''
+        Picks the goal span and the route to it from the span the player is
+        standing on: the exit if it can be reached, otherwise the reachable
+        span that gets closest to the exit.
+        '''
+        reachable = self.navigation.reachable_from(source)
+        if self.exit_span in reachable:
+            self.goal = self.exit_span
+        else:
+            self.goal = min(reachable, key=self._distance_to_exit)
+        self.route = self.navigation.route_to(self.goal)
+
+    def _distance_to_exit(self, span):
+        '''
+        Returns how far (in pixels) a span ends from the exit.
+        '''
+        size = TILEMAP.TILE_SIZE
+        span = self.navigation.spans[span]
+        return max(span.first * size - self.exit_x,
+                   self.exit_x - (span.last + 1) * size, 0)
+
+    def act(self, engine) -> GameController:
+        '''
+        Chooses the buttons to press based on the player's surroundings.
+        '''
+        if engine.world_data is not getattr(self, 'world_data', None):
+            self.reset(engine)  # a new level was loaded behind our back
+        player = engine.player
+        controller = self.controller
+        controller.reset()
+        if not player.alive:
+            return controller
+
+        # Head towards the goal, jumping where the route says to
+        heading, jump = self._steer(engine)
+        controller.mright = heading == Direction.RIGHT
+        controller.mleft = heading == Direction.LEFT
+        controller.jump = jump or (heading is not None
+                                   and self._is_stuck(player))
+        facing = player.direction if heading is None else heading
+
+        # Stand and fight the closest enemy in the line of fire, on either
+        # side, so that nobody gets to shoot the player in the back
+        target_dx = None
+        ahead = 0
+        for enemy in engine.groups['enemy']:
+            if not enemy.alive:
+                continue
+            dx = enemy.rect.centerx - player.rect.centerx
+            in_line = (enemy.rect.top <= player.rect.centery
+                       < enemy.rect.bottom)  # where the bullets fly
+            if (abs(dx) <= HeuristicAgent.SHOOT_RANGE and in_line
+                    and (target_dx is None or abs(dx) < abs(target_dx))
+                    and self._clear_shot(engine, enemy)):
+                target_dx = dx
+            if 0 < dx * facing.value <= HeuristicAgent.THROW_RANGE:
+                ahead += 1
+        controller.throw = ahead >= HeuristicAgent.THROW_CROWD
+
+        ready = engine.now > player.shoot_time + player.shoot_delay
+        hold = target_dx is not None and player.ammo > 0 and ready
+        if hold:
+            facing = Direction.RIGHT if target_dx > 0 else Direction.LEFT
+            controller.shoot = player.direction == facing
+
+        # Don't run into a grenade that is about to go off
+        for grenade in engine.groups['grenade']:
+            dx = (grenade.rect.centerx - player.rect.centerx) * facing.value
+            if -grenade.inner_radius < dx < grenade.outer_radius:
+                hold = True
+                controller.throw = False
+
+        # Stopping only works once we are on the ground, and turning around
+        # takes one step
+        if hold and not player.in_air:
+            turn = player.direction != facing
+            controller.mright = turn and facing == Direction.RIGHT
+            controller.mleft = turn and facing == Direction.LEFT
+            controller.jump = False
+
+        # Jump straight up over enemy bullets that are about to hit
+        if not player.in_air and self._bullet_incoming(engine):
+            self.dodging = True
+            controller.mleft = controller.mright = False
+            controller.jump = True
+        return controller
+
+    def _bullet_incoming(self, engine):
+        '''
+        Returns True if a bullet is flying at the player and will hit it
+        soon, but not so soon that jumping can't help any more.
+        '''
+        rect = engine.player.rect
+        nearest, farthest = HeuristicAgent.DODGE_RANGE
+        for bullet in engine.groups['bullet']:
+            dx = bullet.rect.centerx - rect.centerx
+            if (dx * bullet.direction < 0
+                    and nearest <= abs(dx) <= farthest
+                    and rect.top <= bullet.rect.centery < rect.bottom):
+                return True
+        return False
+
+    def _steer(self, engine):
+        '''
+        Returns the (heading, jump) that moves the player along its route.
+        The heading is None when the player should stop, e.g., to drop
+        straight down onto the column it jumped for.
+        '''
+        player = engine.player
+        rect = player.rect
+        size = TILEMAP.TILE_SIZE
+        to_exit = (Direction.RIGHT if self.exit_x >= rect.centerx
+                   else Direction.LEFT)
+
+        # Dodging jumps go straight up and down
+        if not player.in_air:
+            self.dodging = False
+        elif self.dodging:
+            return None, False
+
+        # Between spans (in the air or stepping off an edge), line up with
+        # the column the last link lands in
+        source = None if player.in_air else self.navigation.span_at(rect)
+        if source is None and self.link is not None:
+            link = self.link
+            dx = link.landing * size + size // 2 - rect.centerx
+            if not player.in_air:
+                return (Direction.RIGHT if link.landing > link.take_off
+                        else Direction.LEFT), False
+            if abs(dx) >= player.speed:
+                return (Direction.RIGHT if dx > 0 else Direction.LEFT), False
+            return None, False
+        self.link = None
+        if source is None:
+            if player.in_air:
+                return player.direction, False
+            return to_exit, self._obstacle_ahead(engine, to_exit)
+        if source != self.goal and source not in self.route:
+            self._plan(source)
+
+        # On the goal span, walk to the end nearest the exit (or into it)
+        if source == self.goal:
+            span = self.navigation.spans[source]
+            col = min(max(self.exit_x // size, span.first), span.last)
+            dx = col * size + size // 2 - rect.centerx
+            if source == self.exit_span or abs(dx) >= player.speed:
+                return (Direction.RIGHT if dx > 0 else Direction.LEFT), False
+            return None, False
+
+        # Walk to the take-off column, then past its middle before jumping.
+        # Drops just keep walking, over the edge of the span.
+        link = self.link = self.route[source]
+        heading = (Direction.RIGHT if link.landing > link.take_off
+                   else Direction.LEFT)
+        col = rect.centerx // size
+        beyond = (col - link.take_off) * heading.value
+        if beyond < 0 or beyond > 0 and link.kind == NavigationGraph.JUMP:
+            return (Direction.RIGHT if link.take_off > col
+                    else Direction.LEFT), False
+        middle = col * size + size // 2
+        past_middle = (rect.centerx - middle) * heading.value >= 0
+        return heading, link.kind == NavigationGraph.JUMP and past_middle
+
+    def _obstacle_ahead(self, engine, heading):
+        '''
+        Returns True if there is a wall or a drop into water (or the void)
+        directly in front of the player.
+        '''
+        world_data = engine.world_data
+        rows, cols = len(world_data), len(world_data[0])
+        rect = engine.player.rect
+        edge = rect.right if heading == Direction.RIGHT else rect.left
+        foot_row = rect.bottom // TILEMAP.TILE_SIZE
+        if not 0 < foot_row < rows:
+            return False
+
+        # A wall at head or knee height, half a tile ahead
+        col = (edge + heading.value * TILEMAP.TILE_SIZE // 2) // TILEMAP.TILE_SIZE
+        if not 0 <= col < cols:
+            return False
+        for row in (foot_row - 1, rect.top // TILEMAP.TILE_SIZE):
+            if _is_dirt(world_data[max(0, row)][col]):
+                return True
+
+        # Look down the column right at our toes: ground means a safe drop,
+        # but water or falling off the map means we have to jump now
+        col = (edge + heading.value * engine.player.speed) // TILEMAP.TILE_SIZE
+        if not 0 <= col < cols:
+            return False
+        for row in range(foot_row, rows):
+            tile = world_data[row][col]
+            if _is_dirt(tile):
+                return False
+            if TILEMAP.WATER_TILE_FIRST <= tile <= TILEMAP.WATER_TILE_LAST:
+                return True
+        return True
+
+    def _clear_shot(self, engine, enemy):
+        '''
+        Returns True if no wall stands between the player and an enemy at
+        the height the bullet would travel.
+        '''
+        row = engine.player.rect.centery // TILEMAP.TILE_SIZE
+        first = engine.player.rect.centerx // TILEMAP.TILE_SIZE
+        last = enemy.rect.centerx // TILEMAP.TILE_SIZE
+        if first > last:
+            first, last = last, first
+        world_row = engine.world_data[row]
+        return not any(_is_dirt(tile) for tile in world_row[first:last + 1])
+
+    def _is_stuck(self, player):
+        '''
+        Returns True if the player hasn't moved for a while, for example when
+        pushing against a wall that is too tall to see from the feet.
+        '''
+        if player.rect.x == self.last_x:
+            self.stuck_counter += 1
+        else:
+            self.stuck_counter = 0
+        self.last_x = player.rect.x
+        return self.stuck_counter >= HeuristicAgent.STUCK_FRAMES
+
+
+def _is_dirt(tile):
+    '''
+    Returns True if the tile is one that blocks movement.
+    '''
+    return TILEMAP.DIRT_TILE_FIRST <= tile <= TILEMAP.DIRT_TILE_LAST
+
+
+def run_headless(engine, agent, max_frames, restart_on_death=True,
+                 on_frame=None):
+    '''
+    Lets an agent play without any rendering, e.g. for soak and throughput
+    tests. Finished levels advance to the next one, and deaths either
+    restart the level or end the run. If given, on_frame() is called after
+    every frame. Returns a dictionary of statistics.
+    '''
+    stats = {'frames': 0, 'levels_completed': 0, 'deaths': 0}
+    if engine.game_mode != GameModes.INTERACTIVE:
+        engine.game_mode = GameModes.INTERACTIVE
+        engine.load_current_level()
+    agent.reset(engine)
+
+    while stats['frames'] < max_frames and engine.game_mode != GameModes.QUIT:
+        engine.update(agent.act(engine))
+        stats['frames'] += 1
+        if on_frame is not None:
+            on_frame()
+        if engine.level_complete:
+            stats['levels_completed'] += 1
+            engine.load_next_level()
+            if engine.game_mode == GameModes.QUIT:
+                break
+            agent.reset(engine)
+        elif not engine.player.alive:
+            stats['deaths'] += 1
+            if not restart_on_death:
+                break
+            engine.load_current_level()
+            agent.reset(engine)
+    return stats
+
+
+if __name__ == '__main__':
+    '''
+    Runs the reference bot headless, e.g. `python agents.py --frames 36000`
+    for a ten minute soak at 60 FPS.
+    '''
+    parser = argparse.ArgumentParser(description='Run the bot headless.')
+    parser.add_argument('--frames', type=int, default=3600)
+    parser.add_argument('--level', type=int, default=1)
+    parser.add_argument('--track-allocations', action='store_true',
+                        help='report allocations per engine stage on exit')
+    parser.add_argument('--alloc-budget', type=float, default=None,
+                        help='count frames allocating more KiB than this')
+    args = parser.parse_args()
+
+    # SDL needs a display and audio device even if we never show anything
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame
+    from engine import GameEngine
+    pygame.init()
+    pygame.mixer.init()
+    pygame.display.set_mode((1, 1))
+
+    engine = GameEngine()
+    engine.level = args.level
+    tracker = None
+    if args.track_allocations:
+        from allocations import AllocationTracker
+        tracker = AllocationTracker(args.alloc_budget)
+        tracker.instrument(engine)
+        tracker.start()
+    stats = run_headless(engine, HeuristicAgent(), args.frames,
+                         on_frame=tracker and tracker.end_frame)
+    print(stats)
+    if tracker is not None:
+        print(tracker.report())
+    pygame.quit()
@@ -0,0 +1,247 @@
+
+import gc
+import time
+import tracemalloc
+from collections import defaultdict
+
+
+class AllocationTracker():
+    '''
+    A diagnostic mode that attributes memory allocations and garbage
+    collector pauses to the stages of the engine, one frame at a time.
+
+    instrument() wraps the stage methods of one engine object (nothing is
+    changed for other engines, and nothing costs anything while the tracker
+    isn't in use). Whatever happens while a stage runs is charged to it,
+    not counting the stages it calls itself. For every stage and frame the
+    tracker records:
+
+      * peak: the most memory (bytes) allocated above where it started,
+        which catches short-lived objects like Rects and text surfaces
+      * net: how much more memory is in use afterwards
+      * objects: how many more objects the garbage collector tracks, which
+        is what eventually triggers a collection
+      * gc_ms: time spent in collections that started during the stage
+
+    The peaks of a frame add up to its allocations, which can be checked
+    against a budget. A snapshot is also taken at the end of every frame and
+    compared to the previous one, so the report can name the lines of code
+    that allocate the most in a typical frame (those whose blocks are still
+    alive when the frame ends, such as garbage that waits for the collector)
+    rather than whatever grew over the whole run.
+    '''
+
+    STAGES = ('load_current_level', 'update', 'player_actions',
+              'enemy_actions', 'apply_physics', 'enter_triggers',
+              'collect_item_boxes', 'handle_bullet_damage',
+              'make_grenades_explode', 'remove_stray_bullets',
+              'check_for_player_death', 'check_if_level_exit', 'draw')
+
+    # The tracker's own allocations aren't worth reporting
+    SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                        tracemalloc.Filter(False, __file__),
+                        tracemalloc.Filter(False,
+                                           '<frozen importlib._bootstrap>'))
+
+    def __init__(self, budget_kib=None, strict=False, history=600):
+        '''
+        Creates a tracker; frames that allocate more than budget_kib are
+        counted, or raise a RuntimeError if strict.
+        '''
+        self.budget = None if budget_kib is None else budget_kib * 1024
+        self.strict = strict
+        self.history = history
+        self.frames = []
+        self.over_budget = 0
+        self.gc_pauses = defaultdict(list)
+        self.stack = []
+
+        # Totals of the current frame: stage -> [peak, net, objects, gc_ms]
+        self.frame = defaultdict(lambda: [0, 0, 0, 0.0])
+        self.gc_start = None
+        self.segment = None
+
+        # Allocation sites: (file, line) -> [bytes, blocks, frames], summed
+        # over the frames in which the site's memory grew
+        self.sites = defaultdict(lambda: [0, 0, 0])
+        self.snapshot = None
+        self.snapshot_frames = 0
+
+    def start(self):
+        '''
+        Starts tracing allocations and timing garbage collections.
+        '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.snapshot = self._take_snapshot()
+        self._begin_segment()
+        gc.callbacks.append(self._gc_callback)
+
+    def stop(self):
+        '''
+        Stops tracing.
+        '''
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        tracemalloc.stop()
+
+    def instrument(self, engine):
+        '''
+        Wraps the stage methods of an engine so that they report to this
+        tracker.
+        '''
+        for name in AllocationTracker.STAGES:
+            method = getattr(engine, name)
+            setattr(engine, name, self._wrap(name, method))
+
+    def _wrap(self, name, method):
+        '''
+        Returns a function that runs a method as a stage.
+        '''
+        def stage(*args, **kwargs):
+            self._end_segment()
+            self.stack.append(name)
+            self._begin_segment()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._end_segment()
+                self.stack.pop()
+                self._begin_segment()
+        return stage
+
+    def _stage(self):
+        '''
+        Returns the name of the stage that is running right now.
+        '''
+        return self.stack[-1] if self.stack else 'other'
+
+    def _begin_segment(self):
+        '''
+        Starts measuring from here; the measurements go to the current stage
+        when the segment ends.
+        '''
+        tracemalloc.reset_peak()
+        self.segment = (tracemalloc.get_traced_memory()[0], gc.get_count()[0])
+
+    def _end_segment(self):
+        '''
+        Charges everything since _begin_segment() to the current stage.
+        '''
+        current, peak = tracemalloc.get_traced_memory()
+        start, count = self.segment
+        totals = self.frame[self._stage()]
+        totals[0] += max(0, peak - start)
+        totals[1] += current - start
+        totals[2] += gc.get_count()[0] - count
+
+    def _gc_callback(self, phase, info):
+        '''
+        Times collections, charging them to the current stage. Collections
+        reset the object count, so the count is measured around them.
+        '''
+        if phase == 'start':
+            self._end_segment()
+            self.gc_start = time.perf_counter()
+        elif self.gc_start is not None:
+            pause = (time.perf_counter() - self.gc_start) * 1000
+            self.gc_start = None
+            self.frame[self._stage()][3] += pause
+            self.gc_pauses[info['generation']].append(pause)
+            self._begin_segment()
+
+    def end_frame(self):
+        '''
+        Finishes a frame: stores each stage's totals and checks the budget.
+        Returns the number of bytes the frame allocated.
+        '''
+        self._end_segment()
+        frame = {stage: tuple(totals) for stage, totals in self.frame.items()}
+        self.frames.append(frame)
+        del self.frames[:-self.history]
+        self.frame.clear()
+        self._compare_snapshots()
+        self._begin_segment()
+
+        allocated = sum(totals[0] for totals in frame.values())
+        if self.budget is not None and allocated > self.budget:
+            self.over_budget += 1
+            if self.strict:
+                raise RuntimeError(f'frame allocated {allocated / 1024:.1f} '
+                                   f'KiB, over the budget of '
+                                   f'{self.budget / 1024:.1f} KiB')
+        return allocated
+
+    def _take_snapshot(self):
+        '''
+        Returns a snapshot of the traced memory, without the tracker's own.
+        '''
+        return tracemalloc.take_snapshot().filter_traces(
+            AllocationTracker.SNAPSHOT_FILTERS)
+
+    def _compare_snapshots(self):
+        '''
+        Adds the growth of every allocation site since the previous frame
+        to the site totals. This runs between segments, so the snapshot
+        itself isn't charged to any stage.
+        '''
+        snapshot = self._take_snapshot()
+        for stat in snapshot.compare_to(self.snapshot, 'lineno'):
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                totals = self.sites[(frame.filename, frame.lineno)]
+                totals[0] += stat.size_diff
+                totals[1] += max(0, stat.count_diff)
+                totals[2] += 1
+        self.snapshot = snapshot
+        self.snapshot_frames += 1
+
+    def top_sites(self, limit=10):
+        '''
+        Returns the lines of code that allocate the most per frame, as
+        (filename, lineno, bytes, blocks, frames) tuples: the mean bytes and
+        blocks per frame, and the number of frames in which they allocated.
+        '''
+        count = max(1, self.snapshot_frames)
+        sites = sorted(self.sites.items(), key=lambda site: -site[1][0])
+        return [(filename, lineno, size / count, blocks / count, frames)
+                for (filename, lineno), (size, blocks, frames)
+                in sites[:limit]]
+
+    def report(self, limit=10):
+        '''
+        Returns the per-stage averages and maximums over the recorded
+        frames, the garbage collections, and the top allocation sites as
+        text.
+        '''
+        count = max(1, len(self.frames))
+        lines = [f'allocations over the last {len(self.frames)} frames '
+                 f'(mean / max per frame, peak and net in KiB):',
+                 f'  {"stage":<24}{"peak":>16}{"net":>16}{"objects":>16}'
+                 f'{"gc ms":>16}']
+        stages = sorted({stage for frame in self.frames for stage in frame})
+        for stage in stages:
+            columns = []
+            for idx, scale in ((0, 1024), (1, 1024), (2, 1), (3, 1)):
+                values = [frame[stage][idx] / scale for frame in self.frames
+                          if stage in frame]
+                columns.append(f'{sum(values) / count:>8.1f} /'
+                               f'{max(values):>6.1f}')
+            lines.append(f'  {stage:<24}' + ''.join(columns))
+        totals = [sum(totals[0] for totals in frame.values()) / 1024
+                  for frame in self.frames] or [0]
+        lines.append(f'  whole frame: {sum(totals) / count:.1f} KiB mean, '
+                     f'{max(totals):.1f} KiB max')
+        if self.budget is not None:
+            lines.append(f'  frames over the {self.budget / 1024:.1f} KiB '
+                         f'budget: {self.over_budget}')
+        for generation, pauses in sorted(self.gc_pauses.items()):
+            lines.append(f'gc generation {generation}: {len(pauses)} '
+                         f'collections, {max(pauses):.2f} ms max, '
+                         f'{sum(pauses):.1f} ms total')
+        lines.append(f'top allocation sites (mean per frame over '
+                     f'{self.snapshot_frames} frames):')
+        for filename, lineno, size, blocks, frames in self.top_sites(limit):
+            lines.append(f'  {filename}:{lineno}: {size / 1024:.2f} KiB in '
+                         f'{blocks:.1f} blocks, in {frames} frames')
+        return '\n'.join(lines)
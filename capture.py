@@ -0,0 +1,184 @@
+
+import os
+import time
+import zlib
+import queue
+import struct
+import threading
+import pygame
+
+
+def png_chunk(kind, data):
+    '''
+    Returns one PNG chunk: length, type, data, and checksum.
+    '''
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def encode_png(surface, level=3):
+    '''
+    Returns a surface as the bytes of an RGB PNG file. Unlike
+    pygame.image.save(), this lets other threads run while it works, since
+    nearly all of the time is spent in zlib, which releases the GIL.
+    '''
+    width, height = surface.get_size()
+    pixels = pygame.image.tobytes(surface, 'RGB')
+    stride = width * 3
+    rows = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride]
+                    for y in range(height))  # filter type 0 on every row
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', header)
+            + png_chunk(b'IDAT', zlib.compress(rows, level))
+            + png_chunk(b'IEND', b''))
+
+
+class FrameRecorder(threading.Thread):
+    '''
+    Records gameplay footage without slowing down the game loop. Each call
+    to capture() copies the screen into one of a fixed pool of buffers
+    (one blit between surfaces of the same format; the buffers are only
+    allocated while the pool fills up) and queues it; a background thread
+    encodes the queued frames to disk and then returns the buffers to the
+    pool. The encoder holds the GIL as little as possible, so it doesn't
+    stall the game loop either (see encode_png()).
+
+    The queue is only as deep as the pool, and capture() never waits. When
+    the encoder falls behind and every buffer is in use, the new frame is
+    dropped and counted instead, so the game keeps its frame rate and the
+    footage gets choppier.
+
+    Two formats are supported:
+
+      * 'png': one frame_NNNNNN.png per frame, numbered by the call to
+        capture(), so dropped frames show up as gaps
+      * 'raw': all frames back to back in frames.rgb, as 24-bit RGB that
+        e.g. ffmpeg reads with -f rawvideo -pix_fmt rgb24 -s WxH
+    '''
+
+    FORMATS = ('png', 'raw')
+
+    def __init__(self, directory, fmt='png', pool_size=8):
+        '''
+        Creates the (not yet started) recorder; frames are written to
+        directory, which is created if needed.
+        '''
+        super().__init__(name='FrameRecorder', daemon=True)
+        if fmt not in FrameRecorder.FORMATS:
+            raise ValueError(f'Unknown capture format: {fmt}')
+        self.directory = directory
+        self.fmt = fmt
+        self.pool_size = pool_size
+        self.free = queue.Queue()
+        self.queued = queue.Queue()
+        self.buffers = 0
+        self.error = None
+        self.size = None
+
+        # Counters; the encode times are in ms
+        self.captured = 0
+        self.dropped = 0
+        self.encoded = 0
+        self.encode_ms = 0.0
+        self.max_encode_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def capture(self, screen):
+        '''
+        Queues a copy of the screen; call it right after flipping. Returns
+        False if the frame was dropped because every buffer is busy.
+        '''
+        frame = self.captured + self.dropped
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            if self.buffers == self.pool_size:
+                self.dropped += 1
+                return False
+            buffer = screen.copy()
+            self.buffers += 1
+            self.size = buffer.get_size()
+        else:
+            buffer.blit(screen, (0, 0))
+        self.captured += 1
+        self.queued.put((frame, buffer, time.perf_counter()))
+        return True
+
+    @property
+    def backlog(self):
+        '''
+        Returns the number of frames waiting to be encoded.
+        '''
+        return self.queued.qsize()
+
+    def stop(self):
+        '''
+        Encodes the frames still in the queue and shuts down the thread.
+        Any exception that happened on the recorder thread is raised again
+        here.
+        '''
+        self.queued.put(None)
+        self.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        '''
+        Thread body: encode each queued frame and recycle its buffer. After
+        an error, the remaining frames are thrown away so that the game
+        doesn't notice anything until stop().
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        raw_file = None
+        if self.fmt == 'raw':
+            raw_file = open(os.path.join(self.directory, 'frames.rgb'), 'wb')
+        try:
+            while True:
+                item = self.queued.get()
+                if item is None:
+                    break
+                frame, buffer, queued_at = item
+                if self.error is None:
+                    try:
+                        start = time.perf_counter()
+                        self.encode(frame, buffer, raw_file)
+                        end = time.perf_counter()
+                        self.encoded += 1
+                        encode_ms = (end - start) * 1000
+                        self.encode_ms += encode_ms
+                        self.max_encode_ms = max(self.max_encode_ms, encode_ms)
+                        self.max_latency_ms = max(self.max_latency_ms,
+                                                  (end - queued_at) * 1000)
+                    except Exception as error:
+                        self.error = error
+                self.free.put(buffer)
+        finally:
+            if raw_file is not None:
+                raw_file.close()
+
+    def encode(self, frame, buffer, raw_file):
+        '''
+        Writes one frame to disk.
+        '''
+        if raw_file is not None:
+            raw_file.write(pygame.image.tobytes(buffer, 'RGB'))
+        else:
+            path = os.path.join(self.directory, f'frame_{frame:06d}.png')
+            with open(path, 'wb') as png_file:
+                png_file.write(encode_png(buffer))
+
+    def report(self):
+        '''
+        Returns the counters as text.
+        '''
+        mean = self.encode_ms / self.encoded if self.encoded else 0.0
+        lines = [f'captured {self.captured} frames, dropped {self.dropped}, '
+                 f'encoded {self.encoded} to {self.directory} ({self.fmt})',
+                 f'  encode {mean:.1f} ms mean, {self.max_encode_ms:.1f} ms '
+                 f'max; capture to disk {self.max_latency_ms:.1f} ms max',
+                 f'  {self.buffers} buffers in the pool']
+        if self.fmt == 'raw' and self.size is not None:
+            lines.append(f'  read with: -f rawvideo -pix_fmt rgb24 '
+                         f'-s {self.size[0]}x{self.size[1]}')
+        return '\n'.join(lines)
@@ -0,0 +1,363 @@
+
+from array import array
+
+
+class TileGrid():
+    '''
+    Compact, grid-keyed storage for the static tiles of a level. Every cell
+    of the level holds the index of the tile that fills it (or -1) in a typed
+    array, so a system that asks "which tiles touch this rectangle?" only
+    reads the handful of cells under the rectangle instead of walking every
+    tile in the level. The grid only indexes the tiles for collisions; they
+    are GameTile records kept (and drawn) by their TileLayer.
+    '''
+
+    def __init__(self, rows, cols, tile_size):
+        '''
+        Creates an empty grid for a level of the given size.
+        '''
+        self.rows = rows
+        self.cols = cols
+        self.tile_size = tile_size
+        self.cells = array('i', [-1]) * (rows * cols)
+        self.tiles = []
+
+    def add(self, tile):
+        '''
+        Stores a tile in the cell under its top-left corner.
+        '''
+        idx_x = tile.rect.x // self.tile_size
+        idx_y = tile.rect.y // self.tile_size
+        self.cells[idx_y * self.cols + idx_x] = len(self.tiles)
+        self.tiles.append(tile)
+
+    def query(self, left, top, right, bottom):
+        '''
+        Returns the tiles in every cell that overlaps the rectangle with the
+        given edges. Tiles come back in row-major order, which is the same
+        order that the level loaded them into their layer.
+        '''
+        size = self.tile_size
+        col_first = max(0, left // size)
+        col_last = min(self.cols - 1, (right - 1) // size)
+        row_first = max(0, top // size)
+        row_last = min(self.rows - 1, (bottom - 1) // size)
+
+        found = []
+        if col_first > col_last:
+            return found
+        cells, tiles = self.cells, self.tiles
+        for idx_y in range(row_first, row_last + 1):
+            start = idx_y * self.cols
+            for idx in cells[start + col_first:start + col_last + 1]:
+                if idx >= 0:
+                    found.append(tiles[idx])
+        return found
+
+    def query_rect(self, rect):
+        '''
+        Returns the tiles that overlap a pygame.Rect.
+        '''
+        return self.query(rect.left, rect.top, rect.right, rect.bottom)
+
+
+class TileLayer():
+    '''
+    Storage for the static tiles of one kind (obstacles, water, decorations,
+    or exits). The tiles are small records rather than sprites, since they
+    never move, update, or leave the level. They are kept in the order they
+    were loaded (row by row) for whoever needs all of them, and by column,
+    so that drawing a frame only walks the columns on the screen instead of
+    the whole level.
+    '''
+
+    def __init__(self, tile_size):
+        '''
+        Creates an empty layer.
+        '''
+        self.tile_size = tile_size
+        self.tiles = []
+        self.columns = []
+
+    def add(self, tile):
+        '''
+        Adds a tile to the layer.
+        '''
+        col = tile.rect.x // self.tile_size
+        while len(self.columns) <= col:
+            self.columns.append([])
+        self.columns[col].append(tile)
+        self.tiles.append(tile)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def visible(self, left, right):
+        '''
+        Returns the tiles in the columns that overlap the world's x range
+        from left to right.
+        '''
+        first = max(0, left // self.tile_size)
+        last = (right - 1) // self.tile_size
+        found = []
+        for column in self.columns[first:last + 1]:
+            found.extend(column)
+        return found
+
+
+class Animator():
+    '''
+    Advances the animation frames of every animated sprite in one pass per
+    frame. The engine sets the frame time once with `now`, and each sprite's
+    sequence, current frame, and next-due time live in parallel arrays, so
+    a frame that isn't due yet costs a single comparison. The sprite's own
+    image, frame_idx, and animation_time are only written when its frame
+    actually changes.
+
+    Sprites provide animation_sequence(), which returns the list of frames
+    to play and what to do after the last one: LOOP starts over, HOLD stays
+    on the last frame (e.g., the death sequence), and END kills the sprite
+    (e.g., explosions).
+    '''
+
+    LOOP = 0
+    HOLD = 1
+    END = 2
+
+    IDLE_SLOT = 2 ** 62   # next-due time of an unused slot
+
+    def __init__(self, delay):
+        '''
+        Creates an empty animator that changes frames every delay ms.
+        '''
+        self.delay = delay
+        self.now = 0
+        self.sprites = []
+        self.clear()
+
+    def clear(self):
+        '''
+        Stops animating every sprite.
+        '''
+        for sprite in self.sprites:
+            if sprite is not None:
+                sprite.animator = None
+        self.sprites = []
+        self.sequences = []
+        self.frames = array('i')
+        self.lengths = array('i')
+        self.modes = array('b')
+        self.due = array('q')
+        self.free_slots = []
+
+    def add(self, sprite):
+        '''
+        Starts animating a sprite from its current frame_idx and
+        animation_time, which is also how restored sprites pick up where
+        they left off.
+        '''
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.sprites)
+            self.sprites.append(None)
+            self.sequences.append(None)
+            self.frames.append(0)
+            self.lengths.append(0)
+            self.modes.append(Animator.LOOP)
+            self.due.append(Animator.IDLE_SLOT)
+        sequence, mode = sprite.animation_sequence()
+        self.sprites[slot] = sprite
+        self.sequences[slot] = sequence
+        self.frames[slot] = sprite.frame_idx
+        self.lengths[slot] = len(sequence)
+        self.modes[slot] = mode
+        self.due[slot] = sprite.animation_time + self.delay
+        sprite.animator = self
+        sprite.animation_slot = slot
+
+    def play(self, sprite):
+        '''
+        Restarts a sprite's animation from the first frame, after its
+        sequence has changed (e.g., from running to jumping).
+        '''
+        slot = sprite.animation_slot
+        sequence, mode = sprite.animation_sequence()
+        self.sequences[slot] = sequence
+        self.frames[slot] = 0
+        self.lengths[slot] = len(sequence)
+        self.modes[slot] = mode
+        self.due[slot] = self.now + self.delay
+        sprite.frame_idx = 0
+        sprite.animation_time = self.now
+        sprite.image = sequence[0]
+
+    def remove(self, sprite):
+        '''
+        Stops animating a sprite.
+        '''
+        slot = sprite.animation_slot
+        self.sprites[slot] = None
+        self.sequences[slot] = None
+        self.due[slot] = Animator.IDLE_SLOT
+        self.free_slots.append(slot)
+        sprite.animator = None
+
+    def update(self):
+        '''
+        Moves every sprite whose frame is due on to its next frame.
+        '''
+        now = self.now
+        frames, lengths, due = self.frames, self.lengths, self.due
+        for slot, when in enumerate(due):
+            if when >= now:
+                continue
+            sprite = self.sprites[slot]
+            frame = frames[slot] + 1
+            if frame >= lengths[slot]:
+                mode = self.modes[slot]
+                if mode == Animator.END:
+                    self.remove(sprite)
+                    sprite.kill()
+                    continue
+                frame = lengths[slot] - 1 if mode == Animator.HOLD else 0
+            frames[slot] = frame
+            due[slot] = now + self.delay
+            sprite.frame_idx = frame
+            sprite.animation_time = now
+            sprite.image = self.sequences[slot][frame]
+
+
+class Trigger():
+    '''
+    A region of the world that does something when a sprite touches it:
+    water drowns, exits finish the level, and item boxes get collected.
+    '''
+    __slots__ = ('kind', 'rect', 'sprite', 'cells')
+
+    def __init__(self, kind, rect, sprite=None):
+        '''
+        Creates a trigger of a given kind; sprite is the object behind it,
+        if there is one (e.g., the ItemBox).
+        '''
+        self.kind = kind
+        self.rect = rect
+        self.sprite = sprite
+        self.cells = []
+
+
+class TriggerIndex():
+    '''
+    Grid-keyed index of the triggers in a level. Every trigger is listed in
+    each tile cell it covers, so finding the triggers that touch a sprite
+    only takes a few dictionary lookups no matter how large the level is.
+    The index also remembers what each sprite touched last time, which
+    turns touches into enter events.
+    '''
+
+    def __init__(self, tile_size):
+        '''
+        Creates an empty index.
+        '''
+        self.tile_size = tile_size
+        self.cells = {}
+        self.inside = {}
+
+    def _cells(self, rect):
+        '''
+        Returns the (column, row) keys of every cell a rectangle overlaps.
+        '''
+        size = self.tile_size
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        cols = range(rect.left // size, (rect.right - 1) // size + 1)
+        return [(idx_x, idx_y) for idx_y in rows for idx_x in cols]
+
+    def add(self, kind, rect, sprite=None):
+        '''
+        Registers a new trigger and returns it.
+        '''
+        trigger = Trigger(kind, rect, sprite)
+        trigger.cells = self._cells(rect)
+        for key in trigger.cells:
+            self.cells.setdefault(key, []).append(trigger)
+        return trigger
+
+    def remove(self, trigger):
+        '''
+        Unregisters a trigger, e.g., after its item box has been collected.
+        Removing a trigger twice does nothing.
+        '''
+        for key in trigger.cells:
+            self.cells[key].remove(trigger)
+        trigger.cells = []
+        for touched in self.inside.values():
+            if trigger in touched:
+                touched.remove(trigger)
+
+    def forget(self, sprite):
+        '''
+        Drops what the index remembers about a sprite, e.g., once it has
+        died or left the game. If it is tracked again later, everything it
+        touches then counts as entered.
+        '''
+        self.inside.pop(sprite, None)
+
+    def touching(self, rect, kind=None):
+        '''
+        Returns the triggers (optionally only of one kind) that overlap a
+        rectangle.
+        '''
+        found = []
+        for key in self._cells(rect):
+            for trigger in self.cells.get(key, ()):
+                if ((kind is None or trigger.kind == kind)
+                        and trigger not in found
+                        and trigger.rect.colliderect(rect)):
+                    found.append(trigger)
+        return found
+
+    def entered(self, sprite):
+        '''
+        Returns the triggers that a sprite touches now but didn't touch the
+        last time this was called for it.
+        '''
+        touching = self.touching(sprite.rect)
+        before = self.inside.get(sprite, ())
+        self.inside[sprite] = touching
+        return [trigger for trigger in touching if trigger not in before]
+
+
+class UpdateScheduler():
+    '''
+    Calls update() once per tick on the sprite groups that have behavior,
+    and on nothing else: the static tiles of a level (and sprites such as
+    item boxes, which only wait to be picked up) are never registered, so
+    they are never walked. Each group gets its own rate; a group added with
+    every=N is updated on every Nth tick, starting with the first.
+    '''
+
+    def __init__(self):
+        '''
+        Creates a scheduler with nothing to update.
+        '''
+        self.entries = []
+        self.tick = 0
+
+    def add(self, group, every=1):
+        '''
+        Updates a group every `every` ticks from now on.
+        '''
+        self.entries.append((group, every))
+
+    def update(self):
+        '''
+        Runs one tick: updates each group that is due.
+        '''
+        tick = self.tick
+        for group, every in self.entries:
+            if tick % every == 0:
+                group.update()
+        self.tick += 1
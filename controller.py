@@ -1,4 +1,5 @@
 
+import pygame
 from dataclasses import dataclass
 
 @dataclass
@@ -26,4 +27,40 @@ class GameController():
         '''
         buttons = [k for k,v in self.__dict__.items() if v]
         buttons = ', '.join(buttons) if buttons else 'None'
-        return f"GameController[{buttons}]"
\ No newline at end of file
+        return f"GameController[{buttons}]"
+
+
+def handle_keyboard_events(event: pygame.event.Event, 
+                           controller: GameController) -> GameController:
+    ''' 
+    Process player keystrokes and returns the current button combination.
+    '''
+
+    # Find which keys have been pressed
+    if event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_a:
+            controller.mleft = True
+        if event.key == pygame.K_d:
+            controller.mright = True
+        if event.key == pygame.K_w:
+            controller.jump = True
+        if event.key == pygame.K_SPACE:
+            controller.shoot = True
+        if event.key == pygame.K_q:
+            controller.throw = True
+
+    # Find which keys have been released
+    if event.type == pygame.KEYUP:
+        if event.key == pygame.K_a:
+            controller.mleft = False
+        if event.key == pygame.K_d:
+            controller.mright = False
+        if event.key == pygame.K_w:
+            controller.jump = False
+        if event.key == pygame.K_SPACE:
+            controller.shoot = False    
+        if event.key == pygame.K_q:
+            controller.throw = False
+    
+    # Return the current state of the controller
+    return controller
@@ -1,16 +1,28 @@
 
 import csv
+import math
+import random
 import pygame
 from pygame.sprite import spritecollide
 from pygame.transform import scale
 from pygame.sprite import Group
 from pygame.image import load
 from pygame.draw import rect
+from time import perf_counter
 from os.path import exists
-from soldier import Player, Enemy
-from weapons import ItemBox, Explosion
+from dataclasses import dataclass
+from components import (TileGrid, TileLayer, Animator, TriggerIndex,
+                        UpdateScheduler)
+from navigation import NavigationGraph
+from sight import LineOfSight
+from sound import PositionalAudio
+from perfstats import FrameStats
+from soldier import Soldier, Player, Enemy
+from weapons import ItemBox, Bullet, Grenade, Explosion
+from widgets import TextBar
 from settings import (SCREEN_HEIGHT, SCREEN_WIDTH, SCROLL_RIGHT, SCROLL_LEFT,
-                      ENVIRONMENT, TILEMAP, EnvironmentSettings, COLOR, Direction, GameModes)
+                      RENDER_SCALE, PIXEL_COLLISIONS, UPDATE_INTERVALS,
+                      TICK_RATE, ENVIRONMENT, TILEMAP, COLOR, Direction, GameModes)
 
 
 class GameEngine():
@@ -22,6 +34,10 @@ class GameEngine():
     internal state variables.
     '''
 
+    # Only these groups move, so only they are interpolated between ticks
+    moving_group_names = ['enemy', 'bullet', 'grenade']
+    static_group_names = ['obstacle', 'water', 'decoration', 'exit']
+
     # Load the background images (order matters)
     bg_img = None
     bg_ypos = None
@@ -65,14 +81,100 @@ class GameEngine():
                 cls.tile_img_list.append(img)
 
 
-    def __init__(self, screen=None, game_mode=GameModes.MENU):
+    @classmethod
+    def asset_loaders(cls):
+        '''
+        Returns (name, function) pairs that load the rest of the assets: the
+        ones the sprites and status bars would otherwise load the first time
+        they are used. Each function skips whatever is already loaded, so
+        they can run ahead of time on another thread (see AssetPreloader).
+        '''
+        return [('item boxes', ItemBox.load_assets),
+                ('bullets', Bullet.load_assets),
+                ('grenades', Grenade.load_assets),
+                ('explosions', Explosion.load_assets),
+                ('player', lambda: Soldier.load_assets('img/player', 'player')),
+                ('enemies', lambda: Soldier.load_assets('img/enemy', 'enemy')),
+                ('fonts', TextBar.load_assets)]
+
+
+    @classmethod
+    def load_all_assets(cls):
+        '''
+        Loads every asset that hasn't been loaded yet.
+        '''
+        for _, loader in cls.asset_loaders():
+            loader()
+
+
+    def __init__(self, screen=None, game_mode=GameModes.MENU, env=ENVIRONMENT):
         '''
-        Creates a new world object.
+        Creates a new world object whose physics and weapons follow env.
         '''
         self.game_mode = game_mode
+        self.env = env
         self.level = 1
         self.screen = screen
+        self.audio = PositionalAudio(enabled=screen is not None)
+        self.stats = FrameStats()
+        self.pixel_collisions = PIXEL_COLLISIONS
+        self.rng = random.Random()  # the enemy AI's, saved with the world
         GameEngine.load_assets(True if screen is None else False)
+        self.set_render_scale(RENDER_SCALE)
+
+
+    def set_render_scale(self, render_scale):
+        '''
+        Sets the size of the surface that the world is drawn on, relative to
+        the window. Below 1, the world is drawn at a lower resolution with
+        scaled images and then stretched onto the window in one pass, which
+        cuts the cost of filling pixels on slow machines. Everything else
+        (physics, camera, layout) stays in window coordinates.
+
+        Images are scaled the first time they are drawn; prescale_images()
+        does all of them ahead of time, e.g. as one of the preloader's jobs.
+        '''
+        self.render_scale = render_scale
+        self.scaled_images = {}
+        self.canvas = None
+        if render_scale != 1.0 and self.screen is not None:
+            size = (math.ceil(SCREEN_WIDTH * render_scale),
+                    math.ceil(SCREEN_HEIGHT * render_scale))
+            self.canvas = pygame.Surface(size).convert()
+
+
+    def prescale_images(self):
+        '''
+        Scales every image the world can draw to the render scale ahead of
+        time, including the mirrored frames of the soldiers.
+        '''
+        GameEngine.load_all_assets()
+        for img in (*GameEngine.bg_img, *GameEngine.tile_img_list,
+                    *ItemBox.images.values(), Bullet.image, Grenade.image,
+                    *Explosion.animations):
+            self.scaled_image(img, False)
+        for soldier_type in ('player', 'enemy'):
+            for sequence in Soldier.animations[soldier_type]:
+                for img in sequence:
+                    self.scaled_image(img, False)
+                    self.scaled_image(img, True)
+
+
+    def scaled_image(self, image, flip):
+        '''
+        Returns an image at the render scale, optionally mirrored. Sizes are
+        rounded up so that neighboring tiles never leave gaps between them.
+        '''
+        key = (image, flip)
+        if key not in self.scaled_images:
+            width, height = image.get_size()
+            size = (math.ceil(width * self.render_scale),
+                    math.ceil(height * self.render_scale))
+            scaled_image = scale(image, size)
+            if flip:
+                scaled_image = pygame.transform.flip(scaled_image, True, False)
+            self.scaled_images[key] = scaled_image
+        return self.scaled_images[key]
 
 
     def reset_world(self):
@@ -85,10 +187,25 @@ class GameEngine():
         self.camera_scroll = 0
         self.bg_scroll = 0
 
-        # Create a bunch of empty sprite groups
+        # The world's clock: every timer (animations, shooting and throwing
+        # delays, grenade fuses) is in ms of simulated time since the level
+        # loaded, so it only moves when a tick runs
+        self.ticks = 0
+        self.now = 0
+        self.animator = Animator(self.env.ANIMATION_DELAY)
+        self.last_positions = {}
+        self.last_camera = None
+
+        # Create a bunch of empty sprite groups; the static tiles go in
+        # compact layers instead
         self.group_names = [ 'obstacle', 'water', 'decoration', 'exit', 'item',
                              'enemy', 'bullet', 'grenade', 'explosion' ]
         self.groups = { group:Group() for group in self.group_names }
+        for group in GameEngine.static_group_names:
+            self.groups[group] = TileLayer(TILEMAP.TILE_SIZE)
+        self.scheduler = UpdateScheduler()
+        for name, every in UPDATE_INTERVALS.items():
+            self.scheduler.add(self.groups[name], every)
 
 
     def load_game_tile(self, tile, idx_x, idx_y):
@@ -108,6 +225,7 @@ class GameEngine():
         if tile <= TILEMAP.DIRT_TILE_LAST:
             obstacle_tile = GameTile(img, rect.x, rect.y)
             self.groups['obstacle'].add(obstacle_tile)
+            self.obstacles.add(obstacle_tile)
         elif tile <= TILEMAP.WATER_TILE_LAST:
             water_tile = GameTile(img, rect.x, rect.y)
             self.groups['water'].add(water_tile)
@@ -117,13 +235,15 @@ class GameEngine():
         
         # Only one ID per tile, so order doesn't matter so much
         elif tile == TILEMAP.PLAYER_TILE_ID:
-            self.player = Player(rect.x, rect.y)
+            self.player = Player(rect.x, rect.y, env=self.env)
+            self.animator.add(self.player)
             self.health_bar = HealthBar(10, 10, self.player.max_health)
             self.ammo_bar = TextBar(10, 35, COLOR.WHITE)
             self.grenade_bar = TextBar(10, 60, COLOR.WHITE)
         elif tile == TILEMAP.ENEMY_TILE_ID:
-            enemy = Enemy(rect.x, rect.y)
+            enemy = Enemy(rect.x, rect.y, env=self.env)
             self.groups['enemy'].add(enemy)
+            self.animator.add(enemy)
         elif tile == TILEMAP.AMMO_TILE_ID:
             item = ItemBox(rect.x, rect.y, 'ammo')
             self.groups['item'].add(item)
@@ -157,6 +277,9 @@ class GameEngine():
         '''
         Loads the starting world state for the given level.
         '''
+        # Everything is loaded before the first update (usually by the
+        # preloader already), so update() and draw() never touch the disk
+        GameEngine.load_all_assets()
 
         # Read the level data from a CSV file
         self.reset_world()
@@ -170,10 +293,50 @@ class GameEngine():
 
         # Populate the world by loading the appropriate game tile
         self.world_width = TILEMAP.TILE_SIZE * len(self.world_data[0])
+        self.obstacles = TileGrid(len(self.world_data),
+                                  len(self.world_data[0]), TILEMAP.TILE_SIZE)
         for idx_y, row_of_tiles in enumerate(self.world_data):
             for idx_x, tile in enumerate(row_of_tiles):
                 if tile >= 0: # -1 is an empty space
                     self.load_game_tile(tile, idx_x, idx_y)
+        self.build_triggers()
+        self.navigation = NavigationGraph(self.world_data, env=self.env)
+        self.sight = LineOfSight(self.world_data)
+
+
+    def build_triggers(self):
+        '''
+        Registers the water, exit, and item box regions in a TriggerIndex.
+        Neighboring water tiles in a row are merged into a single span.
+        '''
+        self.triggers = TriggerIndex(TILEMAP.TILE_SIZE)
+        self.trigger_events = []
+        span = None
+        for tile in self.groups['water']:
+            if (span is not None and span.top == tile.rect.top
+                    and span.right == tile.rect.left):
+                span.width += tile.rect.width
+            else:
+                if span is not None:
+                    self.triggers.add('water', span)
+                span = tile.rect.copy()
+        if span is not None:
+            self.triggers.add('water', span)
+        for tile in self.groups['exit']:
+            self.triggers.add('exit', tile.rect)
+        self.item_triggers = []
+        self.index_item_boxes()
+
+
+    def index_item_boxes(self):
+        '''
+        Registers a trigger for every item box, replacing any old ones. Item
+        boxes are the only triggers that change during a level.
+        '''
+        for trigger in self.item_triggers:
+            self.triggers.remove(trigger)
+        self.item_triggers = [self.triggers.add('item', item.rect, item)
+                              for item in self.groups['item']]
     
 
     def player_actions(self, controller):
@@ -184,51 +347,124 @@ class GameEngine():
 
         # Ideally, this code would be within the Player class, but only the
         # game engine knows about the bullet and grenade groups.
-        self.player.move(controller.mleft, controller.mright, controller.jump)
+        if self.player.move(controller.mleft, controller.mright,
+                            controller.jump):
+            self.play_sound(Soldier.jump_fx, self.player.rect.centerx)
         
         # Check if the player shoots
         if controller.shoot:
-            bullet = self.player.shoot()
+            bullet = self.player.shoot(self.now)
             if bullet:
                 self.groups['bullet'].add(bullet)
+                self.play_sound(Bullet.sound_fx, bullet.rect.centerx)
 
         # Check for bullet collisions with obstacles
+        self.stop_bullets_at_obstacles()
+
+        if controller.throw:
+            grenade = self.player.throw(self.now)
+            if grenade:
+                self.groups['grenade'].add(grenade)
+
+
+    def stop_bullets_at_obstacles(self):
+        '''
+        Destroys the bullets that ran into an obstacle.
+        '''
         for bullet in self.groups['bullet']:
-            for tile in self.groups['obstacle']:
+            for tile in self.obstacles.query_rect(bullet.rect):
                 if bullet.rect.colliderect(tile.rect):
                     bullet.kill()  # Destroy the bullet on collision with an obstacle
                     break  # Exit the loop once the bullet is killed
 
-        if controller.throw:
-            grenade = self.player.throw()
-            if grenade:
-                self.groups['grenade'].add(grenade)
+
+    def remove_stray_bullets(self):
+        '''
+        Destroys the bullets that flew off either end of the level.
+        '''
+        for bullet in self.groups['bullet']:
+            if bullet.rect.right < 0 or bullet.rect.left > self.world_width:
+                bullet.kill()
 
 
     def enemy_actions(self):
         '''
         Handle AI behavior for all enemies.
         '''
+        # Enemies whose vision reaches the player still need a clear line of
+        # sight; those are all checked together
+        watchers = [enemy for enemy in self.groups['enemy'] if enemy.alive
+                    and enemy.vision.colliderect(self.player.rect)]
+        seeing = self.sight.can_see(watchers, self.player.rect)
+
         # We keep dead enemies on the screen; only let live ones to do things
+        self.navigation.update()
         for enemy in self.groups['enemy']:
             if enemy.alive:
-                if enemy.vision.colliderect(self.player.rect):
-                    bullet = enemy.shoot()
+                if enemy in seeing:
+                    bullet = enemy.shoot(self.now)
                     if bullet:
                         self.groups['bullet'].add(bullet)
-                enemy.ai_move(self.world_data, TILEMAP.TILE_SIZE)
+                        self.play_sound(Bullet.sound_fx, bullet.rect.centerx)
+                self.move_enemy(enemy, self.player)
                 if enemy.health <= 0:
                     enemy.death()
 
 
+    def move_enemy(self, enemy, target):
+        '''
+        Chases the target if it's close by and alive, otherwise patrols.
+        '''
+        steering = None
+        if target.alive:
+            steering = self.navigation.steer(enemy, target)
+        if steering is None:
+            enemy.ai_move(self.world_data, TILEMAP.TILE_SIZE, self.rng)
+        elif enemy.chase(*steering):
+            self.play_sound(Soldier.jump_fx, enemy.rect.centerx)
+
+
+    def play_sound(self, sound, world_x):
+        '''
+        Plays a sound effect from a position in the world, as heard from the
+        current camera position.
+        '''
+        if self.audio.play(sound, world_x, self.camera_scroll,
+                           self.animator.now):
+            self.stats.sounds += 1
+
+
+    def enter_triggers(self):
+        '''
+        Adds the triggers that the player just entered to trigger_events.
+        Dead players are no longer tracked.
+        '''
+        if self.player.alive:
+            self.trigger_events += [(self.player, trigger) for trigger
+                                    in self.triggers.entered(self.player)]
+        else:
+            self.triggers.forget(self.player)
+
+
+    def entered(self, kind):
+        '''
+        Returns the triggers of a kind that the player entered this tick.
+        '''
+        return [trigger for sprite, trigger in self.trigger_events
+                if sprite is self.player and trigger.kind == kind]
+
+
     def collect_item_boxes(self):
         ''' 
         Check if player collected any item boxes and add to inventory.
         '''
-        collect_sound = pygame.mixer.Sound('audio/collect.mp3')
-
-        for item in spritecollide(self.player, self.groups['item'], True):
-            collect_sound.play()
+        for trigger in self.entered('item'):
+            item = trigger.sprite
+            if not item.alive():
+                continue  # someone else got there first
+            self.triggers.remove(trigger)
+            item.kill()
+            self.play_sound(ItemBox.sound_fx, item.rect.centerx)
             if item.box_type == 'ammo':
                 amount = self.player.ammo + item.quantity
                 self.player.ammo += min(amount, self.player.max_ammo)
@@ -239,31 +475,51 @@ class GameEngine():
                 amount = self.player.health + item.quantity
                 self.player.health = min(amount, self.player.max_health)
             elif item.box_type == 'jump_buff':
-                EnvironmentSettings.SOLDIER_JUMP_STRENGTH = EnvironmentSettings.SOLDIER_JUMP_STRENGTH + 2
+                self.player.jump_boost += 2
     
 
     def handle_bullet_damage(self):
         '''
         Check for bullet hit damage and injure Soldier accordingly.
         '''
-        for bullet in spritecollide(self.player, self.groups['bullet'], True):
+        for bullet in self.bullets_hitting(self.player):
             self.player.health -= bullet.damage
+            bullet.kill()
         for enemy in self.groups['enemy']:
-            for bullet in spritecollide(enemy, self.groups['bullet'], False):
+            for bullet in self.bullets_hitting(enemy):
                 if enemy.health >= 0:
                     enemy.health -= bullet.damage
                     bullet.kill()
 
 
+    def bullets_hitting(self, soldier):
+        '''
+        Returns the bullets that hit a Soldier. Rects find the candidates;
+        with pixel_collisions on, a candidate only counts as a hit if its
+        mask overlaps the mask of the soldier's current frame.
+        '''
+        self.stats.rect_tests += len(self.groups['bullet'])
+        hits = spritecollide(soldier, self.groups['bullet'], False)
+        if self.pixel_collisions and hits:
+            mask = soldier.mask()
+            x, y = soldier.rect.topleft
+            hits = [bullet for bullet in hits if mask.overlap(
+                Bullet.mask, (bullet.rect.x - x, bullet.rect.y - y))]
+        return hits
+
+
     def make_grenades_explode(self):
         '''
         Check for exploding grenades and initiate animation.
         '''
         # Animate with an explosion and calculate damage against all Soldiers
         for grenade in self.groups['grenade']:
-            if grenade.do_explosion:
-                explosion = Explosion(grenade.rect.x, grenade.rect.y)
+            if grenade.exploding(self.now):
+                explosion = Explosion(grenade.rect.x, grenade.rect.y,
+                                      self.now)
                 self.groups['explosion'].add(explosion)
+                self.animator.add(explosion)
+                self.play_sound(Explosion.sound_fx, grenade.rect.centerx)
                 self.player.health -= grenade.damage_at(self.player.rect)
                 for enemy in self.groups['enemy']:
                     enemy.health -= grenade.damage_at(enemy.rect)
@@ -276,7 +532,7 @@ class GameEngine():
         '''
         if (self.player.health <= 0 
                 or self.player.rect.top > SCREEN_HEIGHT
-                or spritecollide(self.player, self.groups['water'], False)):
+                or self.entered('water')):
             self.player.death()
 
 
@@ -284,7 +540,7 @@ class GameEngine():
         '''
         Determines if the player has finished the current level.
         '''
-        if spritecollide(self.player, self.groups['exit'], False):
+        if self.entered('exit'):
             self.level_complete = True
 
 
@@ -310,15 +566,24 @@ class GameEngine():
         and the effect of gravity.
         '''
         # Calculate vertical movement
-        sprite.vel_y += ENVIRONMENT.GRAVITY
+        sprite.vel_y += self.env.GRAVITY
         sprite.vel_y = min(20, sprite.vel_y)
         sprite.dy = int(sprite.vel_y)
 
         # Calculate lateral movement
         sprite.dx = int(sprite.vel_x * sprite.direction.value)
 
-        # Detect collisions with wall (x) and ground (y) obstacles
-        for tile in self.groups['obstacle']:
+        # Detect collisions with wall (x) and ground (y) obstacles. Only the
+        # tiles around the sprite's path can be hit; the extra tile of margin
+        # covers the corrections for a sprite that is already inside a wall.
+        margin = TILEMAP.TILE_SIZE
+        nearby = self.obstacles.query(
+            sprite.rect.left + min(0, sprite.dx) - margin,
+            sprite.rect.top + min(0, sprite.dy) - margin,
+            sprite.rect.right + max(0, sprite.dx) + margin,
+            sprite.rect.bottom + max(0, sprite.dy) + margin)
+        self.stats.rect_tests += 2 * len(nearby)
+        for tile in nearby:
             predicted_x = pygame.Rect(sprite.rect.x + sprite.dx, sprite.rect.y,
                                       sprite.rect.width, sprite.rect.height)
             if tile.rect.colliderect(predicted_x):
@@ -349,6 +614,18 @@ class GameEngine():
         sprite.rect.y += sprite.dy
 
 
+    def remember_positions(self):
+        '''
+        Records where the moving sprites and the camera are before a tick,
+        so that frames drawn between ticks can be interpolated.
+        '''
+        self.last_positions = {sprite: sprite.rect.topleft
+                               for group in GameEngine.moving_group_names
+                               for sprite in self.groups[group]}
+        self.last_positions[self.player] = self.player.rect.topleft
+        self.last_camera = (self.camera_scroll, self.bg_scroll)
+
+
     def update(self, controller):
         '''
         Updates the world environment based on any buttons pressed on the
@@ -356,6 +633,8 @@ class GameEngine():
         and sprite collisions. Instead of returning a value, this function
         updates internal variables that represent the state of the world.
         '''
+        start = perf_counter()
+        self.advance_clock()
 
         # Calculate player movements
         if self.player.alive:
@@ -371,25 +650,84 @@ class GameEngine():
             self.apply_physics(grenade)
 
         # Special collision-based updates
+        self.trigger_events = []
+        self.enter_triggers()
         self.collect_item_boxes()
         self.handle_bullet_damage()
         self.make_grenades_explode()
 
-        # Standard updates to all sprite groups
+        # Standard updates to the sprites with behavior
         self.player.update()
-        for group in self.groups.values():
-            group.update()
+        self.scheduler.update()
+        self.remove_stray_bullets()
+        self.animator.update()
 
         # Check for end-states
         self.check_for_player_death()
         self.check_if_level_exit()
+        self.stats.ticks += 1
+        self.stats.update_ms += (perf_counter() - start) * 1000
+
+
+    def advance_clock(self):
+        '''
+        Starts a tick: sets the world time that everything in it sees. The
+        clock follows the tick count, so timers run the same no matter how
+        many ticks a frame catches up on, or how fast headless steps run.
+        '''
+        self.now = self.ticks * 1000 // TICK_RATE
+        self.ticks += 1
+        self.animator.now = self.now
+
+
+    def restart_animations(self):
+        '''
+        Animates the player, enemies, and explosions from their current
+        frames, e.g., after their state has been restored from elsewhere.
+        '''
+        self.animator.clear()
+        for sprite in (self.player, *self.groups['enemy'],
+                       *self.groups['explosion']):
+            self.animator.add(sprite)
+
+
+    def draw(self, alpha=1.0):
+        '''
+        Blits all of the sprites in the entire world onto the screen. An alpha
+        below 1 draws the world that fraction of the way from the positions
+        saved by remember_positions() to the current ones.
+        '''
+        if self.canvas is not None or (alpha < 1.0
+                                       and self.last_camera is not None):
+            self.draw_snapshot(self.snapshot(alpha))
+            return
+        start = perf_counter()
+        self.draw_background(self.bg_scroll)
+
+        # Draw the world one tile at a time; only the static tiles in the
+        # columns on the screen are even looked at
+        left = -self.camera_scroll
+        for group in self.group_names:
+            sprites = self.groups[group]
+            if group in GameEngine.static_group_names:
+                sprites = sprites.visible(left, left + SCREEN_WIDTH)
+            for sprite in sprites:
+                sprite.draw(self.screen, self.camera_scroll)
+            self.stats.blits += len(sprites)
+        self.player.draw(self.screen, self.camera_scroll)
+        self.stats.blits += 1
+
+        # Draw the status bars
+        self.draw_status_bars(self.health_bar, self.player.health,
+                              self.ammo_bar, self.player.ammo,
+                              self.grenade_bar, self.player.grenades)
+        self.stats.draw_ms += (perf_counter() - start) * 1000
 
 
-    def draw(self):
+    def draw_background(self, bg_scroll):
         '''
-        Blits all of the sprites in the entire world onto the screen.
+        Draws the background graphics: sky, mountains, trees, etc.
         '''
-        # Draw the background graphics: sky, mountains, trees, etc.
         # The y-coordinates are offset so that the scene appears correctly
         # (e.g., clouds on top, then mountains, trees on bottom).
         # But the x-coordinates are staggered so that we get a semi-3D effect
@@ -401,30 +739,138 @@ class GameEngine():
                 bg_img = GameEngine.bg_img[idx]
                 bg_y = int(GameEngine.bg_ypos[idx])
                 bg_x = int((copy_num * GameEngine.bg_width)
-                           - self.bg_scroll * (0.5 + idx * 0.1))
-                self.screen.blit(bg_img, (bg_x, bg_y))
+                           - bg_scroll * (0.5 + idx * 0.1))
+                self.blit_world(bg_img, bg_x, bg_y)
 
-        # Draw the world one tile at a time
-        for group in self.group_names:
-            for sprite in self.groups[group]:
-                sprite.draw(self.screen, self.camera_scroll)
-        self.player.draw(self.screen, self.camera_scroll)
 
-        # Draw the status bars
-        self.health_bar.draw(self.screen, self.player.health)
-        self.grenade_bar.draw(self.screen, f'GRENADES: {self.player.grenades}')
-        self.ammo_bar.draw(self.screen, f'ROUNDS: {self.player.ammo}')
+    def blit_world(self, image, x, y, flip=False):
+        '''
+        Blits an image at a position in window coordinates, either onto the
+        window itself or onto the internal canvas at the render scale.
+        '''
+        self.stats.blits += 1
+        if self.canvas is None:
+            if flip:
+                image = pygame.transform.flip(image, True, False)
+            self.screen.blit(image, (x, y))
+        else:
+            self.canvas.blit(self.scaled_image(image, flip),
+                             (math.floor(x * self.render_scale),
+                              math.floor(y * self.render_scale)))
+
+
+    def draw_status_bars(self, health_bar, health, ammo_bar, ammo,
+                         grenade_bar, grenades):
+        '''
+        Draws the player's health, ammo, and grenade counts.
+        '''
+        health_bar.draw(self.screen, health)
+        self.stats.blits += 2
+        grenade_bar.draw(self.screen, f'GRENADES: {grenades}')
+        ammo_bar.draw(self.screen, f'ROUNDS: {ammo}')
+
+
+    def snapshot(self, alpha=1.0):
+        '''
+        Captures everything that draw() needs as an immutable FrameSnapshot,
+        so that a frame can be drawn on another thread while the world keeps
+        changing. Sprite images are shared and never modified, so we only
+        keep references to them. Sprites that are off the screen are skipped.
+        With an alpha below 1, moving sprites and the camera are interpolated
+        like they are in draw().
+        '''
+        camera_x = self.camera_scroll
+        bg_scroll = self.bg_scroll
+        last_positions = {}
+        if alpha < 1.0 and self.last_camera is not None:
+            last_camera_x, last_bg_scroll = self.last_camera
+            camera_x = round(last_camera_x + (camera_x - last_camera_x) * alpha)
+            bg_scroll = round(last_bg_scroll + (bg_scroll - last_bg_scroll) * alpha)
+            last_positions = self.last_positions
+
+        def position(sprite):
+            # Sprites that appeared during the last tick aren't interpolated
+            x, y = sprite.rect.topleft
+            if sprite in last_positions:
+                last_x, last_y = last_positions[sprite]
+                x = round(last_x + (x - last_x) * alpha)
+                y = round(last_y + (y - last_y) * alpha)
+            return x + camera_x, y
+
+        sprites = []
+        for group in self.group_names:
+            moving = group in GameEngine.moving_group_names
+            group_sprites = self.groups[group]
+            if group in GameEngine.static_group_names:
+                group_sprites = group_sprites.visible(-camera_x,
+                                                      SCREEN_WIDTH - camera_x)
+            for sprite in group_sprites:
+                if moving:
+                    screen_x, screen_y = position(sprite)
+                else:
+                    screen_x, screen_y = sprite.rect.x + camera_x, sprite.rect.y
+                if screen_x < SCREEN_WIDTH and screen_x + sprite.rect.width > 0:
+                    flip = (isinstance(sprite, Soldier)
+                            and sprite.direction == Direction.LEFT)
+                    sprites.append((sprite.image, screen_x, screen_y, flip))
+        player = self.player
+        flip = player.direction == Direction.LEFT
+        sprites.append((player.image, *position(player), flip))
+        return FrameSnapshot(bg_scroll, tuple(sprites),
+                             self.health_bar, player.health,
+                             self.ammo_bar, player.ammo,
+                             self.grenade_bar, player.grenades)
+
+
+    def draw_snapshot(self, snapshot):
+        '''
+        Blits a FrameSnapshot onto the screen. The result looks the same as
+        calling draw() at the moment the snapshot was taken.
+        '''
+        start = perf_counter()
+        self.draw_background(snapshot.bg_scroll)
+        for image, x, y, flip in snapshot.sprites:
+            self.blit_world(image, x, y, flip)
+
+        # Stretch the canvas over the window in a single pass; the status
+        # bars are small enough to draw at full resolution
+        if self.canvas is not None:
+            scale(self.canvas, self.screen.get_size(), self.screen)
+            self.stats.blits += 1
+        self.draw_status_bars(snapshot.health_bar, snapshot.health,
+                              snapshot.ammo_bar, snapshot.ammo,
+                              snapshot.grenade_bar, snapshot.grenades)
+        self.stats.draw_ms += (perf_counter() - start) * 1000
+
+
+@dataclass(frozen=True)
+class FrameSnapshot():
+    '''
+    An immutable copy of the drawable world state for a single frame. Each
+    sprite is an (image, screen_x, screen_y, flip_x) tuple in drawing order.
+    '''
+    bg_scroll: int
+    sprites: tuple
+    health_bar: object
+    health: int
+    ammo_bar: object
+    ammo: int
+    grenade_bar: object
+    grenades: int
 
 
-class GameTile(pygame.sprite.Sprite):
+class GameTile():
     '''
-    An object representing one of the many game tiles.
+    An object representing one of the many game tiles. Tiles never move or
+    update, so they are plain records with slots instead of sprites, which
+    keeps the thousands of them in a level small.
     '''
+    __slots__ = ('image', 'rect')
+
     def __init__(self, img, x, y):
         '''
         Initializes the look and position of a game tile.
         '''
-        super().__init__()
         self.image = img
         self.rect = self.image.get_rect()
         self.rect.topleft = (x, y)
@@ -436,37 +882,6 @@ class GameTile(pygame.sprite.Sprite):
         screen.blit(self.image, (self.rect.x + screen_scroll, self.rect.y))
 
 
-class TextBar():
-    '''
-    Text to visualize the player's stats.
-    '''
-
-    font = None
-
-    @classmethod
-    def load_assets(cls):
-        '''
-        Preload font renderer into shared memory for reuse.
-        '''
-        if cls.font is None:
-            cls.font = pygame.font.SysFont('Futura', 30)
-
-    def __init__(self, x, y, color):
-        '''
-        Initializes a status bar with the starting value.
-        '''
-        TextBar.load_assets()
-        self.x, self.y = x, y
-        self.color = color
-
-    def draw(self, screen, text):
-        '''
-        Draws a particular statistics to the given screen surface.
-        '''
-        img = TextBar.font.render(text, True, self.color)
-        screen.blit(img, (self.x, self.y))
-
-
 class HealthBar():
     '''
     Graphic to visualize the player's health as a green/red rectangle.
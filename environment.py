@@ -0,0 +1,217 @@
+
+import numpy as np
+from controller import GameController
+from engine import GameEngine
+from observation import ObservationRenderer
+from settings import GameModes, TILEMAP
+
+
+class EntityCode():
+    '''
+    Values written into the entity layer of the observation grid.
+    '''
+    EMPTY = 0
+    PLAYER = 1
+    ENEMY = 2
+    BULLET = 3
+    GRENADE = 4
+    ITEM = 5
+
+
+class GameEnvironment():
+    '''
+    A gym-style wrapper around GameEngine for learning agents. Call reset()
+    to start an episode and step(action) to advance one frame. The engine
+    runs headless, so a display mode must already be set (any size will do)
+    before the first reset.
+
+    Observations are written into arrays that are allocated once per level
+    and returned by reference on every step, so they are only valid until
+    the next call to step() or reset(). Copy them if you need to keep them.
+
+        grid[0]  static tile IDs from the level CSV file (terrain and exits)
+        grid[1]  EntityCode of the moving object in each tile, if any
+        player   x, y, vel_x, vel_y, health, ammo, grenades, alive
+        pixels   low resolution [x, y, rgb] image, only if pixel_size is set
+    '''
+
+    # Each discrete action is a combination of controller buttons
+    ACTIONS = [
+        (),
+        ('mleft',),
+        ('mright',),
+        ('jump',),
+        ('mleft', 'jump'),
+        ('mright', 'jump'),
+        ('shoot',),
+        ('mleft', 'shoot'),
+        ('mright', 'shoot'),
+        ('throw',),
+    ]
+
+    # Reward weights
+    PROGRESS_REWARD = 0.1       # per tile moved towards the exit
+    KILL_REWARD = 1.0
+    DAMAGE_PENALTY = 0.01       # per hit point lost
+    LEVEL_COMPLETE_REWARD = 10.0
+    DEATH_PENALTY = 5.0
+
+    def __init__(self, level=1, max_steps=5000, pixel_size=None):
+        '''
+        Creates the environment; the level isn't loaded until reset(). Pass
+        a (width, height) pixel_size to add rendered pixels to observations.
+        '''
+        self.start_level = level
+        self.max_steps = max_steps
+        self.engine = GameEngine()
+        self.controller = GameController()
+        self.grid = None
+        self.player_obs = np.zeros(8, dtype=np.float32)
+        self.observation = {'grid': None, 'player': self.player_obs}
+        self.renderer = None
+        if pixel_size is not None:
+            self.renderer = ObservationRenderer(self.engine, pixel_size)
+
+    def reset(self, seed=None):
+        '''
+        Starts a new episode. Returns the first observation and an info dict.
+        '''
+        # The enemy AI draws from the engine's own random generator
+        if seed is not None:
+            self.engine.rng.seed(seed)
+        self.engine.level = self.start_level
+        self.engine.game_mode = GameModes.INTERACTIVE
+        self.engine.load_current_level()
+        self._load_grid()
+
+        self.steps = 0
+        self.best_x = self.engine.player.rect.centerx
+        self.last_health = self.engine.player.health
+        self.enemies_alive = self._count_enemies()
+        self.controller.reset()
+        self._observe()
+        return self.observation, self._info()
+
+    def step(self, action):
+        '''
+        Applies an action for one frame and returns a tuple containing
+        (observation, reward, terminated, truncated, info). The action is
+        either an index into ACTIONS or a GameController.
+        '''
+        engine = self.engine
+        controller = self._to_controller(action)
+        engine.update(controller)
+        self.steps += 1
+
+        # Reward forward progress (only new ground counts), kills and damage
+        player = engine.player
+        reward = 0.0
+        if player.rect.centerx > self.best_x:
+            reward += (GameEnvironment.PROGRESS_REWARD
+                       * (player.rect.centerx - self.best_x)
+                       / TILEMAP.TILE_SIZE)
+            self.best_x = player.rect.centerx
+        enemies_alive = self._count_enemies()
+        reward += GameEnvironment.KILL_REWARD * (self.enemies_alive
+                                                 - enemies_alive)
+        self.enemies_alive = enemies_alive
+        health_lost = max(0, self.last_health - player.health)
+        reward -= GameEnvironment.DAMAGE_PENALTY * health_lost
+        self.last_health = player.health
+
+        terminated = False
+        if engine.level_complete:
+            reward += GameEnvironment.LEVEL_COMPLETE_REWARD
+            terminated = True
+        elif not player.alive:
+            reward -= GameEnvironment.DEATH_PENALTY
+            terminated = True
+        truncated = not terminated and self.steps >= self.max_steps
+
+        self._observe()
+        return self.observation, reward, terminated, truncated, self._info()
+
+    def _to_controller(self, action):
+        '''
+        Translates an action into the environment's reusable controller.
+        '''
+        if isinstance(action, GameController):
+            return action
+        controller = self.controller
+        controller.reset()
+        for button in GameEnvironment.ACTIONS[int(action)]:
+            setattr(controller, button, True)
+        return controller
+
+    def _load_grid(self):
+        '''
+        Copies the static tiles into the observation grid. This happens once
+        per level; the arrays are only reallocated when the level size changes.
+        '''
+        world_data = self.engine.world_data
+        shape = (2, len(world_data), len(world_data[0]))
+        if self.grid is None or self.grid.shape != shape:
+            self.grid = np.empty(shape, dtype=np.int8)
+            self.observation['grid'] = self.grid
+        tiles = self.grid[0]
+        tiles[:] = world_data
+
+        # Soldiers and item boxes move (or vanish), so they belong in the
+        # entity layer instead of the static one
+        spawns = ((tiles >= TILEMAP.PLAYER_TILE_ID)
+                  & (tiles != TILEMAP.LEVEL_EXIT_TILE_ID))
+        tiles[spawns] = TILEMAP.EMPTY_TILE
+
+    def _observe(self):
+        '''
+        Refreshes the entity layer and player stats in place.
+        '''
+        engine = self.engine
+        layer = self.grid[1]
+        layer.fill(EntityCode.EMPTY)
+        rows, cols = layer.shape
+        tile_size = TILEMAP.TILE_SIZE
+
+        def stamp(sprite, code):
+            idx_x = sprite.rect.centerx // tile_size
+            idx_y = sprite.rect.centery // tile_size
+            if 0 <= idx_x < cols and 0 <= idx_y < rows:
+                layer[idx_y, idx_x] = code
+
+        for item in engine.groups['item']:
+            stamp(item, EntityCode.ITEM)
+        for enemy in engine.groups['enemy']:
+            if enemy.alive:
+                stamp(enemy, EntityCode.ENEMY)
+        for bullet in engine.groups['bullet']:
+            stamp(bullet, EntityCode.BULLET)
+        for grenade in engine.groups['grenade']:
+            stamp(grenade, EntityCode.GRENADE)
+        player = engine.player
+        stamp(player, EntityCode.PLAYER)
+
+        obs = self.player_obs
+        obs[0] = player.rect.centerx
+        obs[1] = player.rect.centery
+        obs[2] = player.vel_x * player.direction.value
+        obs[3] = player.vel_y
+        obs[4] = player.health
+        obs[5] = player.ammo
+        obs[6] = player.grenades
+        obs[7] = player.alive
+
+        if self.renderer is not None:
+            self.observation['pixels'] = self.renderer.render()
+
+    def _count_enemies(self):
+        '''
+        Returns the number of enemies that are still alive.
+        '''
+        return sum(1 for enemy in self.engine.groups['enemy'] if enemy.alive)
+
+    def _info(self):
+        '''
+        Returns extra diagnostic information about the episode.
+        '''
+        return {'steps': self.steps, 'level': self.engine.level,
+                'enemies_alive': self.enemies_alive}
@@ -0,0 +1,134 @@
+
+import time
+import dataclasses
+import pygame
+from controller import handle_keyboard_events
+
+
+class LatencyProbe():
+    '''
+    Measures how long it takes a key press to show up on the screen. Each
+    KEYDOWN that presses a button of the GameController (keys that don't
+    change it, like a button that is already down, are left out) is
+    timestamped when the event queue is read,
+    tagged with the first frame whose simulation ran with the key applied
+    to the GameController (the 'frame' stage ends once that frame has been
+    simulated and drawn), and finished when that frame is flipped onto the
+    display (the 'display' stage). The time the event spent in the OS queue
+    before being read is not included, since pygame events don't carry
+    their own timestamps.
+
+    The main loop calls pressed(), ticked(), and flipped() once per frame,
+    in that order. With a pipelined renderer, frames are shown one frame
+    after they are simulated, which is what pipeline_depth is for.
+    '''
+
+    STAGES = ('frame', 'display')
+
+    def __init__(self, pipeline_depth=0, bucket_ms=4, buckets=16):
+        '''
+        Creates an empty probe with histograms of the given bucket size;
+        the last bucket also holds everything slower.
+        '''
+        self.pipeline_depth = pipeline_depth
+        self.bucket_ms = bucket_ms
+        self.frame = 0
+        self.waiting = []
+        self.in_flight = []
+        self.samples = {stage: [] for stage in LatencyProbe.STAGES}
+        self.histograms = {stage: [0] * buckets
+                           for stage in LatencyProbe.STAGES}
+
+    @staticmethod
+    def now():
+        '''
+        Returns the current time in (fractional) milliseconds.
+        '''
+        return time.perf_counter() * 1000
+
+    def record(self, stage, latency):
+        '''
+        Adds one measurement (in ms) to a stage's samples and histogram.
+        '''
+        histogram = self.histograms[stage]
+        bucket = min(int(latency // self.bucket_ms), len(histogram) - 1)
+        histogram[bucket] += 1
+        self.samples[stage].append(latency)
+
+    def pressed(self, events, controller):
+        '''
+        Timestamps the key presses in a batch of events that change the
+        controller's buttons; call it right after reading the event queue,
+        before the events are applied to the controller. The controller
+        itself is left alone, the events are played on a copy.
+        '''
+        now = LatencyProbe.now()
+        state = dataclasses.replace(controller)
+        for event in events:
+            before = dataclasses.replace(state)
+            state = handle_keyboard_events(event, state)
+            if event.type == pygame.KEYDOWN and state != before:
+                self.waiting.append(now)
+
+    def ticked(self, ticks):
+        '''
+        Tags the waiting key presses with this frame if its simulation ran
+        at least one tick; otherwise they wait for the next frame.
+        '''
+        if ticks == 0 or not self.waiting:
+            return
+        now = LatencyProbe.now()
+        for pressed in self.waiting:
+            self.record('frame', now - pressed)
+            self.in_flight.append((self.frame, pressed))
+        self.waiting = []
+
+    def flipped(self):
+        '''
+        Finishes the key presses whose frame is now on the display; call it
+        right after flipping.
+        '''
+        now = LatencyProbe.now()
+        shown = self.frame - self.pipeline_depth
+        still_flying = []
+        for frame, pressed in self.in_flight:
+            if frame <= shown:
+                self.record('display', now - pressed)
+            else:
+                still_flying.append((frame, pressed))
+        self.in_flight = still_flying
+        self.frame += 1
+
+    def summary(self, stage):
+        '''
+        Returns the count, mean, median, 95th percentile, and maximum of a
+        stage's latencies (in ms) as a dictionary.
+        '''
+        samples = sorted(self.samples[stage])
+        if not samples:
+            return {'count': 0}
+        return {'count': len(samples),
+                'mean': sum(samples) / len(samples),
+                'p50': samples[len(samples) // 2],
+                'p95': samples[min(len(samples) - 1, len(samples) * 95 // 100)],
+                'max': samples[-1]}
+
+    def report(self, width=40):
+        '''
+        Returns the histograms and summaries of both stages as text.
+        '''
+        lines = []
+        for stage in LatencyProbe.STAGES:
+            stats = self.summary(stage)
+            lines.append(f'key press -> {stage}: ' + ', '.join(
+                f'{name} {value:.1f}' if isinstance(value, float)
+                else f'{name} {value}' for name, value in stats.items()))
+            histogram = self.histograms[stage]
+            most = max(histogram) or 1
+            for bucket, count in enumerate(histogram):
+                low = bucket * self.bucket_ms
+                label = (f'{low:>4}+ ms' if bucket == len(histogram) - 1
+                         else f'{low:>4}-{low + self.bucket_ms} ms')
+                bar = '#' * (count * width // most)
+                lines.append(f'  {label:>11} {count:>5} {bar}')
+        return '\n'.join(lines)
@@ -0,0 +1,351 @@
+
+import csv
+import random
+import argparse
+from dataclasses import dataclass
+from settings import ENVIRONMENT, TILEMAP
+
+
+@dataclass
+class LevelOptions():
+    '''
+    Knobs for the procedural level generator. Densities are probabilities
+    per column, so doubling the width roughly doubles the entity counts.
+    '''
+
+    width: int = TILEMAP.COLS
+    enemy_density: float = 0.05
+    item_density: float = 0.03
+    decoration_density: float = 0.05
+    water_gap_chance: float = 0.15
+    max_gap_width: int = 2
+    platform_complexity: float = 0.3
+    seed: int = 0
+
+
+def jump_reach(speed=5, env=ENVIRONMENT):
+    '''
+    Simulates one jump with the same integer stepping as the physics engine
+    and returns the (horizontal, vertical) distances in pixels that a
+    Soldier moving at the given speed can cover before landing again, under
+    the jump strength and gravity of env.
+    '''
+    vel_y = env.SOLDIER_JUMP_STRENGTH
+    height, peak, frames = 0, 0, 0
+    while frames == 0 or height < 0:
+        vel_y = min(20, vel_y + env.GRAVITY)
+        height += int(vel_y)
+        peak = min(peak, height)
+        frames += 1
+    return frames * speed, -peak
+
+
+def max_jump_gap(speed=5, env=ENVIRONMENT):
+    '''
+    Widest gap (in tiles) that a Soldier can reliably clear. We leave one
+    tile of slack so that the jump doesn't have to start on the very edge.
+    '''
+    reach_x, _ = jump_reach(speed, env)
+    return max(1, reach_x // TILEMAP.TILE_SIZE - 1)
+
+
+def max_jump_rise(speed=5, env=ENVIRONMENT):
+    '''
+    Tallest ledge (in tiles) that a Soldier can jump onto.
+    '''
+    _, reach_y = jump_reach(speed, env)
+    return max(1, reach_y // TILEMAP.TILE_SIZE)
+
+
+class LevelGenerator():
+    '''
+    Builds random but always completable levels out of the standard tile IDs.
+    The level is a rolling strip of ground broken up by water gaps, with
+    floating platforms above it. Enemies, item boxes, and decorations are
+    scattered on top of any walkable surface. The same options (including the
+    seed) always produce the exact same level.
+    '''
+
+    # Rows where the top of the ground is allowed to sit
+    GROUND_MIN_ROW = TILEMAP.ROWS - 7
+    GROUND_MAX_ROW = TILEMAP.ROWS - 2
+
+    # Columns at the start and end of the level that are always flat ground
+    SAFE_COLS = 6
+
+    def __init__(self, options=None, env=ENVIRONMENT):
+        '''
+        Initializes a generator with the given options, for levels played
+        with the physics of env.
+        '''
+        self.options = options if options is not None else LevelOptions()
+        self.env = env
+        if self.options.width < 2 * LevelGenerator.SAFE_COLS + 1:
+            raise ValueError(f'Level width must be at least '
+                             f'{2 * LevelGenerator.SAFE_COLS + 1} columns')
+
+    def generate(self):
+        '''
+        Returns the world data as a list of rows of tile IDs, in the same
+        layout that GameEngine reads from the level CSV files.
+        '''
+        opts = self.options
+        self.rng = random.Random(opts.seed)
+        self.world_data = [[TILEMAP.EMPTY_TILE] * opts.width
+                           for _ in range(TILEMAP.ROWS)]
+
+        # Lay down the ground from left to right, one segment at a time
+        self.ground = self._build_ground()
+        for col, top in enumerate(self.ground):
+            if top is None:
+                self._fill_water(col)
+            else:
+                self._fill_ground(col, top)
+
+        # Floating platforms and everything that stands on a surface
+        self._build_platforms()
+        self._place_entities()
+
+        # The player starts in the air over the first safe column
+        start_col = 2
+        self.world_data[self.ground[start_col] - 2][start_col] = \
+            TILEMAP.PLAYER_TILE_ID
+
+        # The exit sits on the ground near the far end of the level
+        exit_col = opts.width - 3
+        self.world_data[self.ground[exit_col] - 1][exit_col] = \
+            TILEMAP.LEVEL_EXIT_TILE_ID
+
+        if not is_completable(self.world_data, self.env):
+            raise RuntimeError(f'Generated level (seed {opts.seed}) '
+                               f'cannot be completed')
+        return self.world_data
+
+    def _build_ground(self):
+        '''
+        Returns the row of the top ground tile for each column, or None for
+        columns that are filled with water.
+        '''
+        opts = self.options
+        rng = self.rng
+        max_gap = max(1, min(opts.max_gap_width,
+                             max_jump_gap(env=self.env)))
+        max_rise = max_jump_rise(env=self.env)
+        last_col = opts.width - LevelGenerator.SAFE_COLS
+
+        top = LevelGenerator.GROUND_MAX_ROW - 1
+        ground = [top] * LevelGenerator.SAFE_COLS
+        while len(ground) < last_col:
+            # Water gaps keep the same ground height on both sides, and a
+            # jump across the gap is never combined with a climb
+            if ground[-1] is not None and rng.random() < opts.water_gap_chance:
+                ground += [None] * rng.randint(1, max_gap)
+            elif ground[-1] is None:
+                ground += [top] * rng.randint(3, 10)
+            else:
+                step = rng.randint(-2, max_rise)
+                top = min(LevelGenerator.GROUND_MAX_ROW,
+                          max(LevelGenerator.GROUND_MIN_ROW, top - step))
+                ground += [top] * rng.randint(3, 10)
+        ground = ground[:last_col]
+
+        # Never end on water; the final stretch is flat up to the exit
+        if ground[-1] is None:
+            ground[-1] = top
+        ground += [top] * (opts.width - len(ground))
+        return ground
+
+    def _fill_ground(self, col, top):
+        '''
+        Fills a column with dirt from the given row to the bottom.
+        '''
+        self.world_data[top][col] = TILEMAP.DIRT_TILE_FIRST
+        for row in range(top + 1, TILEMAP.ROWS):
+            self.world_data[row][col] = TILEMAP.DIRT_TILE_FIRST + 4
+
+    def _fill_water(self, col):
+        '''
+        Fills the bottom of a column with water.
+        '''
+        self.world_data[TILEMAP.ROWS - 2][col] = TILEMAP.WATER_TILE_FIRST
+        self.world_data[TILEMAP.ROWS - 1][col] = TILEMAP.WATER_TILE_LAST
+
+    def _build_platforms(self):
+        '''
+        Adds floating platforms above the ground. Higher complexity means
+        more platforms and more tiers stacked on top of each other. Every
+        platform leaves two empty rows underneath so Soldiers can walk below.
+        Platforms are optional detours; the ground alone reaches the exit.
+        '''
+        opts = self.options
+        rng = self.rng
+        self.platforms = []
+        col = LevelGenerator.SAFE_COLS
+        last_col = opts.width - LevelGenerator.SAFE_COLS
+        while col < last_col:
+            length = rng.randint(3, 7)
+            span = range(col, min(col + length, last_col))
+            # Only build over flat ground so that a platform never cuts a
+            # jump short when a Soldier bumps their head on it
+            below = set(self.ground[span.start - 2:span.stop + 2])
+            if len(below) == 1 and rng.random() < opts.platform_complexity:
+                row = below.pop() - 3
+                while row >= 2:
+                    for c in span:
+                        self.world_data[row][c] = TILEMAP.DIRT_TILE_FIRST + 7
+                    self.platforms.append((row, span))
+                    if rng.random() >= opts.platform_complexity:
+                        break
+                    row -= 3
+            col += length + rng.randint(2, 6)
+
+    def _place_entities(self):
+        '''
+        Scatters enemies, item boxes, and decorations on walkable surfaces.
+        The start and end of the level are kept clear.
+        '''
+        opts = self.options
+        rng = self.rng
+        items = [TILEMAP.AMMO_TILE_ID, TILEMAP.GRENADE_TILE_ID,
+                 TILEMAP.HEALTH_TILE_ID]
+        decorations = range(TILEMAP.DECORATION_TILE_FIRST,
+                            TILEMAP.DECORATION_TILE_LAST + 1)
+        surfaces = [(top - 1, col) for col, top in enumerate(self.ground)
+                    if top is not None]
+        surfaces += [(row - 1, col) for row, span in self.platforms
+                     for col in span]
+
+        first = LevelGenerator.SAFE_COLS
+        last = opts.width - LevelGenerator.SAFE_COLS
+        for row, col in surfaces:
+            if not first <= col < last:
+                continue
+            if self.world_data[row][col] != TILEMAP.EMPTY_TILE:
+                continue
+            roll = rng.random()
+            if roll < opts.enemy_density:
+                tile = TILEMAP.ENEMY_TILE_ID
+            elif roll < opts.enemy_density + opts.item_density:
+                tile = rng.choice(items)
+            elif roll < (opts.enemy_density + opts.item_density
+                         + opts.decoration_density):
+                tile = rng.choice(decorations)
+            else:
+                continue
+            self.world_data[row][col] = tile
+
+
+def is_solid(tile):
+    '''
+    Returns True if a Soldier can stand on the given tile.
+    '''
+    return TILEMAP.DIRT_TILE_FIRST <= tile <= TILEMAP.DIRT_TILE_LAST
+
+
+def is_open(tile):
+    '''
+    Returns True if a Soldier can pass through the given tile safely.
+    '''
+    return not (is_solid(tile) or
+                TILEMAP.WATER_TILE_FIRST <= tile <= TILEMAP.WATER_TILE_LAST)
+
+
+def is_completable(world_data, env=ENVIRONMENT):
+    '''
+    Verifies that a level has exactly one player and that the player can
+    walk, drop, and jump (as far as env allows) from the starting point to
+    an exit tile. The search runs over "standing cells", which are open
+    cells with two rows of headroom and solid ground directly beneath. A
+    player who starts over water or a bottomless pit can't get anywhere.
+    '''
+    rows, cols = len(world_data), len(world_data[0])
+    players = [(r, c) for r in range(rows) for c in range(cols)
+               if world_data[r][c] == TILEMAP.PLAYER_TILE_ID]
+    exits = {(r, c) for r in range(rows) for c in range(cols)
+             if world_data[r][c] == TILEMAP.LEVEL_EXIT_TILE_ID}
+    if len(players) != 1 or not exits:
+        return False
+
+    def standing(r, c):
+        return (0 < r < rows - 1 and 0 <= c < cols
+                and is_open(world_data[r][c])
+                and is_open(world_data[r - 1][c])
+                and is_solid(world_data[r + 1][c]))
+
+    def land(r, c):
+        # Fall straight down from (r, c) and return where the Soldier lands
+        while 0 <= c < cols and r < rows - 1 and is_open(world_data[r][c]):
+            if standing(r, c):
+                return (r, c)
+            r += 1
+        return None
+
+    max_gap = max_jump_gap(env=env) + 1
+    max_rise = max_jump_rise(env=env)
+    start = land(*players[0])
+    if start is None:
+        return False
+    seen = {start}
+    frontier = [start]
+    while frontier:
+        r, c = frontier.pop()
+        if any((r + dr, c) in exits for dr in (-1, 0)):
+            return True
+        neighbours = []
+        for step in (-1, 1):
+            # Walking or dropping off a ledge
+            neighbours.append(land(r, c + step))
+            # Jumping across gaps or up onto ledges
+            for dx in range(1, max_gap + 1):
+                for dy in range(-max_rise, max_rise + 1):
+                    if standing(r + dy, c + step * dx):
+                        neighbours.append((r + dy, c + step * dx))
+        for cell in neighbours:
+            if cell is not None and cell not in seen:
+                seen.add(cell)
+                frontier.append(cell)
+    return False
+
+
+def write_level(world_data, path):
+    '''
+    Saves the world data in the CSV format that GameEngine loads.
+    '''
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        writer.writerows(world_data)
+
+
+if __name__ == '__main__':
+    '''
+    Command line entry point, e.g. `python levelgen.py 4 --width 1500`
+    writes a ten times wider than normal level to level4_data.csv.
+    '''
+    defaults = LevelOptions()
+    parser = argparse.ArgumentParser(description='Generate a random level.')
+    parser.add_argument('level', type=int, help='level number to write')
+    parser.add_argument('--width', type=int, default=defaults.width)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--enemy-density', type=float,
+                        default=defaults.enemy_density)
+    parser.add_argument('--item-density', type=float,
+                        default=defaults.item_density)
+    parser.add_argument('--decoration-density', type=float,
+                        default=defaults.decoration_density)
+    parser.add_argument('--water-gap-chance', type=float,
+                        default=defaults.water_gap_chance)
+    parser.add_argument('--max-gap-width', type=int,
+                        default=defaults.max_gap_width)
+    parser.add_argument('--platform-complexity', type=float,
+                        default=defaults.platform_complexity)
+    args = parser.parse_args()
+
+    options = LevelOptions(width=args.width, seed=args.seed,
+                           enemy_density=args.enemy_density,
+                           item_density=args.item_density,
+                           decoration_density=args.decoration_density,
+                           water_gap_chance=args.water_gap_chance,
+                           max_gap_width=args.max_gap_width,
+                           platform_complexity=args.platform_complexity)
+    world_data = LevelGenerator(options).generate()
+    write_level(world_data, f'level{args.level}_data.csv')
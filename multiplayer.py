@@ -0,0 +1,610 @@
+
+import json
+import time
+import struct
+import asyncio
+import argparse
+import itertools
+import pygame
+from dataclasses import dataclass, asdict
+from controller import GameController, handle_keyboard_events
+from engine import GameEngine, FrameSnapshot
+from soldier import Player
+from weapons import ItemBox, Bullet, Grenade, Explosion
+from settings import (SCREEN_WIDTH, SCREEN_HEIGHT, FPS, TICK_RATE, TILEMAP,
+                      ENVIRONMENT, Direction, GameModes)
+
+
+# Every message is a 4-byte big-endian length followed by UTF-8 JSON
+HEADER = struct.Struct('!I')
+
+# Entity kinds in world snapshots
+KIND_PLAYER = 'p'
+KIND_ENEMY = 'e'
+KIND_BULLET = 'b'
+KIND_GRENADE = 'g'
+KIND_ITEM = 'i'
+KIND_EXPLOSION = 'x'
+
+
+@dataclass
+class NetworkStats():
+    '''
+    Bandwidth and latency counters for one end of a connection.
+    '''
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    messages_sent: int = 0
+    messages_received: int = 0
+    entities_sent: int = 0
+    last_rtt_ms: float = 0.0
+    avg_rtt_ms: float = 0.0
+
+    def record_rtt(self, rtt_ms):
+        '''
+        Tracks the latest round trip time and a smoothed average.
+        '''
+        self.last_rtt_ms = rtt_ms
+        if self.avg_rtt_ms == 0.0:
+            self.avg_rtt_ms = rtt_ms
+        else:
+            self.avg_rtt_ms += 0.1 * (rtt_ms - self.avg_rtt_ms)
+
+
+async def send_message(writer, message, *stats):
+    '''
+    Frames and sends one message, updating each of the given counters.
+    '''
+    payload = json.dumps(message, separators=(',', ':')).encode()
+    writer.write(HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+    for counters in stats:
+        counters.bytes_sent += HEADER.size + len(payload)
+        counters.messages_sent += 1
+
+
+async def read_message(reader, *stats):
+    '''
+    Reads one framed message, or returns None when the peer hangs up.
+    '''
+    try:
+        header = await reader.readexactly(HEADER.size)
+        payload = await reader.readexactly(HEADER.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    for counters in stats:
+        counters.bytes_received += HEADER.size + len(payload)
+        counters.messages_received += 1
+    return json.loads(payload)
+
+
+class MultiplayerEngine(GameEngine):
+    '''
+    A GameEngine that simulates several players in the same level. Every
+    player spawns at the level's player tile. Most of the base class only
+    knows about self.player, so the per-player steps simply point
+    self.player at each player in turn; everything else (enemies, bullets,
+    grenades, etc.) is still updated exactly once per tick.
+    '''
+
+    def __init__(self, level=1, env=ENVIRONMENT):
+        '''
+        Creates a headless engine with no players yet.
+        '''
+        super().__init__(None, GameModes.INTERACTIVE, env)
+        self.level = level
+        self.players = {}
+        self.load_current_level()
+
+    def load_current_level(self):
+        '''
+        Loads the level and respawns everybody at the start.
+        '''
+        super().load_current_level()
+        self.spawn_point = self.player.rect.center
+        for player_id in self.players:
+            self.players[player_id] = Player(*self.spawn_point, env=self.env,
+                                             now=self.now)
+            self.animator.add(self.players[player_id])
+
+    def add_player(self, player_id):
+        '''
+        Adds a new player at the spawn point.
+        '''
+        self.players[player_id] = Player(*self.spawn_point, env=self.env,
+                                         now=self.now)
+        self.animator.add(self.players[player_id])
+        return self.players[player_id]
+
+    def remove_player(self, player_id):
+        '''
+        Removes a player who left the game.
+        '''
+        player = self.players.pop(player_id, None)
+        if player is not None:
+            self.animator.remove(player)
+            self.triggers.forget(player)
+
+    def enemy_actions(self):
+        '''
+        Handle AI behavior for all enemies; they shoot at any live player.
+        '''
+        live_players = [p for p in self.players.values() if p.alive]
+        seeing = set()
+        for player in live_players:
+            watchers = [enemy for enemy in self.groups['enemy'] if enemy.alive
+                        and enemy.vision.colliderect(player.rect)]
+            seeing |= self.sight.can_see(watchers, player.rect)
+        self.navigation.update()
+        for enemy in self.groups['enemy']:
+            if enemy.alive:
+                if enemy in seeing:
+                    bullet = enemy.shoot(self.now)
+                    if bullet:
+                        self.groups['bullet'].add(bullet)
+                        self.play_sound(Bullet.sound_fx, bullet.rect.centerx)
+                if live_players:
+                    nearest = min(live_players, key=lambda p: abs(
+                        p.rect.centerx - enemy.rect.centerx))
+                    self.move_enemy(enemy, nearest)
+                else:
+                    enemy.ai_move(self.world_data, TILEMAP.TILE_SIZE,
+                                  self.rng)
+                if enemy.health <= 0:
+                    enemy.death()
+
+    def handle_bullet_damage(self):
+        '''
+        Check for bullet hit damage against every player and enemy.
+        '''
+        for player in self.players.values():
+            for bullet in self.bullets_hitting(player):
+                player.health -= bullet.damage
+                bullet.kill()
+        for enemy in self.groups['enemy']:
+            for bullet in self.bullets_hitting(enemy):
+                if enemy.health >= 0:
+                    enemy.health -= bullet.damage
+                    bullet.kill()
+
+    def make_grenades_explode(self):
+        '''
+        Grenade splash damage hurts every player and enemy.
+        '''
+        for grenade in self.groups['grenade']:
+            if grenade.exploding(self.now):
+                explosion = Explosion(grenade.rect.x, grenade.rect.y,
+                                      self.now)
+                self.groups['explosion'].add(explosion)
+                self.animator.add(explosion)
+                self.play_sound(Explosion.sound_fx, grenade.rect.centerx)
+                for player in self.players.values():
+                    player.health -= grenade.damage_at(player.rect)
+                for enemy in self.groups['enemy']:
+                    enemy.health -= grenade.damage_at(enemy.rect)
+                grenade.kill()
+
+    def update(self, controllers):
+        '''
+        Runs one tick. The controllers argument maps player IDs to their
+        GameController; players without one stand still.
+        '''
+        start = time.perf_counter()
+        self.advance_clock()
+        idle = GameController()
+        for player_id, player in self.players.items():
+            if player.alive:
+                self.player = player
+                self.player_actions(controllers.get(player_id, idle))
+                self.apply_physics(player)
+
+        # Calculate enemy and grenade movements
+        self.enemy_actions()
+        for enemy in self.groups['enemy']:
+            self.apply_physics(enemy)
+        for grenade in self.groups['grenade']:
+            self.apply_physics(grenade)
+
+        # Special collision-based updates
+        self.trigger_events = []
+        for player in self.players.values():
+            self.player = player
+            self.enter_triggers()
+            self.collect_item_boxes()
+        self.handle_bullet_damage()
+        self.make_grenades_explode()
+
+        # Standard updates to the sprites with behavior
+        for player in self.players.values():
+            player.update()
+        self.scheduler.update()
+        self.remove_stray_bullets()
+        self.animator.update()
+
+        # Check for end-states; any player reaching the exit finishes the level
+        for player in self.players.values():
+            self.player = player
+            self.check_for_player_death()
+            self.check_if_level_exit()
+        self.stats.ticks += 1
+        self.stats.update_ms += (time.perf_counter() - start) * 1000
+
+    def world_state(self, net_ids):
+        '''
+        Returns every moving entity as {id: [kind, ..., x, y]}. Static tiles
+        are left out because clients load them from the level file. The
+        net_ids counter hands out IDs to sprites that don't have one yet.
+        '''
+        state = {}
+
+        def add(sprite, *fields):
+            if not hasattr(sprite, 'net_id'):
+                sprite.net_id = str(next(net_ids))
+            state[sprite.net_id] = [*fields, sprite.rect.x, sprite.rect.y]
+
+        for player_id, player in self.players.items():
+            state[f'p{player_id}'] = [KIND_PLAYER, int(player.action),
+                                      player.frame_idx,
+                                      int(player.direction),
+                                      int(player.health), player.ammo,
+                                      player.grenades,
+                                      player.rect.x, player.rect.y]
+        for enemy in self.groups['enemy']:
+            add(enemy, KIND_ENEMY, int(enemy.action), enemy.frame_idx,
+                int(enemy.direction))
+        for item in self.groups['item']:
+            add(item, KIND_ITEM, item.box_type)
+        for bullet in self.groups['bullet']:
+            add(bullet, KIND_BULLET)
+        for grenade in self.groups['grenade']:
+            add(grenade, KIND_GRENADE)
+        for explosion in self.groups['explosion']:
+            add(explosion, KIND_EXPLOSION, explosion.frame_idx)
+        return state
+
+
+class GameServer():
+    '''
+    Authoritative asyncio game server. It runs a MultiplayerEngine at a
+    fixed tick rate, takes GameController states from clients, and sends
+    each client a delta-compressed snapshot every tick: only entities that
+    are new or changed since the last snapshot sent to that client, plus
+    the IDs of entities that disappeared. TCP delivers messages in order,
+    so each client's last snapshot is always a valid base for the next.
+    '''
+
+    def __init__(self, level=1, tick_rate=TICK_RATE):
+        '''
+        Creates the server and its engine; call serve() to start it.
+        '''
+        self.engine = MultiplayerEngine(level)
+        self.tick_rate = tick_rate
+        self.tick = 0
+        self.clients = {}
+        self.player_ids = itertools.count(1)
+        self.net_ids = itertools.count(1)
+        self.stats = NetworkStats()
+        self.listening = asyncio.Event()
+        self.port = None
+
+    async def serve(self, host='127.0.0.1', port=0, max_ticks=None):
+        '''
+        Listens for clients and runs the game loop until max_ticks (or
+        forever). The bound port is stored in self.port and the listening
+        event is set once clients can connect, so port=0 works for loopback
+        tests.
+        '''
+        server = await asyncio.start_server(self._handle_client, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.listening.set()
+        async with server:
+            await self._game_loop(max_ticks)
+
+    async def _handle_client(self, reader, writer):
+        '''
+        Registers a client, then applies its controller messages until it
+        disconnects.
+        '''
+        player_id = next(self.player_ids)
+        client = ClientConnection(player_id, writer)
+        self.clients[player_id] = client
+        self.engine.add_player(player_id)
+        await send_message(writer, {'t': 'welcome', 'id': player_id,
+                                    'tick_rate': self.tick_rate},
+                           client.stats, self.stats)
+        try:
+            while True:
+                message = await read_message(reader, client.stats, self.stats)
+                if message is None:
+                    break
+                if message['t'] == 'input':
+                    client.controller = GameController(*message['buttons'])
+                    if message.get('echo'):
+                        rtt_ms = (time.perf_counter() - message['echo']) * 1000
+                        client.stats.record_rtt(rtt_ms)
+                        self.stats.record_rtt(rtt_ms)
+        finally:
+            del self.clients[player_id]
+            self.engine.remove_player(player_id)
+            writer.close()
+
+    async def _game_loop(self, max_ticks):
+        '''
+        Fixed-rate simulation loop that broadcasts after every tick.
+        '''
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        next_tick = loop.time()
+        while max_ticks is None or self.tick < max_ticks:
+            self._step()
+            await self._broadcast()
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    def _step(self):
+        '''
+        Advances the world by one tick and handles level transitions.
+        '''
+        engine = self.engine
+        if engine.players:
+            controllers = {pid: client.controller
+                           for pid, client in self.clients.items()}
+            engine.update(controllers)
+            if engine.level_complete:
+                engine.load_next_level()
+                if engine.game_mode == GameModes.QUIT:
+                    engine.game_mode = GameModes.INTERACTIVE
+                    engine.level = 1
+                    engine.load_current_level()
+            elif not any(p.alive for p in engine.players.values()):
+                engine.load_current_level()
+        self.tick += 1
+
+    async def _broadcast(self):
+        '''
+        Sends every client the changes since its previous snapshot.
+        '''
+        if not self.clients:
+            return
+        state = self.engine.world_state(self.net_ids)
+        for client in list(self.clients.values()):
+            if client.level != self.engine.level:
+                client.known = {}  # new level, so start from scratch
+                client.level = self.engine.level
+            changed = {eid: fields for eid, fields in state.items()
+                       if client.known.get(eid) != fields}
+            removed = [eid for eid in client.known if eid not in state]
+            client.known = state
+            message = {'t': 'snap', 'tick': self.tick,
+                       'level': self.engine.level,
+                       'time': time.perf_counter(),
+                       'changed': changed, 'removed': removed}
+            try:
+                await send_message(client.writer, message, client.stats,
+                                   self.stats)
+            except ConnectionError:
+                continue
+            client.stats.entities_sent += len(changed)
+            self.stats.entities_sent += len(changed)
+
+
+class ClientConnection():
+    '''
+    Server-side bookkeeping for one connected client.
+    '''
+
+    def __init__(self, player_id, writer):
+        '''
+        Initializes the connection with an idle controller.
+        '''
+        self.player_id = player_id
+        self.writer = writer
+        self.controller = GameController()
+        self.known = {}
+        self.level = None
+        self.stats = NetworkStats()
+
+
+class GameClient():
+    '''
+    Asyncio client for GameServer. It sends the local GameController every
+    frame and rebuilds the world from the server's delta snapshots. With a
+    screen it renders the world through GameEngine.draw_snapshot, using a
+    local engine only for the static tiles of the current level. Without a
+    screen it runs headless, which is enough for loopback testing.
+    '''
+
+    def __init__(self, screen=None):
+        '''
+        Creates a client; pass a screen to render and read the keyboard.
+        '''
+        self.screen = screen
+        self.engine = GameEngine(screen, GameModes.INTERACTIVE)
+        self.controller = GameController()
+        self.entities = {}
+        self.level = None
+        self.player_id = None
+        self.tick = 0
+        self.server_time = None
+        self.running = True
+        self.stats = NetworkStats()
+
+    async def connect(self, host='127.0.0.1', port=0):
+        '''
+        Connects to a server and waits for the welcome message.
+        '''
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        welcome = await read_message(self.reader, self.stats)
+        self.player_id = welcome['id']
+        self.tick_rate = welcome['tick_rate']
+
+    async def run(self, max_frames=None):
+        '''
+        Runs the receive task and the local frame loop until the server goes
+        away, the window is closed, or max_frames have been shown.
+        '''
+        receiver = asyncio.create_task(self._receive())
+        frames = 0
+        try:
+            while self.running and (max_frames is None or frames < max_frames):
+                self._handle_events()
+                await self._send_input()
+                if self.screen is not None and self.level is not None:
+                    self.draw()
+                    pygame.display.flip()
+                frames += 1
+                await asyncio.sleep(1.0 / FPS)
+        finally:
+            receiver.cancel()
+            self.writer.close()
+
+    def _handle_events(self):
+        '''
+        Reads the keyboard when there is a window to read it from.
+        '''
+        if self.screen is None:
+            return
+        for event in pygame.event.get():
+            if (event.type == pygame.QUIT or event.type == pygame.KEYDOWN
+                    and event.key == pygame.K_ESCAPE):
+                self.running = False
+            handle_keyboard_events(event, self.controller)
+
+    async def _send_input(self):
+        '''
+        Sends the controller state along with the latest server timestamp so
+        the server can measure the round trip time.
+        '''
+        controller = self.controller
+        buttons = [controller.mleft, controller.mright, controller.jump,
+                   controller.shoot, controller.throw]
+        await send_message(self.writer, {'t': 'input', 'buttons': buttons,
+                                         'echo': self.server_time},
+                           self.stats)
+
+    async def _receive(self):
+        '''
+        Applies snapshot deltas as they arrive.
+        '''
+        while True:
+            message = await read_message(self.reader, self.stats)
+            if message is None:
+                self.running = False
+                return
+            if message['t'] != 'snap':
+                continue
+            if message['level'] != self.level:
+                self.entities = {}
+                self.level = message['level']
+                self.engine.level = self.level
+                if self.screen is not None:
+                    self.engine.load_current_level()
+            for eid in message['removed']:
+                self.entities.pop(eid, None)
+            self.entities.update(message['changed'])
+            self.tick = message['tick']
+            self.server_time = message['time']
+
+    @property
+    def me(self):
+        '''
+        This client's own player entity, if the server has sent it yet.
+        '''
+        return self.entities.get(f'p{self.player_id}')
+
+    def draw(self):
+        '''
+        Renders the latest world state with GameEngine.draw_snapshot. The
+        camera is centered on this client's own player.
+        '''
+        engine = self.engine
+        me = self.me
+        if me is not None:
+            max_scroll = max(0, engine.world_width - SCREEN_WIDTH)
+            scroll = min(max_scroll, max(0, me[-2] - SCREEN_WIDTH // 2))
+            engine.camera_scroll = -scroll
+            engine.bg_scroll = scroll
+        camera_x = engine.camera_scroll
+
+        # Static tiles come from the local copy of the level
+        sprites = []
+        for group in GameEngine.static_group_names:
+            for tile in engine.groups[group].visible(-camera_x,
+                                                     SCREEN_WIDTH - camera_x):
+                screen_x = tile.rect.x + camera_x
+                if -tile.rect.width < screen_x < SCREEN_WIDTH:
+                    sprites.append((tile.image, screen_x, tile.rect.y, False))
+
+        # Everything else comes from the server
+        players = []
+        for fields in self.entities.values():
+            sprite = self._sprite_image(fields)
+            if sprite is None:
+                continue
+            image, flip = sprite
+            entry = (image, fields[-2] + camera_x, fields[-1], flip)
+            (players if fields[0] == KIND_PLAYER else sprites).append(entry)
+
+        health, ammo, grenades = 0, 0, 0
+        if me is not None:
+            health, ammo, grenades = me[4], me[5], me[6]
+        engine.draw_snapshot(FrameSnapshot(
+            engine.bg_scroll, tuple(sprites + players),
+            engine.health_bar, health, engine.ammo_bar, ammo,
+            engine.grenade_bar, grenades))
+
+    @staticmethod
+    def _sprite_image(fields):
+        '''
+        Looks up the image for an entity from the shared asset caches.
+        Returns an (image, flip) pair, or None if the assets aren't loaded.
+        '''
+        kind = fields[0]
+        if kind in (KIND_PLAYER, KIND_ENEMY):
+            soldier = 'player' if kind == KIND_PLAYER else 'enemy'
+            frames = Player.animations.get(soldier)
+            if frames is None:
+                return None
+            action, frame_idx, direction = fields[1], fields[2], fields[3]
+            return frames[action][frame_idx], direction == Direction.LEFT
+        if kind == KIND_ITEM and ItemBox.images:
+            return ItemBox.images[fields[1]], False
+        if kind == KIND_BULLET and Bullet.image:
+            return Bullet.image, False
+        if kind == KIND_GRENADE and Grenade.image:
+            return Grenade.image, False
+        if kind == KIND_EXPLOSION and Explosion.animations:
+            return Explosion.animations[fields[1]], False
+        return None
+
+
+if __name__ == '__main__':
+    '''
+    Runs a server (`python multiplayer.py server --port 5555`) or a client
+    with a window (`python multiplayer.py client --port 5555`).
+    '''
+    parser = argparse.ArgumentParser(description='Multiplayer shooter.')
+    parser.add_argument('role', choices=['server', 'client'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--level', type=int, default=1)
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.mixer.init()
+
+    if args.role == 'server':
+        pygame.display.set_mode((1, 1))
+        server = GameServer(args.level)
+        asyncio.run(server.serve(args.host, args.port))
+    else:
+        pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption('Shooter (multiplayer)')
+        client = GameClient(pygame.display.get_surface())
+
+        async def play():
+            await client.connect(args.host, args.port)
+            await client.run()
+            print(asdict(client.stats))
+        asyncio.run(play())
+    pygame.quit()
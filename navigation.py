@@ -0,0 +1,280 @@
+
+import heapq
+from collections import deque
+from dataclasses import dataclass, field
+from levelgen import jump_reach, is_solid, is_open
+from settings import ENVIRONMENT, Direction, TILEMAP
+
+
+@dataclass
+class NavSpan():
+    '''
+    A horizontal run of cells on one row where a Soldier can stand.
+    '''
+    row: int
+    first: int
+    last: int
+    links: list = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class NavLink():
+    '''
+    A way to get from one span to another: walk (or drop) off the end of a
+    span, or jump. The Soldier heads for the take-off column on the source
+    span and comes down in the landing column on the target span.
+    '''
+    kind: str
+    source: int
+    target: int
+    take_off: int
+    landing: int
+    cost: int
+
+
+class NavigationGraph():
+    '''
+    A navigation graph for a level, built once from its world data. The
+    nodes are walkable spans and the edges are the drops and jumps between
+    them, worked out from the same jump physics as the level generator.
+
+    Searches run backwards from a target span and produce a table with the
+    next link to take from every other span, so all of the enemies chasing
+    the same player share one search. Tables are cached for the whole level,
+    and at most replan_budget new ones are computed per frame; until its
+    table is ready, an enemy simply keeps patrolling.
+    '''
+
+    DROP = 'drop'
+    JUMP = 'jump'
+
+    CHASE_RANGE = 600    # enemies closer than this (in pixels) give chase
+    ENGAGE_RANGE = 250   # and stop to shoot once they're this close
+
+    def __init__(self, world_data, speed=2, replan_budget=2, env=ENVIRONMENT):
+        '''
+        Builds the graph for Soldiers that walk at the given speed and jump
+        with the physics of env.
+        '''
+        self.world_data = world_data
+        self.rows, self.cols = len(world_data), len(world_data[0])
+        self.tile_size = TILEMAP.TILE_SIZE
+        self.replan_budget = replan_budget
+        self.tables = {}
+        self.pending = deque()
+        self.last_span = {}
+
+        # A jump can land a few columns away, depending on how far a Soldier
+        # travels while in the air, with some slack for the take-off point
+        reach_x, reach_y = jump_reach(speed, env)
+        self.max_jump_cols = (1 + max(0, reach_x - self.tile_size // 2)
+                              // self.tile_size)
+        self.max_jump_rows = max(1, reach_y // self.tile_size)
+
+        self._build_spans()
+        self._build_links()
+
+    def _standing(self, row, col):
+        '''
+        Returns True if a Soldier can stand in a cell: two open cells of
+        headroom with solid ground right beneath.
+        '''
+        world_data = self.world_data
+        return (0 < row < self.rows - 1 and 0 <= col < self.cols
+                and is_open(world_data[row][col])
+                and is_open(world_data[row - 1][col])
+                and is_solid(world_data[row + 1][col]))
+
+    def _build_spans(self):
+        '''
+        Merges neighboring standing cells in each row into spans.
+        '''
+        self.spans = []
+        self.span_of_cell = {}
+        for row in range(self.rows):
+            col = 0
+            while col < self.cols:
+                if not self._standing(row, col):
+                    col += 1
+                    continue
+                first = col
+                while col < self.cols and self._standing(row, col):
+                    self.span_of_cell[(row, col)] = len(self.spans)
+                    col += 1
+                self.spans.append(NavSpan(row, first, col - 1))
+
+    def _land(self, row, col):
+        '''
+        Returns the span a Soldier falls onto from a cell, or None if it
+        falls into water or out of the world.
+        '''
+        while 0 <= col < self.cols and row < self.rows - 1:
+            if (row, col) in self.span_of_cell:
+                return self.span_of_cell[(row, col)]
+            if not is_open(self.world_data[row][col]):
+                return None
+            row += 1
+        return None
+
+    def _build_links(self):
+        '''
+        Connects every span to the spans it can drop or jump onto. Only the
+        cheapest link between any two spans is kept.
+        '''
+        self.reverse_links = [[] for _ in self.spans]
+        for source, span in enumerate(self.spans):
+            best = {}
+
+            def consider(link):
+                if (link.target != source and (link.target not in best
+                        or link.cost < best[link.target].cost)):
+                    best[link.target] = link
+
+            # Walking off either end of the span
+            for take_off, step in ((span.first, -1), (span.last, 1)):
+                target = self._land(span.row, take_off + step)
+                if target is not None:
+                    consider(NavLink(NavigationGraph.DROP, source, target,
+                                     take_off, take_off + step, 1))
+
+            # Jumping from anywhere on the span, costing a bit more so that
+            # walking is preferred
+            for take_off in range(span.first, span.last + 1):
+                for step in (-1, 1):
+                    for cols in range(1, self.max_jump_cols + 1):
+                        landing = take_off + step * cols
+                        for rows in range(-self.max_jump_rows,
+                                          self.max_jump_rows + 1):
+                            target = self.span_of_cell.get(
+                                (span.row + rows, landing))
+                            if target is not None:
+                                consider(NavLink(NavigationGraph.JUMP,
+                                                 source, target, take_off,
+                                                 landing, cols + 2))
+
+            span.links = list(best.values())
+            for link in span.links:
+                self.reverse_links[link.target].append(link)
+
+    def span_at(self, rect):
+        '''
+        Returns the index of the span that a Soldier's rect is standing on,
+        or None if it is in the air. A Soldier hanging over an edge counts
+        as standing on the span under its feet.
+        '''
+        row = rect.bottom // self.tile_size - 1
+        for x in (rect.centerx, rect.left, rect.right - 1):
+            span = self.span_of_cell.get((row, x // self.tile_size))
+            if span is not None:
+                return span
+        return None
+
+    def _search(self, target):
+        '''
+        Runs Dijkstra's algorithm backwards from a target span and returns a
+        table mapping each span that can reach it to its first link.
+        '''
+        table = {}
+        cost = {target: 0}
+        queue = [(0, target)]
+        while queue:
+            dist, span = heapq.heappop(queue)
+            if dist > cost[span]:
+                continue
+            for link in self.reverse_links[span]:
+                new_dist = dist + link.cost
+                if new_dist < cost.get(link.source, new_dist + 1):
+                    cost[link.source] = new_dist
+                    table[link.source] = link
+                    heapq.heappush(queue, (new_dist, link.source))
+        return table
+
+    def update(self):
+        '''
+        Runs the searches that were requested since the last frame, up to
+        the replan budget. Called once per frame.
+        '''
+        for _ in range(min(self.replan_budget, len(self.pending))):
+            target = self.pending.popleft()
+            self.tables[target] = self._search(target)
+
+    def next_link(self, source, target):
+        '''
+        Returns the first link on the way from one span to another, or None
+        if there isn't a way or the search hasn't run yet.
+        '''
+        table = self.tables.get(target)
+        if table is None:
+            if target not in self.pending:
+                self.pending.append(target)
+            return None
+        return table.get(source)
+
+    def route_to(self, target):
+        '''
+        Returns the table of first links towards a target span, searching
+        right away instead of waiting for the replan budget.
+        '''
+        if target not in self.tables:
+            self.tables[target] = self._search(target)
+        return self.tables[target]
+
+    def reachable_from(self, source):
+        '''
+        Returns the set of spans that can be reached from a span, itself
+        included.
+        '''
+        reached = {source}
+        frontier = [source]
+        while frontier:
+            for link in self.spans[frontier.pop()].links:
+                if link.target not in reached:
+                    reached.add(link.target)
+                    frontier.append(link.target)
+        return reached
+
+    def steer(self, soldier, target):
+        '''
+        Decides how a Soldier should move to chase a target sprite. Returns a
+        (direction, move, jump) tuple, or None if the Soldier should go about
+        its normal business instead.
+        '''
+        rect = soldier.rect
+        dx = target.rect.centerx - rect.centerx
+        if abs(dx) > NavigationGraph.CHASE_RANGE:
+            return None
+
+        # Keep going the same way while jumping or falling
+        if soldier.in_air:
+            return soldier.direction, True, False
+
+        # Remember where targets stood last, since they're often mid-jump
+        target_span = self.span_at(target.rect)
+        if target_span is None:
+            target_span = self.last_span.get(target)
+        else:
+            self.last_span[target] = target_span
+        source = self.span_at(rect)
+        if target_span is None or source is None:
+            return None
+
+        facing = Direction.RIGHT if dx > 0 else Direction.LEFT
+        if source == target_span:
+            return facing, abs(dx) > NavigationGraph.ENGAGE_RANGE, False
+
+        link = self.next_link(source, target_span)
+        if link is None:
+            return None
+
+        # Walk to the take-off column, then past its middle before jumping
+        col = rect.centerx // self.tile_size
+        heading = (Direction.RIGHT if link.landing > link.take_off
+                   else Direction.LEFT)
+        if col != link.take_off:
+            facing = (Direction.RIGHT if link.take_off > col
+                      else Direction.LEFT)
+            return facing, True, False
+        middle = col * self.tile_size + self.tile_size // 2
+        past_middle = ((rect.centerx - middle) * heading.value) >= 0
+        jump = link.kind == NavigationGraph.JUMP and past_middle
+        return heading, True, jump
@@ -0,0 +1,131 @@
+
+import math
+import numpy as np
+import pygame
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, TILEMAP
+
+
+class FlatColors():
+    '''
+    Solid colors used by the observation renderer.
+    '''
+    SKY = (0, 0, 0)
+    DIRT = (120, 80, 40)
+    WATER = (40, 80, 220)
+    EXIT = (255, 220, 0)
+    PLAYER = (0, 255, 0)
+    ENEMY = (255, 0, 0)
+    DEAD_ENEMY = (96, 0, 0)
+    BULLET = (255, 255, 255)
+    GRENADE = (255, 128, 0)
+    EXPLOSION = (255, 255, 128)
+    ITEM = (0, 255, 255)
+
+
+class ObservationRenderer():
+    '''
+    Draws the visible part of the world at a tiny resolution for agents that
+    learn from pixels. Everything is a flat colored rectangle; there are no
+    backgrounds, animations, or status bars.
+
+    The renderer never blits. The terrain for the whole level is painted
+    into a NumPy strip when the level loads, and each frame copies the
+    visible slice of that strip into a pixels3d view of an offscreen surface
+    before filling in the moving objects. render() returns that same view
+    every time, indexed as [x, y, rgb], so it is only valid until the next
+    call to render(). Copy it if you need to keep it.
+    '''
+
+    def __init__(self, engine, size=(84, 84)):
+        '''
+        Creates the offscreen surface and its pixel view.
+        '''
+        self.engine = engine
+        self.width, self.height = size
+        self.scale_x = self.width / SCREEN_WIDTH
+        self.scale_y = self.height / SCREEN_HEIGHT
+        self.surface = pygame.Surface(size, depth=32)
+        self.pixels = pygame.surfarray.pixels3d(self.surface)
+        self.world_data = None
+        self.strip = None
+
+    def _build_strip(self):
+        '''
+        Paints the static terrain of the current level into a strip that is
+        as wide as the level (plus one screen of padding) at the target scale.
+        '''
+        world_data = self.engine.world_data
+        self.world_data = world_data
+        tile_size = TILEMAP.TILE_SIZE
+        strip_width = (math.ceil(len(world_data[0]) * tile_size * self.scale_x)
+                       + self.width)
+        self.strip = np.empty((strip_width, self.height, 3), dtype=np.uint8)
+        self.strip[:] = FlatColors.SKY
+
+        for idx_y, row_of_tiles in enumerate(world_data):
+            for idx_x, tile in enumerate(row_of_tiles):
+                if tile == TILEMAP.EMPTY_TILE:
+                    continue
+                elif tile <= TILEMAP.DIRT_TILE_LAST:
+                    color = FlatColors.DIRT
+                elif tile <= TILEMAP.WATER_TILE_LAST:
+                    color = FlatColors.WATER
+                elif tile == TILEMAP.LEVEL_EXIT_TILE_ID:
+                    color = FlatColors.EXIT
+                else:
+                    continue  # decorations, soldiers and items
+                x0, y0, x1, y1 = self._scale(idx_x * tile_size,
+                                             idx_y * tile_size,
+                                             tile_size, tile_size)
+                self.strip[x0:x1, y0:y1] = color
+
+    def _scale(self, x, y, width, height):
+        '''
+        Converts a rectangle from world pixels to target pixels. Objects are
+        never smaller than one pixel so that bullets don't disappear.
+        '''
+        x0 = int(x * self.scale_x)
+        y0 = int(y * self.scale_y)
+        x1 = max(x0 + 1, int((x + width) * self.scale_x))
+        y1 = max(y0 + 1, int((y + height) * self.scale_y))
+        return x0, y0, x1, y1
+
+    def _fill(self, rect, camera_x, color):
+        '''
+        Fills a sprite's rectangle in the pixel view, clipped to the edges.
+        '''
+        x0, y0, x1, y1 = self._scale(rect.x + camera_x, rect.y,
+                                     rect.width, rect.height)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        if x0 < x1 and y0 < y1:
+            self.pixels[x0:x1, y0:y1] = color
+
+    def render(self):
+        '''
+        Renders the current frame and returns the pixel view.
+        '''
+        engine = self.engine
+        if engine.world_data is not self.world_data:
+            self._build_strip()
+
+        # Terrain first, by copying the visible window out of the strip
+        offset = max(0, int(-engine.camera_scroll * self.scale_x))
+        self.pixels[:] = self.strip[offset:offset + self.width]
+
+        # Then the moving objects, with the player last so it's on top
+        camera_x = engine.camera_scroll
+        groups = engine.groups
+        for item in groups['item']:
+            self._fill(item.rect, camera_x, FlatColors.ITEM)
+        for enemy in groups['enemy']:
+            color = FlatColors.ENEMY if enemy.alive else FlatColors.DEAD_ENEMY
+            self._fill(enemy.rect, camera_x, color)
+        for bullet in groups['bullet']:
+            self._fill(bullet.rect, camera_x, FlatColors.BULLET)
+        for grenade in groups['grenade']:
+            self._fill(grenade.rect, camera_x, FlatColors.GRENADE)
+        for explosion in groups['explosion']:
+            self._fill(explosion.rect, camera_x, FlatColors.EXPLOSION)
+        self._fill(engine.player.rect, camera_x, FlatColors.PLAYER)
+        return self.pixels
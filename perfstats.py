@@ -0,0 +1,56 @@
+
+from collections import deque
+
+
+class FrameStats():
+    '''
+    Performance counters for the engine, collected over one frame at a time.
+    The engine bumps the counters as it works (e.g., rect tests in the
+    physics engine, blits while drawing) and adds up how long update() and
+    draw() took. At the end of every frame, end_frame() adds a few gauges
+    read from the world (sprites per group, enemies awake), stores all of it
+    in `last`, and starts over.
+
+    `last` is a plain dictionary, so the same numbers the overlay shows can
+    be read by a benchmark harness. The frame times of the last `history`
+    frames are kept for the frame-time graph.
+    '''
+
+    COUNTERS = ('ticks', 'rect_tests', 'blits', 'sounds')
+    TIMERS = ('update_ms', 'draw_ms')
+
+    def __init__(self, history=120):
+        '''
+        Creates a set of counters, all starting at zero.
+        '''
+        self.frames = 0
+        self.last = {}
+        self.history = {name: deque([0.0] * history, maxlen=history)
+                        for name in FrameStats.TIMERS}
+        self.reset()
+
+    def reset(self):
+        '''
+        Zeroes the counters and timers of the current frame.
+        '''
+        for name in FrameStats.COUNTERS:
+            setattr(self, name, 0)
+        for name in FrameStats.TIMERS:
+            setattr(self, name, 0.0)
+
+    def end_frame(self, engine):
+        '''
+        Finishes the current frame: stores its counters, timers, and the
+        engine's gauges in `last`, and resets for the next frame.
+        '''
+        last = {name: getattr(self, name)
+                for name in FrameStats.COUNTERS + FrameStats.TIMERS}
+        for name, group in engine.groups.items():
+            last[f'sprites_{name}'] = len(group)
+        last['enemies_awake'] = sum(1 for enemy in engine.groups['enemy']
+                                    if enemy.alive and not enemy.idling)
+        self.last = last
+        for name in FrameStats.TIMERS:
+            self.history[name].append(last[name])
+        self.frames += 1
+        self.reset()
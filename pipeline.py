@@ -0,0 +1,73 @@
+
+import threading
+
+
+class RenderThread(threading.Thread):
+    '''
+    Draws frames on a background thread so that rendering frame N overlaps
+    with simulating frame N+1. The main thread hands over an immutable
+    FrameSnapshot with submit(), keeps updating the engine, and then calls
+    wait() before it touches the screen again (fades, flips, etc.). PyGame
+    releases the GIL while blitting, so the two threads really do run at
+    the same time on a multi-core machine.
+
+    Only one frame is ever in flight, and the display itself is still
+    flipped on the main thread because some platforms require it.
+    '''
+
+    def __init__(self, engine):
+        '''
+        Creates the (not yet started) render thread for an engine.
+        '''
+        super().__init__(name='RenderThread', daemon=True)
+        self.engine = engine
+        self.snapshot = None
+        self.error = None
+        self.running = True
+        self.work_ready = threading.Event()
+        self.work_done = threading.Event()
+        self.work_done.set()
+
+    def submit(self, snapshot):
+        '''
+        Starts drawing a snapshot. Waits for the previous frame first.
+        '''
+        self.wait()
+        self.snapshot = snapshot
+        self.work_done.clear()
+        self.work_ready.set()
+
+    def wait(self):
+        '''
+        Blocks until the frame in flight has been drawn. Any exception that
+        happened on the render thread is raised again here.
+        '''
+        self.work_done.wait()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def stop(self):
+        '''
+        Finishes the frame in flight and shuts down the thread.
+        '''
+        self.work_done.wait()
+        self.running = False
+        self.work_ready.set()
+        self.join()
+
+    def run(self):
+        '''
+        Thread body: draw each snapshot as it arrives.
+        '''
+        while True:
+            self.work_ready.wait()
+            self.work_ready.clear()
+            if not self.running:
+                break
+            try:
+                self.engine.draw_snapshot(self.snapshot)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.work_done.set()
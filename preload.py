@@ -0,0 +1,58 @@
+
+import threading
+
+
+class AssetPreloader(threading.Thread):
+    '''
+    Loads assets on a background thread, e.g., while the main menu is
+    showing, so that the first shot or grenade of a session doesn't stall
+    the game while PNGs and WAVs are decoded. The loaders are (name,
+    function) pairs such as GameEngine.asset_loaders(); they run in order
+    and progress can be read at any time.
+
+    Call wait() before the game starts using the assets.
+    '''
+
+    def __init__(self, loaders):
+        '''
+        Creates the (not yet started) preloader for a list of loaders.
+        '''
+        super().__init__(name='AssetPreloader', daemon=True)
+        self.loaders = list(loaders)
+        self.total = len(self.loaders)
+        self.done = 0
+        self.current = None
+        self.error = None
+        self.finished = threading.Event()
+
+    @property
+    def progress(self):
+        '''
+        Returns the fraction of loaders that have finished, from 0 to 1.
+        '''
+        return self.done / self.total if self.total else 1.0
+
+    def wait(self):
+        '''
+        Blocks until everything is loaded. Any exception that happened on
+        the preloader thread is raised again here.
+        '''
+        self.finished.wait()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        '''
+        Thread body: run each loader in turn.
+        '''
+        try:
+            for name, loader in self.loaders:
+                self.current = name
+                loader()
+                self.done += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self.current = None
+            self.finished.set()
@@ -0,0 +1,325 @@
+
+import struct
+import zlib
+from soldier import Enemy
+from weapons import ItemBox, Bullet, Grenade, Explosion
+from settings import Action, Direction
+
+
+# Item box types in the order they are numbered in the save format
+BOX_TYPES = ['ammo', 'health', 'grenade', 'jump_buff']
+
+
+class WorldSerializer():
+    '''
+    Packs the complete dynamic world state of a GameEngine into a compact
+    binary buffer, and restores it again. Static tiles are not saved; the
+    level number is enough to reload them. Besides the sprites, the state
+    includes the scheduler's tick and the engine's random generator, which
+    the enemy AI draws from, so a restored world plays on exactly like the
+    original.
+
+    The buffer is allocated once and reused, so save() doesn't allocate
+    anything in the common case. It returns a memoryview that is only valid
+    until the next save(); copy it with bytes() to keep it.
+
+    Timers (animation, shooting, grenade fuses) run on the engine's world
+    clock, which is saved as well, so they are stored as they are and the
+    state hash covers all of it.
+    '''
+
+    MAGIC = b'SSWS'
+    VERSION = 5
+
+    # magic, version, level, camera_scroll, bg_scroll, level_complete,
+    # engine ticks, scheduler tick, and the number of enemies, items,
+    # bullets, grenades, and explosions
+    HEADER = struct.Struct('<4sBHii?IIIIIII')
+
+    # The engine's random.Random: its getstate() version, the Mersenne
+    # Twister state, and the cached Gaussian (if any)
+    RANDOM = struct.Struct('<B625I?d')
+
+    # rect (x, y, w, h), dx, dy, health, max_health, vel_x, vel_y, speed,
+    # ammo, max_ammo, grenades, max_grenades, shoot_delay, throw_delay,
+    # direction, action, frame_idx, alive, in_air, jump, jump_boost,
+    # animation_time, shoot_time, throw_time, and the enemy-only
+    # move_counter, idling, idling_counter, vision (x, y). The floats are
+    # doubles, like the engine's own, so restoring is lossless.
+    SOLDIER = struct.Struct('<iiiiiiddddiiiiiiibBH???iiiii?iii')
+
+    # rect (x, y), box type, quantity
+    ITEM = struct.Struct('<iiBi')
+
+    # rect (x, y), direction, vel_x, damage
+    BULLET = struct.Struct('<iibii')
+
+    # rect (x, y), dx, dy, vel_x, vel_y, direction, in_air, throw_time
+    GRENADE = struct.Struct('<iiiiddb?i')
+
+    # rect (x, y), frame_idx, animation_time
+    EXPLOSION = struct.Struct('<iiBi')
+
+    def __init__(self, capacity=64 * 1024):
+        '''
+        Allocates the reusable buffer. It grows if a save doesn't fit.
+        '''
+        self.buffer = bytearray(capacity)
+        self.size = 0
+
+    def _required_size(self, counts):
+        '''
+        Returns the number of bytes needed to save a world with the given
+        numbers of enemies, items, bullets, grenades, and explosions.
+        '''
+        enemies, items, bullets, grenades, explosions = counts
+        soldiers = enemies + 1
+        return (WorldSerializer.HEADER.size + WorldSerializer.RANDOM.size
+                + soldiers * WorldSerializer.SOLDIER.size
+                + items * WorldSerializer.ITEM.size
+                + bullets * WorldSerializer.BULLET.size
+                + grenades * WorldSerializer.GRENADE.size
+                + explosions * WorldSerializer.EXPLOSION.size)
+
+    def save(self, engine):
+        '''
+        Serializes the engine's world and returns a view of the bytes.
+        '''
+        groups = engine.groups
+        counts = (len(groups['enemy']), len(groups['item']),
+                  len(groups['bullet']), len(groups['grenade']),
+                  len(groups['explosion']))
+        size = self._required_size(counts)
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+
+        buffer = self.buffer
+        WorldSerializer.HEADER.pack_into(
+            buffer, 0, WorldSerializer.MAGIC, WorldSerializer.VERSION,
+            engine.level, engine.camera_scroll, engine.bg_scroll,
+            engine.level_complete, engine.ticks, engine.scheduler.tick,
+            *counts)
+        offset = WorldSerializer.HEADER.size
+        version, internal, gauss = engine.rng.getstate()
+        WorldSerializer.RANDOM.pack_into(buffer, offset, version, *internal,
+                                         gauss is not None, gauss or 0.0)
+        offset += WorldSerializer.RANDOM.size
+
+        # Soldiers, starting with the player
+        pack = WorldSerializer.SOLDIER.pack_into
+        step = WorldSerializer.SOLDIER.size
+        for soldier in (engine.player, *groups['enemy']):
+            rect = soldier.rect
+            is_enemy = isinstance(soldier, Enemy)
+            pack(buffer, offset, rect.x, rect.y, rect.width, rect.height,
+                 getattr(soldier, 'dx', 0), getattr(soldier, 'dy', 0),
+                 soldier.health, soldier.max_health,
+                 soldier.vel_x, soldier.vel_y, soldier.speed,
+                 soldier.ammo, soldier.max_ammo,
+                 soldier.grenades, soldier.max_grenades,
+                 soldier.shoot_delay, soldier.throw_delay,
+                 soldier.direction, soldier.action, soldier.frame_idx,
+                 soldier.alive, soldier.in_air, soldier.jump,
+                 soldier.jump_boost, soldier.animation_time,
+                 soldier.shoot_time, soldier.throw_time,
+                 soldier.move_counter if is_enemy else 0,
+                 soldier.idling if is_enemy else False,
+                 soldier.idling_counter if is_enemy else 0,
+                 soldier.vision.x if is_enemy else 0,
+                 soldier.vision.y if is_enemy else 0)
+            offset += step
+
+        pack = WorldSerializer.ITEM.pack_into
+        step = WorldSerializer.ITEM.size
+        for item in groups['item']:
+            pack(buffer, offset, item.rect.x, item.rect.y,
+                 BOX_TYPES.index(item.box_type), item.quantity)
+            offset += step
+
+        pack = WorldSerializer.BULLET.pack_into
+        step = WorldSerializer.BULLET.size
+        for bullet in groups['bullet']:
+            pack(buffer, offset, bullet.rect.x, bullet.rect.y,
+                 bullet.direction, bullet.vel_x, bullet.damage)
+            offset += step
+
+        pack = WorldSerializer.GRENADE.pack_into
+        step = WorldSerializer.GRENADE.size
+        for grenade in groups['grenade']:
+            pack(buffer, offset, grenade.rect.x, grenade.rect.y,
+                 getattr(grenade, 'dx', 0), getattr(grenade, 'dy', 0),
+                 grenade.vel_x, grenade.vel_y, grenade.direction,
+                 grenade.in_air, grenade.throw_time)
+            offset += step
+
+        pack = WorldSerializer.EXPLOSION.pack_into
+        step = WorldSerializer.EXPLOSION.size
+        for explosion in groups['explosion']:
+            pack(buffer, offset, explosion.rect.x, explosion.rect.y,
+                 explosion.frame_idx, explosion.animation_time)
+            offset += step
+        self.size = offset
+        return memoryview(buffer)[:offset]
+
+    def state_hash(self):
+        '''
+        Returns a CRC32 of the most recent save. Peers can compare hashes
+        every frame to detect a desync.
+        '''
+        return zlib.crc32(memoryview(self.buffer)[:self.size])
+
+    def load(self, engine, data=None):
+        '''
+        Restores a saved world into an engine. Without data, the most recent
+        save from this serializer is used. Existing sprites are reused where
+        possible so that restoring every frame stays cheap. The level's
+        static tiles are only reloaded if the level changed.
+        '''
+        if data is None:
+            data = memoryview(self.buffer)[:self.size]
+        (magic, version, level, camera_scroll, bg_scroll, level_complete,
+         ticks, tick, *counts) = WorldSerializer.HEADER.unpack_from(data, 0)
+        if magic != WorldSerializer.MAGIC or version != WorldSerializer.VERSION:
+            raise ValueError('Not a compatible world state')
+        n_enemies, n_items, n_bullets, n_grenades, n_explosions = counts
+
+        if engine.level != level or getattr(engine, 'player', None) is None:
+            engine.level = level
+            engine.load_current_level()
+        engine.camera_scroll = camera_scroll
+        engine.bg_scroll = bg_scroll
+        engine.level_complete = level_complete
+        engine.ticks = ticks
+        engine.scheduler.tick = tick
+        groups = engine.groups
+        offset = WorldSerializer.HEADER.size
+        (random_version, *internal, has_gauss, gauss) = \
+            WorldSerializer.RANDOM.unpack_from(data, offset)
+        engine.rng.setstate((random_version, tuple(internal),
+                             gauss if has_gauss else None))
+        offset += WorldSerializer.RANDOM.size
+
+        # Soldiers, starting with the player
+        enemies = _reuse(groups['enemy'], n_enemies,
+                         lambda: Enemy(0, 0, env=engine.env))
+        unpack = WorldSerializer.SOLDIER.unpack_from
+        step = WorldSerializer.SOLDIER.size
+        for soldier in (engine.player, *enemies):
+            (x, y, width, height, soldier.dx, soldier.dy,
+             soldier.health, soldier.max_health, soldier.vel_x, soldier.vel_y,
+             soldier.speed, soldier.ammo, soldier.max_ammo,
+             soldier.grenades, soldier.max_grenades,
+             soldier.shoot_delay, soldier.throw_delay,
+             direction, action, soldier.frame_idx,
+             soldier.alive, soldier.in_air, soldier.jump,
+             soldier.jump_boost, soldier.animation_time, soldier.shoot_time,
+             soldier.throw_time, move_counter, idling, idling_counter,
+             vision_x, vision_y) = unpack(data, offset)
+            offset += step
+            soldier.rect.update(x, y, width, height)
+            soldier.direction = Direction(direction)
+            soldier.action = Action(action)
+            soldier.image = soldier.animations[action][soldier.frame_idx]
+            if isinstance(soldier, Enemy):
+                soldier.move_counter = move_counter
+                soldier.idling = idling
+                soldier.idling_counter = idling_counter
+                soldier.vision.topleft = (vision_x, vision_y)
+
+        items = _reuse(groups['item'], n_items, lambda: ItemBox(0, 0))
+        unpack = WorldSerializer.ITEM.unpack_from
+        step = WorldSerializer.ITEM.size
+        for item in items:
+            x, y, box_type, item.quantity = unpack(data, offset)
+            offset += step
+            item.box_type = BOX_TYPES[box_type]
+            item.image = ItemBox.images[item.box_type]
+            item.rect = item.image.get_rect(topleft=(x, y))
+
+        bullets = _reuse(groups['bullet'], n_bullets,
+                         lambda: Bullet(0, 0, Direction.RIGHT, engine.env))
+        unpack = WorldSerializer.BULLET.unpack_from
+        step = WorldSerializer.BULLET.size
+        for bullet in bullets:
+            x, y, direction, bullet.vel_x, bullet.damage = unpack(data, offset)
+            offset += step
+            bullet.direction = Direction(direction)
+            bullet.rect.topleft = (x, y)
+
+        grenades = _reuse(groups['grenade'], n_grenades,
+                          lambda: Grenade(0, 0, Direction.RIGHT, engine.env))
+        unpack = WorldSerializer.GRENADE.unpack_from
+        step = WorldSerializer.GRENADE.size
+        for grenade in grenades:
+            (x, y, grenade.dx, grenade.dy, grenade.vel_x, grenade.vel_y,
+             direction, grenade.in_air, grenade.throw_time) = \
+                unpack(data, offset)
+            offset += step
+            grenade.direction = Direction(direction)
+            grenade.rect.topleft = (x, y)
+
+        explosions = _reuse(groups['explosion'], n_explosions,
+                            lambda: Explosion(0, 0))
+        unpack = WorldSerializer.EXPLOSION.unpack_from
+        step = WorldSerializer.EXPLOSION.size
+        for explosion in explosions:
+            x, y, explosion.frame_idx, explosion.animation_time = \
+                unpack(data, offset)
+            offset += step
+            explosion.image = explosion.animations[explosion.frame_idx]
+            explosion.rect.topleft = (x, y)
+
+        # The animator and triggers still describe the old world. Anything
+        # the player touched when the state was saved has already had its
+        # effect, so entering it again on the next tick is harmless.
+        engine.restart_animations()
+        engine.index_item_boxes()
+        engine.triggers.forget(engine.player)
+
+
+def _reuse(group, count, factory):
+    '''
+    Returns exactly count sprites from a group, in group order, creating new
+    ones with the factory or killing surplus ones as needed.
+    '''
+    sprites = list(group)
+    for sprite in sprites[count:]:
+        sprite.kill()
+    del sprites[count:]
+    while len(sprites) < count:
+        sprite = factory()
+        group.add(sprite)
+        sprites.append(sprite)
+    return sprites
+
+
+class CheckpointRing():
+    '''
+    Keeps the last few frames of world state in preallocated buffers for
+    rollback. Saving a frame overwrites the oldest one.
+    '''
+
+    def __init__(self, frames=8):
+        '''
+        Creates one serializer per slot.
+        '''
+        self.slots = [WorldSerializer() for _ in range(frames)]
+        self.frame_ids = [None] * frames
+
+    def save(self, frame, engine):
+        '''
+        Saves the world for a frame number and returns its state hash.
+        '''
+        slot = frame % len(self.slots)
+        self.slots[slot].save(engine)
+        self.frame_ids[slot] = frame
+        return self.slots[slot].state_hash()
+
+    def load(self, frame, engine):
+        '''
+        Rolls the engine back to a saved frame.
+        '''
+        slot = frame % len(self.slots)
+        if self.frame_ids[slot] != frame:
+            raise KeyError(f'Frame {frame} is no longer saved')
+        self.slots[slot].load(engine)
@@ -4,35 +4,47 @@ from dataclasses import dataclass
 
 # Display screen
 FPS = 60
+TICK_RATE = 60       # simulation steps per second; fixed, physics is per tick
+MAX_FRAME_LAG = 250  # ms of simulation that one slow frame may catch up on
+IDLE_WAIT = 500      # ms the idle menu or a paused game sleeps between redraws
+RENDER_SCALE = 1.0   # size of the internal render surface, relative to window
+PIXEL_COLLISIONS = False  # check bullet hits against sprite masks, not rects
 SCREEN_WIDTH = 1200
 SCREEN_HEIGHT = int(SCREEN_WIDTH * 0.6)
 SCROLL_THRESHOLD = SCREEN_WIDTH // 6
 SCROLL_RIGHT = SCREEN_WIDTH - SCROLL_THRESHOLD
 SCROLL_LEFT = SCROLL_THRESHOLD
 
+# Ticks between update()s of the sprite groups that have behavior; the other
+# groups (tiles, item boxes, grenades, explosions) are never updated
+UPDATE_INTERVALS = {'enemy': 1, 'bullet': 1}
+
 class GameModes(IntEnum):
     MENU = 0
     INTERACTIVE = 1
     QUIT = 2
 
+# Physics and weapon parameters. Every GameEngine carries one of these and
+# hands it to the sprites it creates, so engines with different settings can
+# share a process; use dataclasses.replace(ENVIRONMENT, ...) to make one.
 @dataclass(frozen=True)
 class EnvironmentSettings:
-    GRAVITY = 0.70
-    SOLDIER_JUMP_STRENGTH = -11
-    BULLET_FULL_DAMAGE = 25
-    BULLET_VELOCITY_X = 15
-    GRENADE_FULL_DAMAGE = 100
-    GRENADE_INNER_RADIUS = 50  # pixels from grenade
-    GRENADE_OUTER_RADIUS = 200 # pixels from grenade
-    GRENADE_VELOCITY_X = 7
-    GRENADE_VELOCITY_Y = -11
-    GRENADE_FUSE_TIME = 1500
-    PLAYER_SHOOT_DELAY = 200
-    PLAYER_THROW_DELAY = 1500
-    SOLDIER_SHOOT_DELAY = 500
-    SOLDIER_THROW_DELAY = 2000
-    SOLDIER_SCALE = 1.65
-    ANIMATION_DELAY = 100
+    GRAVITY: float = 0.70
+    SOLDIER_JUMP_STRENGTH: int = -11
+    BULLET_FULL_DAMAGE: int = 25
+    BULLET_VELOCITY_X: int = 15
+    GRENADE_FULL_DAMAGE: int = 100
+    GRENADE_INNER_RADIUS: int = 50  # pixels from grenade
+    GRENADE_OUTER_RADIUS: int = 200 # pixels from grenade
+    GRENADE_VELOCITY_X: int = 7
+    GRENADE_VELOCITY_Y: int = -11
+    GRENADE_FUSE_TIME: int = 1500
+    PLAYER_SHOOT_DELAY: int = 200
+    PLAYER_THROW_DELAY: int = 1500
+    SOLDIER_SHOOT_DELAY: int = 500
+    SOLDIER_THROW_DELAY: int = 2000
+    SOLDIER_SCALE: float = 1.65  # images are shared, so not per engine
+    ANIMATION_DELAY: int = 100
 
 # TODO: define TILE_SIZE from the image dimensions instead of hardcoded value
 @dataclass(frozen=True)
@@ -0,0 +1,384 @@
+
+import os
+import math
+import multiprocessing
+import pygame
+from engine import GameEngine
+from soldier import Enemy
+from weapons import Bullet, Grenade
+from settings import (SCREEN_WIDTH, TILEMAP, ENVIRONMENT, Action, Direction,
+                      GameModes)
+
+
+# The kinds of sprites that move between strips
+HANDOFF_GROUPS = ('enemy', 'bullet', 'grenade')
+
+
+def pack_sprite(kind, sprite, now):
+    '''
+    Returns the state of an enemy, bullet, or grenade as a tuple of plain
+    values that can be sent to another process. Timers are stored relative
+    to now, the sending engine's world time, so they don't depend on when
+    each engine's clock started.
+    '''
+    x, y = sprite.rect.topleft
+    if kind == 'enemy':
+        return (kind, x, y, sprite.speed, sprite.direction, sprite.vel_x,
+                sprite.vel_y, sprite.in_air, sprite.health, sprite.ammo,
+                sprite.grenades, sprite.alive, sprite.action,
+                sprite.frame_idx, sprite.animation_time - now,
+                sprite.shoot_time - now, sprite.throw_time - now,
+                sprite.move_counter, sprite.idling, sprite.idling_counter,
+                sprite.vision.topleft)
+    if kind == 'bullet':
+        return (kind, x, y, sprite.direction, sprite.vel_x, sprite.damage)
+    return (kind, x, y, sprite.direction, sprite.vel_x, sprite.vel_y,
+            sprite.in_air, sprite.throw_time - now)
+
+
+def unpack_sprite(state, now, env):
+    '''
+    Creates a sprite from a tuple made by pack_sprite(), following env.
+    Returns the kind and the sprite.
+    '''
+    kind, x, y = state[:3]
+    if kind == 'enemy':
+        (speed, direction, vel_x, vel_y, in_air, health, ammo, grenades,
+         alive, action, frame_idx, animation_time, shoot_time, throw_time,
+         move_counter, idling, idling_counter, vision) = state[3:]
+        sprite = Enemy(0, 0, speed, env=env)
+        sprite.vel_x, sprite.vel_y, sprite.in_air = vel_x, vel_y, in_air
+        sprite.health, sprite.ammo, sprite.grenades = health, ammo, grenades
+        sprite.alive = alive
+        sprite.action = Action(action)
+        sprite.frame_idx = frame_idx
+        sprite.image = sprite.animations[action][frame_idx]
+        sprite.animation_time = now + animation_time
+        sprite.shoot_time = now + shoot_time
+        sprite.throw_time = now + throw_time
+        sprite.move_counter = move_counter
+        sprite.idling = idling
+        sprite.idling_counter = idling_counter
+        sprite.vision.topleft = vision
+    elif kind == 'bullet':
+        direction, vel_x, damage = state[3:]
+        sprite = Bullet(0, 0, Direction(direction), env)
+        sprite.vel_x, sprite.damage = vel_x, damage
+    else:
+        direction, vel_x, vel_y, in_air, throw_time = state[3:]
+        sprite = Grenade(0, 0, Direction(direction), env, now + throw_time)
+        sprite.vel_x, sprite.vel_y, sprite.in_air = vel_x, vel_y, in_air
+    sprite.direction = Direction(direction)
+    sprite.rect.topleft = (x, y)
+    return kind, sprite
+
+
+class StripEngine(GameEngine):
+    '''
+    A headless engine that runs in a worker process and simulates the part
+    of a level that is far away from the player: a range of strips, minus
+    the strips around the player, which the parent simulates itself. Since
+    there's no player nearby, enemies only patrol, and bullets and grenades
+    only hurt enemies.
+    '''
+
+    def __init__(self, strip_width, env=ENVIRONMENT):
+        '''
+        Creates an engine that doesn't own any strips yet.
+        '''
+        super().__init__(None, GameModes.INTERACTIVE, env)
+        self.strip_width = strip_width
+        self.first_strip = 0
+        self.last_strip = -1
+
+    def strip_of(self, sprite):
+        '''
+        Returns the index of the strip a sprite is in.
+        '''
+        return min(max(0, sprite.rect.centerx // self.strip_width),
+                   (self.world_width - 1) // self.strip_width)
+
+    def owns(self, strip, active):
+        '''
+        Returns True if this worker simulates a strip, given the range of
+        strips that the parent is simulating.
+        '''
+        return (self.first_strip <= strip <= self.last_strip
+                and not active[0] <= strip <= active[1])
+
+    def load_strips(self, level, first_strip, last_strip, active):
+        '''
+        Loads a level and keeps only the enemies in the strips this worker
+        simulates. The parent loads the same level and drops those.
+        '''
+        self.level = level
+        self.first_strip, self.last_strip = first_strip, last_strip
+        self.load_current_level()
+        for enemy in list(self.groups['enemy']):
+            if not self.owns(self.strip_of(enemy), active):
+                self.animator.remove(enemy)
+                enemy.kill()
+        return len(self.groups['enemy'])
+
+    def adopt(self, states):
+        '''
+        Adds the sprites handed over by the parent.
+        '''
+        for state in states:
+            kind, sprite = unpack_sprite(state, self.now, self.env)
+            self.groups[kind].add(sprite)
+            if kind == 'enemy':
+                self.animator.add(sprite)
+
+    def release(self, active):
+        '''
+        Removes and returns the sprites that left this worker's strips.
+        '''
+        states = []
+        for kind in HANDOFF_GROUPS:
+            for sprite in list(self.groups[kind]):
+                if not self.owns(self.strip_of(sprite), active):
+                    states.append(pack_sprite(kind, sprite, self.now))
+                    if kind == 'enemy':
+                        self.animator.remove(sprite)
+                    sprite.kill()
+        return states
+
+    def handle_bullet_damage(self):
+        '''
+        Bullets only hit enemies out here.
+        '''
+        for enemy in self.groups['enemy']:
+            for bullet in self.bullets_hitting(enemy):
+                if enemy.health >= 0:
+                    enemy.health -= bullet.damage
+                    bullet.kill()
+
+    def make_grenades_explode(self):
+        '''
+        Grenades only hurt enemies out here, and nobody sees the explosion.
+        '''
+        for grenade in self.groups['grenade']:
+            if grenade.exploding(self.now):
+                for enemy in self.groups['enemy']:
+                    enemy.health -= grenade.damage_at(enemy.rect)
+                grenade.kill()
+
+    def update(self, controller=None):
+        '''
+        Runs one tick of the strips.
+        '''
+        self.advance_clock()
+        for enemy in self.groups['enemy']:
+            if enemy.alive:
+                enemy.ai_move(self.world_data, TILEMAP.TILE_SIZE, self.rng)
+                if enemy.health <= 0:
+                    enemy.death()
+        for enemy in self.groups['enemy']:
+            self.apply_physics(enemy)
+        for grenade in self.groups['grenade']:
+            self.apply_physics(grenade)
+        self.stop_bullets_at_obstacles()
+        self.handle_bullet_damage()
+        self.make_grenades_explode()
+        self.scheduler.update()
+        self.remove_stray_bullets()
+        self.animator.update()
+
+
+def run_strip_worker(conn, strip_width, env):
+    '''
+    Body of a worker process: answers load and tick requests from a
+    ShardedEngine until it is told to stop.
+    '''
+    pygame.init()
+    pygame.mixer.init()
+    pygame.display.set_mode((1, 1))
+    engine = StripEngine(strip_width, env)
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == 'tick':
+                _, active, states = message
+                engine.adopt(states)
+                engine.update()
+                conn.send(engine.release(active))
+            elif message[0] == 'load':
+                conn.send(engine.load_strips(*message[1:]))
+            else:
+                break
+    finally:
+        pygame.quit()
+
+
+class ShardedEngine(GameEngine):
+    '''
+    A GameEngine for very wide levels that splits the world into vertical
+    strips and hands the ones far from the player to worker processes. The
+    strip with the player and its neighbors stay in this engine, so the
+    player sees exactly what a normal GameEngine would do; those strips
+    are at least a screen wide, which is farther than enemies can see or
+    grenades reach. The rest of the level is divided between the workers.
+
+    Every tick, the enemies, bullets, and grenades that left the player's
+    strips are sent to the worker that owns their strip, and every worker
+    simulates one tick while this engine does. Then the engine waits for
+    all of the workers (a barrier) and takes over whatever they say has
+    come into the player's strips. Sprites that cross from one worker's
+    strips to another's go through here and sit out one tick on the way.
+
+    The workers are spawned, not forked, so each of them starts a fresh
+    interpreter that imports the __main__ module of the program again.
+    A program using this engine must keep everything with a side effect
+    (initializing pygame, opening the display, creating engines) under an
+    `if __name__ == '__main__'` guard, or every worker would repeat it.
+    '''
+
+    def __init__(self, screen=None, game_mode=GameModes.MENU, workers=2,
+                 strip_cols=None, env=ENVIRONMENT):
+        '''
+        Creates the engine; the workers are started with the first level.
+        '''
+        if strip_cols is None:
+            strip_cols = math.ceil(SCREEN_WIDTH / TILEMAP.TILE_SIZE)
+        self.strip_width = strip_cols * TILEMAP.TILE_SIZE
+        self.worker_count = workers
+        self.connections = []
+        self.processes = []
+        self.pending = []
+        self.handoffs = 0
+        super().__init__(screen, game_mode, env)
+
+    def start_workers(self):
+        '''
+        Starts the worker processes. They're spawned rather than forked,
+        since a forked copy of an initialized SDL isn't safe to use. The
+        dummy drivers keep the workers from opening windows or audio
+        devices of their own.
+        '''
+        context = multiprocessing.get_context('spawn')
+        drivers = {'SDL_VIDEODRIVER': 'dummy', 'SDL_AUDIODRIVER': 'dummy'}
+        saved = {name: os.environ.get(name) for name in drivers}
+        os.environ.update(drivers)
+        try:
+            for _ in range(self.worker_count):
+                conn, child_conn = context.Pipe()
+                process = context.Process(target=run_strip_worker,
+                                          args=(child_conn, self.strip_width,
+                                                self.env),
+                                          daemon=True)
+                process.start()
+                self.connections.append(conn)
+                self.processes.append(process)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = value
+
+    def stop_workers(self):
+        '''
+        Shuts down the worker processes.
+        '''
+        for conn in self.connections:
+            conn.send(('stop',))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def strip_of(self, sprite):
+        '''
+        Returns the index of the strip a sprite is in.
+        '''
+        return min(max(0, sprite.rect.centerx // self.strip_width),
+                   self.strip_count - 1)
+
+    def assign_strips(self):
+        '''
+        Divides the strips of the level between the workers, as evenly as
+        possible and in order: strip_ranges holds the (first, last) strips
+        of each worker (first > last if a worker has none), and owners maps
+        every strip back to its worker.
+        '''
+        self.strip_ranges = [
+            (idx * self.strip_count // self.worker_count,
+             (idx + 1) * self.strip_count // self.worker_count - 1)
+            for idx in range(self.worker_count)]
+        self.owners = [idx for idx, (first, last)
+                       in enumerate(self.strip_ranges)
+                       for _ in range(first, last + 1)]
+
+    def owner(self, strip):
+        '''
+        Returns the index of the worker that owns a strip.
+        '''
+        return self.owners[strip]
+
+    def active_strips(self):
+        '''
+        Returns the (first, last) strips that this engine simulates: the
+        player's strip and its neighbors.
+        '''
+        strip = self.strip_of(self.player)
+        return strip - 1, strip + 1
+
+    def load_current_level(self):
+        '''
+        Loads a level here and in every worker. Each worker keeps the
+        enemies in its strips, and this engine keeps the rest.
+        '''
+        super().load_current_level()
+        self.strip_count = max(1, math.ceil(self.world_width
+                                            / self.strip_width))
+        self.assign_strips()
+        if not self.connections:
+            self.start_workers()
+        self.pending = [[] for _ in self.connections]
+        active = self.active_strips()
+        for conn, (first, last) in zip(self.connections, self.strip_ranges):
+            conn.send(('load', self.level, first, last, active))
+        for enemy in list(self.groups['enemy']):
+            strip = self.strip_of(enemy)
+            if not active[0] <= strip <= active[1]:
+                self.animator.remove(enemy)
+                enemy.kill()
+        for conn in self.connections:
+            conn.recv()
+
+    def update(self, controller):
+        '''
+        Runs one tick here and in every worker at the same time.
+        '''
+        # Hand over the sprites that left the player's strips
+        active = self.active_strips()
+        for kind in HANDOFF_GROUPS:
+            for sprite in list(self.groups[kind]):
+                strip = self.strip_of(sprite)
+                if not active[0] <= strip <= active[1]:
+                    self.pending[self.owner(strip)].append(
+                        pack_sprite(kind, sprite, self.now))
+                    if kind == 'enemy':
+                        self.animator.remove(sprite)
+                    sprite.kill()
+                    self.handoffs += 1
+        for conn, states in zip(self.connections, self.pending):
+            conn.send(('tick', active, states))
+        self.pending = [[] for _ in self.connections]
+
+        super().update(controller)
+
+        # Wait for every worker, then take over the sprites that came into
+        # the player's strips and pass the others on to their new workers
+        for conn in self.connections:
+            for state in conn.recv():
+                kind, sprite = unpack_sprite(state, self.now, self.env)
+                strip = self.strip_of(sprite)
+                if active[0] <= strip <= active[1]:
+                    self.groups[kind].add(sprite)
+                    if kind == 'enemy':
+                        self.animator.add(sprite)
+                    self.handoffs += 1
+                else:
+                    self.pending[self.owner(strip)].append(state)
@@ -1,117 +1,137 @@
 
 import pygame
-from controller import GameController
-from widgets import GameButton, GameFade, FadeType
+import argparse
+from agents import HeuristicAgent
+from pipeline import RenderThread
+from latency import LatencyProbe
+from allocations import AllocationTracker
+from preload import AssetPreloader
+from capture import FrameRecorder
+from controller import GameController, handle_keyboard_events
+from widgets import (GameButton, GameFade, FadeType, PerfOverlay, LoadingBar,
+                     TextBar)
 from engine import GameEngine, GameModes
-from settings import SCREEN_WIDTH, SCREEN_HEIGHT, FPS, COLOR
-
-# Create IO devices:
-#  1) graphic display for output
-#  2) controller for input
-#  3) the main game engine
-#  4) a clock to keep time
-pygame.init()
-pygame.mixer.init()
-pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption('Shooter')
-screen = pygame.display.get_surface()
-controller = GameController()
-engine = GameEngine(screen)
-clock = pygame.time.Clock()
-
-
-def handle_keyboard_events(event: pygame.event.Event, 
-                           controller: GameController) -> GameController:
-    ''' 
-    Process player keystrokes and returns the current button combination.
-    '''
+from sharding import ShardedEngine
+from settings import (SCREEN_WIDTH, SCREEN_HEIGHT, FPS, TICK_RATE,
+                      MAX_FRAME_LAG, IDLE_WAIT, RENDER_SCALE, COLOR)
 
-    # Find which keys have been pressed
-    if event.type == pygame.KEYDOWN:
-        if event.key == pygame.K_a:
-            controller.mleft = True
-        if event.key == pygame.K_d:
-            controller.mright = True
-        if event.key == pygame.K_w:
-            controller.jump = True
-        if event.key == pygame.K_SPACE:
-            controller.shoot = True
-        if event.key == pygame.K_q:
-            controller.throw = True
-
-    # Find which keys have been released
-    if event.type == pygame.KEYUP:
-        if event.key == pygame.K_a:
-            controller.mleft = False
-        if event.key == pygame.K_d:
-            controller.mright = False
-        if event.key == pygame.K_w:
-            controller.jump = False
-        if event.key == pygame.K_SPACE:
-            controller.shoot = False    
-        if event.key == pygame.K_q:
-            controller.throw = False
-    
-    # Return the current state of the controller
-    return controller
+
+def wait_for_events(timeout: int) -> list:
+    '''
+    Sleeps until at least one event arrives or timeout ms have passed, and
+    returns the events (possibly none).
+    '''
+    event = pygame.event.wait(timeout)
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
 
 
 def run_main_menu(engine: GameEngine, 
                   controller: GameController, 
                   screen: pygame.Surface,
-                  events: pygame.event) -> None:
+                  events: pygame.event,
+                  redraw: bool = True) -> bool:
     '''
     Displays the main menu. This interface is the primary method for human
     players to click on a button and start a new, interactive game.
+
+    The menu is only drawn when something may have changed: when redraw is
+    set, on any input, or when the mouse moves onto or off a button. Moving
+    the mouse around otherwise costs nothing. Returns True if it drew.
     '''
+    for event in events:
+        if event.type == pygame.MOUSEMOTION:
+            for button in (start_button, exit_button):
+                redraw = button.hover(event.pos) or redraw
+        else:
+            redraw = True
 
     # Draw the main menu
-    screen.fill(COLOR.BACKGROUND)
-    start_button.draw(screen)
-    exit_button.draw(screen)
-
-    # Handle button clicks
-    if start_button.is_clicked():
-        engine.game_mode = GameModes.INTERACTIVE
-        engine.load_current_level()
-        intro_fade.begin_fade()
-    if exit_button.is_clicked():
-        engine.game_mode = GameModes.QUIT
-
-    # Handle the various ways to quit game
+    if redraw:
+        screen.fill(COLOR.BACKGROUND)
+        start_button.draw(screen)
+        exit_button.draw(screen)
+
+        # Show how far along the assets are while they load in the background
+        if not preloader.finished.is_set():
+            loading_bar.draw(screen, preloader.progress,
+                             f'Loading {preloader.current or ""}...')
+
     for event in events:
+        # Handle button clicks; the game can only start once everything is
+        # loaded
+        if start_button.clicked_by(event):
+            preloader.wait()
+            engine.game_mode = GameModes.INTERACTIVE
+            engine.load_current_level()
+            intro_fade.begin_fade()
+        elif exit_button.clicked_by(event):
+            engine.game_mode = GameModes.QUIT
+
+        # Handle the various ways to quit game
         if (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
                 or event.type == pygame.QUIT):
             engine.game_mode = GameModes.QUIT
 
-    # Nothing particularly important to return
-    return None
+    return redraw
 
 
 def run_interactive_game(engine: GameEngine,
                          controller: GameController, 
                          screen: pygame.Surface,
-                         events: pygame.event) -> None:
+                         events: pygame.event,
+                         renderer: RenderThread = None,
+                         ticks: int = 1,
+                         alpha: float = 1.0,
+                         last_alpha: float = 1.0) -> None:
     '''
     Plays an interactive game between a human player and the computer AI. If
     the player advances to the next level, we will stay in interactive mode.
     But if the player dies, we will return to the main menu.
+
+    Each call runs a number of fixed-length simulation ticks (possibly zero)
+    and then draws one frame, with the sprites and camera interpolated alpha
+    of the way from the previous tick to the latest one.
+
+    With a renderer, the game is pipelined: the previous frame is drawn on
+    the render thread while this frame is simulated, which costs one frame
+    of display latency. The frame drawn is the state the previous call left
+    behind, so it is interpolated by that call's alpha, last_alpha.
     '''
 
+    # Handle the controller inputs first, so that keys pressed since the
+    # last frame already count in this frame's simulation
+    for event in events:
+        if event.type == pygame.QUIT:
+            engine.game_mode = GameModes.QUIT
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            engine.game_mode = GameModes.QUIT
+        controller = handle_keyboard_events(event, controller)
+
     # Update the position of all physics-controlled sprites
-    engine.update(controller)
-    engine.draw()
+    if renderer is None:
+        for _ in range(ticks):
+            engine.remember_positions()
+            engine.update(controller)
+        engine.draw(alpha)
+    else:
+        renderer.submit(engine.snapshot(last_alpha))
+        for _ in range(ticks):
+            engine.remember_positions()
+            engine.update(controller)
+        renderer.wait()
 
     # Special case #1: begin a new level
     if not intro_fade.finished:
-        intro_fade.draw_fade(screen)
+        intro_fade.draw_fade(screen, ticks)
 
     # Special case #2: player dies, restart same level
     if not engine.player.alive:
         if not death_fade.started:
             death_fade.begin_fade()
         if not death_fade.finished:
-            death_fade.draw_fade(screen)
+            death_fade.draw_fade(screen, ticks)
         else:
             death_fade.end_fade()
             engine.load_current_level()
@@ -122,30 +142,96 @@ def run_interactive_game(engine: GameEngine,
         if not level_fade.started:
             level_fade.begin_fade()
         if not level_fade.finished:
-            level_fade.draw_fade(screen)
+            level_fade.draw_fade(screen, ticks)
         else:
             level_fade.end_fade()
             engine.game_mode = GameModes.INTERACTIVE
             engine.load_next_level()
             intro_fade.begin_fade()
 
-    # Handle the various controller inputs to the game
-    for event in events:
-        if event.type == pygame.QUIT:
-            engine.game_mode = GameModes.QUIT
-        elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-            engine.game_mode = GameModes.QUIT
-        controller = handle_keyboard_events(event, controller)
-
     # Nothing particularly important to return
     return None
 
 
 if __name__ == '__main__':
     '''
-    Entry point to the program, runs the main game loop.
+    Entry point to the program, runs the main game loop. Everything with a
+    side effect stays below this line: the sharded engine's workers are
+    spawned, and a spawned process imports this module again.
     '''
 
+    # Optionally let the scripted bot play instead of the keyboard
+    parser = argparse.ArgumentParser(description='Side-scrolling shooter.')
+    parser.add_argument('--bot', action='store_true',
+                        help='let the built-in bot control the player')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='draw on a separate thread while simulating')
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help='maximum frames drawn per second (0 = no limit)')
+    parser.add_argument('--render-scale', type=float, default=RENDER_SCALE,
+                        help='draw the world at this fraction of the window '
+                             'size, e.g. 0.5, and stretch it to fit')
+    parser.add_argument('--pixel-collisions', action='store_true',
+                        help='check bullet hits against the sprite masks')
+    parser.add_argument('--measure-latency', action='store_true',
+                        help='report key press to display latency on exit')
+    parser.add_argument('--track-allocations', action='store_true',
+                        help='report allocations per engine stage on exit')
+    parser.add_argument('--alloc-budget', type=float, default=None,
+                        help='count frames allocating more KiB than this')
+    parser.add_argument('--capture', metavar='DIR', default=None,
+                        help='record every frame into this directory')
+    parser.add_argument('--capture-format', choices=FrameRecorder.FORMATS,
+                        default='png', help='PNG sequence or raw RGB video')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='simulate the far parts of the level in this '
+                             'many worker processes')
+    args = parser.parse_args()
+    if args.track_allocations and args.pipelined:
+        # tracemalloc can't tell threads apart, so whatever the render thread
+        # allocates would be charged to the stage that happens to be running
+        parser.error('--track-allocations does not work with --pipelined')
+
+    # Create IO devices:
+    #  1) graphic display for output
+    #  2) controller for input
+    #  3) the main game engine
+    #  4) a clock to keep time
+    pygame.init()
+    pygame.mixer.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption('Shooter')
+    screen = pygame.display.get_surface()
+    controller = GameController()
+    if args.shards > 0:
+        engine = ShardedEngine(screen, workers=args.shards)
+    else:
+        engine = GameEngine(screen)
+    clock = pygame.time.Clock()
+    engine.set_render_scale(args.render_scale)
+    engine.pixel_collisions = args.pixel_collisions or engine.pixel_collisions
+    loaders = GameEngine.asset_loaders()
+    if engine.canvas is not None:
+        loaders.append(('scaled images', engine.prescale_images))
+    preloader = AssetPreloader(loaders)
+    preloader.start()
+    agent = HeuristicAgent() if args.bot else None
+    renderer = RenderThread(engine) if args.pipelined else None
+    if renderer is not None:
+        renderer.start()
+    probe = None
+    if args.measure_latency:
+        probe = LatencyProbe(pipeline_depth=0 if renderer is None else 1)
+    tracker = None
+    if args.track_allocations:
+        tracker = AllocationTracker(args.alloc_budget)
+        tracker.instrument(engine)
+        tracker.start()
+    recorder = None
+    if args.capture is not None:
+        recorder = FrameRecorder(args.capture, args.capture_format)
+        recorder.start()
+
     # Create the buttons for use on the main menudisplay
     start_button_img = pygame.image.load('img/start_btn.png').convert_alpha()
     start_button_x = SCREEN_WIDTH // 2 - start_button_img.get_width() // 2
@@ -155,22 +241,115 @@ if __name__ == '__main__':
     exit_button_x = SCREEN_WIDTH // 2 - exit_button_img.get_width() // 2
     exit_button_y = SCREEN_HEIGHT // 2 - exit_button_img.get_height() + 100
     exit_button = GameButton(exit_button_img, exit_button_x, exit_button_y)
+    loading_bar = LoadingBar(SCREEN_WIDTH // 2 - 150, SCREEN_HEIGHT - 60,
+                             COLOR.WHITE)
 
     # Define notable game transitions
     intro_fade = GameFade(FadeType.INTRO_EVENT, COLOR.BLACK)
     level_fade = GameFade(FadeType.LEVEL_EVENT, COLOR.BLACK)
     death_fade = GameFade(FadeType.DEATH_EVENT, COLOR.PINK)
 
+    # F3 shows and hides the performance overlay
+    overlay = PerfOverlay(engine.stats)
+
+    # P pauses and resumes the game, and so does leaving the window while a
+    # human is playing. A paused game keeps its last frame on the screen,
+    # and its world doesn't notice the time it spent paused, since the
+    # world's clock only moves when it ticks.
+    pause_text = TextBar(SCREEN_WIDTH // 2 - 40, SCREEN_HEIGHT // 2 - 15,
+                         COLOR.WHITE)
+    paused = False
+
+    # The simulation runs in fixed-length ticks, independent of how fast
+    # frames are drawn. Real time accumulates as lag, and each frame runs
+    # however many ticks fit into it. After a very slow frame we give up on
+    # catching up completely rather than fall further and further behind.
+    # The tick rate is fixed, since speeds and gravity are all per tick.
+    tick_length = 1000 / TICK_RATE
+    lag = 0.0
+    alpha = 1.0
+
     # The main game loop has several states, each handled separately:
     #   1. 'Menu' where the player can choose between options
     #   2. 'Interactive' where a human player plays the game
+    # When there is nothing to animate (a paused game, or a menu that is
+    # already on the screen), the loop sleeps until the next event instead
+    # of drawing the same frame over and over, and flips only what it drew.
+    shown_mode = None
+    was_loading = False
     while engine.game_mode != GameModes.QUIT:
-        events = pygame.event.get()
-        if engine.game_mode == GameModes.MENU:
-            run_main_menu(engine, controller, screen, events)
+        loading = not preloader.finished.is_set()
+        menu_changed = engine.game_mode != shown_mode or loading or was_loading
+        idle = paused or (engine.game_mode == GameModes.MENU
+                                         and not menu_changed)
+        if idle:
+            events = wait_for_events(IDLE_WAIT)
+            clock.tick()  # time spent asleep doesn't count towards a frame
+        else:
+            events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                overlay.toggle()
+            if engine.game_mode != GameModes.INTERACTIVE:
+                continue
+            if (event.type == pygame.KEYDOWN and event.key == pygame.K_p
+                    or event.type == pygame.WINDOWFOCUSLOST
+                    and agent is None and not paused):
+                paused = not paused
+                if paused:
+                    pause_text.draw(screen, 'PAUSED')
+                else:
+                    controller.reset()  # keys may have been let go since
+        drawn = True
+        if paused:
+            for event in events:
+                if (event.type == pygame.QUIT or event.type == pygame.KEYDOWN
+                        and event.key == pygame.K_ESCAPE):
+                    engine.game_mode = GameModes.QUIT
+        elif engine.game_mode == GameModes.MENU:
+            drawn = run_main_menu(engine, controller, screen, events,
+                                  menu_changed)
+            lag = tick_length  # the first frame of a game runs one tick
+            alpha = 1.0
         elif engine.game_mode == GameModes.INTERACTIVE:
-            run_interactive_game(engine, controller, screen, events)
+            if not idle:  # i.e., unless the game was just resumed
+                lag = min(lag + clock.get_time(), MAX_FRAME_LAG)
+            ticks = int(lag // tick_length)
+            lag -= ticks * tick_length
+            if agent is not None:
+                controller = agent.act(engine)
+            if probe is not None:
+                probe.pressed(events, controller)
+            last_alpha, alpha = alpha, lag / tick_length
+            run_interactive_game(engine, controller, screen, events, renderer,
+                                 ticks, alpha, last_alpha)
+            if probe is not None:
+                probe.ticked(ticks)
+            engine.stats.end_frame(engine)
+            overlay.draw(screen)
+            if tracker is not None:
+                tracker.end_frame()
             health_pct = engine.player.health / engine.player.max_health
-        clock.tick(FPS)
-        pygame.display.flip()
+
+        # Show the frame before waiting out the rest of it, not after
+        if drawn:
+            pygame.display.flip()
+            if probe is not None:
+                probe.flipped()
+            if recorder is not None:
+                recorder.capture(screen)
+        shown_mode = engine.game_mode
+        was_loading = loading
+        clock.tick(args.fps)
+    if renderer is not None:
+        renderer.stop()
+    if probe is not None:
+        print(probe.report())
+    if tracker is not None:
+        print(tracker.report())
+    if recorder is not None:
+        recorder.stop()
+        print(recorder.report())
+    if args.shards > 0:
+        engine.stop_workers()
     pygame.quit()
@@ -0,0 +1,81 @@
+
+from collections import OrderedDict
+import numpy as np
+from levelgen import is_solid
+from settings import TILEMAP
+
+
+class LineOfSight():
+    '''
+    Tile-aware line of sight for enemy vision. Rays are cast on the tile
+    grid from the cell of each enemy's eyes to the cell of the target, and
+    a ray is blocked if it passes through any solid tile. All of the rays
+    that aren't cached yet are cast together with NumPy.
+
+    Results only depend on the two cells, so they're cached per target cell
+    and stay valid until the target moves to another cell. A few target
+    cells are kept so that several players don't evict each other.
+    '''
+
+    def __init__(self, world_data, max_targets=4):
+        '''
+        Builds the solid-tile mask for a level.
+        '''
+        self.tile_size = TILEMAP.TILE_SIZE
+        self.solid = np.array([[is_solid(tile) for tile in row]
+                               for row in world_data], dtype=bool)
+        self.max_targets = max_targets
+        self.cache = OrderedDict()
+
+    def _cell(self, x, y):
+        '''
+        Returns the (row, column) of the cell containing a point, clamped to
+        the level.
+        '''
+        rows, cols = self.solid.shape
+        return (min(max(y // self.tile_size, 0), rows - 1),
+                min(max(x // self.tile_size, 0), cols - 1))
+
+    def _cast(self, eye_cells, target_cell):
+        '''
+        Casts rays from several cells to one target cell and returns a list
+        with True for each ray that isn't blocked.
+        '''
+        eyes = np.array(eye_cells, dtype=np.float64) + 0.5
+        target = np.array(target_cell, dtype=np.float64) + 0.5
+
+        # Sample each ray at least twice per cell along its longer axis
+        delta = target - eyes
+        samples = int(np.abs(delta).max()) * 2 + 2
+        t = np.linspace(0.0, 1.0, samples)
+        rows = np.floor(eyes[:, :1] + delta[:, :1] * t).astype(np.intp)
+        cols = np.floor(eyes[:, 1:] + delta[:, 1:] * t).astype(np.intp)
+        return (~self.solid[rows, cols].any(axis=1)).tolist()
+
+    def can_see(self, watchers, target_rect):
+        '''
+        Returns the set of watchers (enemies) with a clear view of a target.
+        Enemies look from the middle of their vision strip, which is at the
+        top of their rect, towards the top of the target's rect.
+        '''
+        if not watchers:
+            return set()
+
+        eye_cells = [self._cell(enemy.rect.centerx, enemy.vision.centery)
+                     for enemy in watchers]
+        target_cell = self._cell(target_rect.centerx, target_rect.top)
+
+        # Find (or start) the cache for this target cell
+        if target_cell in self.cache:
+            self.cache.move_to_end(target_cell)
+        else:
+            self.cache[target_cell] = {}
+            if len(self.cache) > self.max_targets:
+                self.cache.popitem(last=False)
+        visible = self.cache[target_cell]
+
+        missing = list({cell for cell in eye_cells if cell not in visible})
+        if missing:
+            visible.update(zip(missing, self._cast(missing, target_cell)))
+        return {enemy for enemy, cell in zip(watchers, eye_cells)
+                if visible[cell]}
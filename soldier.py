@@ -1,8 +1,7 @@
 import os
-import random
 import pygame
-from pygame.time import get_ticks
 from weapons import Bullet, Grenade
+from components import Animator
 from settings import Direction, Action, ENVIRONMENT, TILEMAP
 
 
@@ -15,6 +14,7 @@ class Soldier(pygame.sprite.Sprite):
     '''
 
     animations = {}
+    masks = {}
     jump_fx = None
 
     @classmethod
@@ -23,7 +23,9 @@ class Soldier(pygame.sprite.Sprite):
         Preload animations and sounds into shared memory for reuse.
         '''
         if soldier_type not in cls.animations:
-            cls.animations[soldier_type] = cls._load_animations(base_dirpath)
+            animations = cls._load_animations(base_dirpath)
+            cls.masks[soldier_type] = cls._build_masks(animations)
+            cls.animations[soldier_type] = animations
             
         if cls.jump_fx is None:
             cls.jump_fx = pygame.mixer.Sound('audio/jump.wav')
@@ -53,15 +55,33 @@ class Soldier(pygame.sprite.Sprite):
                 image_list.append(img)
             animation_images.append(image_list)
         return animation_images
+
+    @staticmethod
+    def _build_masks(animations):
+        '''
+        Builds the collision masks for a set of animations, in the same
+        order as the frames. Each frame gets a (facing right, facing left)
+        pair of masks, since the images are mirrored when drawn.
+        '''
+        return [[(pygame.mask.from_surface(img),
+                  pygame.mask.from_surface(pygame.transform.flip(img, True,
+                                                                 False)))
+                 for img in image_list]
+                for image_list in animations]
     
 
-    def __init__(self, x, y, kind, speed=3, health=100, ammo=20, grenades=5):
+    def __init__(self, x, y, kind, speed=3, health=100, ammo=20, grenades=5,
+                 env=ENVIRONMENT, now=0):
         '''
-        Initializes a Soldier object by setting all the default values.
+        Initializes a Soldier object by setting all the default values. The
+        soldier, and the bullets and grenades it fires, follow env. Its
+        timers start at now, the engine's world time (in ms).
         '''        
         super().__init__()
         Soldier.load_assets(f'img/{kind}', kind)
 
+        self.env = env
+        self.jump_boost = 0  # added to the jump strength by jump buffs
         self.alive = True
         self.health = health
         self.speed = speed
@@ -81,12 +101,14 @@ class Soldier(pygame.sprite.Sprite):
         self.action = Action.IDLE
         self.animations = Soldier.animations
         self.image = self.animations[kind][self.action][self.frame_idx]
+        self.masks = Soldier.masks[kind]
         self.rect = self.image.get_rect()
-        self.animation_time = get_ticks()
+        self.animation_time = now
+        self.animator = None
         self.shoot_time = self.animation_time
         self.throw_time = self.animation_time
-        self.shoot_delay = ENVIRONMENT.SOLDIER_SHOOT_DELAY
-        self.throw_delay = ENVIRONMENT.SOLDIER_THROW_DELAY
+        self.shoot_delay = env.SOLDIER_SHOOT_DELAY
+        self.throw_delay = env.SOLDIER_THROW_DELAY
 
         # Adjusts the rectangle to be slightly smaller than image so that the
         # player falls through tile gaps; otherwise the player float on air
@@ -99,7 +121,8 @@ class Soldier(pygame.sprite.Sprite):
     def update(self):
         '''
         Updates the soldier's internal variables with each iteration through
-        the game loop. Mostly used for animation sequences.
+        the game loop. Mostly used to pick the animation sequence; the
+        engine's Animator steps through the frames.
         '''
 
         # Handle player animations
@@ -108,41 +131,47 @@ class Soldier(pygame.sprite.Sprite):
                       else Action.DEATH if not self.alive
                       else Action.IDLE)
         if new_action != self.action:
-            self.animation_time = get_ticks()
             self.action = new_action
-            self.frame_idx = 0
-
-        # Update timed sequences like animation frames
-        if get_ticks() > self.animation_time + ENVIRONMENT.ANIMATION_DELAY:
-            self.animation_time = get_ticks()
-            self.frame_idx += 1
-            # Animation rollover (except for the death sequence)
-            if self.frame_idx >= len(self.animations[self.action]):
-                if self.action == Action.DEATH:
-                  self.frame_idx = len(self.animations[self.action]) - 1
-                else:
-                    self.frame_idx = 0
-        
-        # Update the animation frame
-        self.image = self.animations[self.action][self.frame_idx]
+            if self.animator is not None:
+                self.animator.play(self)
+            else:
+                self.frame_idx = 0
+                self.image = self.animations[self.action][self.frame_idx]
 
         # Nothing particularly interesting to return
         return None
 
+    def mask(self):
+        '''
+        Returns the collision mask of the frame being shown. Its top-left
+        corner is at the top-left of the rect, where the image is drawn.
+        '''
+        flip = self.direction == Direction.LEFT
+        return self.masks[self.action][self.frame_idx][flip]
+
+    def animation_sequence(self):
+        '''
+        Returns the frames of the current action for the Animator. Every
+        sequence loops except the death sequence, which holds its last frame.
+        '''
+        mode = Animator.HOLD if self.action == Action.DEATH else Animator.LOOP
+        return self.animations[self.action], mode
+
     def move(self, mleft_cmd, mright_cmd, jump_cmd):
         '''
         Initiates jumping and lateral movements from the Soldier by setting
         initial velocities. It is a response to input from buttons on the
         controller. The physics engine is responsible for tracking/updating
-        the position and velocity of the Soldier over time.
+        the position and velocity of the Soldier over time. Returns True if
+        the Soldier just jumped, so the engine can play the jump sound.
         '''
 
         # Handle vertical movement
         if self.vel_y > 0:  # Only falling, not jumping up
             self.in_air = True
-        if jump_cmd and not self.in_air:
-            Soldier.jump_fx.play()
-            self.vel_y = ENVIRONMENT.SOLDIER_JUMP_STRENGTH
+        jumped = jump_cmd and not self.in_air
+        if jumped:
+            self.vel_y = self.env.SOLDIER_JUMP_STRENGTH + self.jump_boost
             self.in_air = True
                 
 
@@ -156,6 +185,7 @@ class Soldier(pygame.sprite.Sprite):
         else:
             # holding both buttons simultaneously
             self.vel_x = 0
+        return jumped
 
     def landed(self, impact_velocity):
         '''
@@ -174,40 +204,42 @@ class Soldier(pygame.sprite.Sprite):
             if self.health <= 0:
                 self.death()
 
-    def shoot(self):
+    def shoot(self, now):
         '''
-        Shoots a bullet if the Soldier has one. This function calculates the 
-        physical xy-location bullet and its direction of travel. The physics
-        engine is responsible for calculating its movements.
+        Shoots a bullet if the Soldier has one and its gun is ready at world
+        time now. This function calculates the physical xy-location bullet
+        and its direction of travel. The physics engine is responsible for
+        calculating its movements.
 
         It's important that the bullet starts outside of the Soldier's rect
         or the game engine will detect it as a suicide shot.
         '''
 
         if (self.ammo > 0 
-                and get_ticks() > self.shoot_time + self.shoot_delay):
+                and now > self.shoot_time + self.shoot_delay):
             self.ammo -= 1
-            self.shoot_time = get_ticks()
+            self.shoot_time = now
             x = self.rect.centerx + (30 * self.direction) # 30 is hack
             y = self.rect.centery
-            return Bullet(x, y, self.direction)
+            return Bullet(x, y, self.direction, self.env)
         else:
             return None
 
-    def throw(self):
+    def throw(self, now):
         '''
-        Throws a grenade if the Soldier has one. This function calculates the 
-        physical xy-location grenade and its direction of travel. The physics
-        engine is responsible for calculating its movements.
+        Throws a grenade if the Soldier has one and is ready to throw at
+        world time now. This function calculates the physical xy-location
+        grenade and its direction of travel. The physics engine is
+        responsible for calculating its movements.
         '''
         if (self.grenades > 0 
-                and get_ticks() > self.throw_time + self.throw_delay):
+                and now > self.throw_time + self.throw_delay):
             self.grenades -= 1
-            self.throw_time = get_ticks()
+            self.throw_time = now
             x_offset = int(self.rect.size[0] * 0.2 * self.direction.value)
             x = self.rect.centerx + x_offset
             y = self.rect.top
-            return Grenade(x, y, self.direction)
+            return Grenade(x, y, self.direction, self.env, now)
         else:
             return None
 
@@ -230,11 +262,13 @@ class Soldier(pygame.sprite.Sprite):
 
 class Enemy(Soldier):
 
-    def __init__(self, x, y, speed=2, health=100, ammo=20, grenades=5):
+    def __init__(self, x, y, speed=2, health=100, ammo=20, grenades=5,
+                 env=ENVIRONMENT, now=0):
         '''
         Initializes an Enemy object by setting animation frames and delays.
         '''        
-        super().__init__(x, y, 'enemy', speed, health, ammo, grenades)
+        super().__init__(x, y, 'enemy', speed, health, ammo, grenades, env,
+                         now)
         self.animations = Soldier.animations['enemy']
 
         self.move_counter = 0
@@ -242,9 +276,11 @@ class Enemy(Soldier):
         self.idling = False
         self.idling_counter = 0
 
-    def ai_move(self, world_map, tile_size, movement_limit=200):
+    def ai_move(self, world_map, tile_size, rng, movement_limit=200):
         '''
         AI movement, ensuring enemies don't walk into walls or off cliffs.
+        The random turns and pauses are drawn from rng, the engine's own
+        random.Random.
         '''
        
         # If enemy is idling, stop moving
@@ -261,21 +297,26 @@ class Enemy(Soldier):
         tile_y = self.rect.centery // tile_size
         tile_ahead_x = tile_x + self.direction
         tile_below_y = tile_y + 1
-        tile_ahead = world_map[tile_y][tile_ahead_x]
-        tile_below = world_map[tile_below_y][tile_ahead_x]
 
         # Check for walls, cliffs, and random behavior
         wall_ahead = False
         cliff_ahead = False
         random_turn = False
-        if (tile_ahead >= TILEMAP.DIRT_TILE_FIRST and
+        in_world = (0 <= tile_ahead_x < len(world_map[0])
+                    and tile_below_y < len(world_map))
+        if in_world:
+            tile_ahead = world_map[tile_y][tile_ahead_x]
+            tile_below = world_map[tile_below_y][tile_ahead_x]
+        if not in_world:
+            wall_ahead = True  # the edge of the world acts like a wall
+        elif (tile_ahead >= TILEMAP.DIRT_TILE_FIRST and
                 tile_ahead <= TILEMAP.DIRT_TILE_LAST):
             wall_ahead = True
         elif (tile_below == TILEMAP.EMPTY_TILE or
                 (tile_below >= TILEMAP.WATER_TILE_FIRST
                  and tile_below <= TILEMAP.WATER_TILE_LAST)):
             cliff_ahead = True
-        elif random.randint(1, movement_limit) == 1:
+        elif rng.randint(1, movement_limit) == 1:
             random_turn = True
 
         # Reasons to turn and pause
@@ -284,7 +325,7 @@ class Enemy(Soldier):
             self.direction *= -1
             self.idling = True
             self.move_counter = 0
-            self.idling_counter = random.randint(25, 75)                
+            self.idling_counter = rng.randint(25, 75)                
         
         # Otherwise, move forward
         else:
@@ -293,6 +334,17 @@ class Enemy(Soldier):
             super().move(ai_moving_left, ai_moving_right, False)
             self.move_counter += 1
 
+    def chase(self, direction, move, jump):
+        '''
+        Moves the way the navigation graph says to while chasing a target,
+        instead of patrolling with ai_move(). Returns True if it jumped.
+        '''
+        self.idling = False
+        self.move_counter = 0
+        self.direction = direction
+        return super().move(move and direction == Direction.LEFT,
+                     move and direction == Direction.RIGHT, jump)
+
     def update(self):
         '''
         Updates the Enemy by turning head to match the direction he's facing.
@@ -312,12 +364,14 @@ class Player(Soldier):
     controlled by a special AI agent.
     '''
 
-    def __init__(self, x, y, speed=5, health=100, ammo=20, grenades=5):
+    def __init__(self, x, y, speed=5, health=100, ammo=20, grenades=5,
+                 env=ENVIRONMENT, now=0):
         '''
         Initializes a Player object by setting animation frames and delays.
         '''
-        super().__init__(x, y, 'player', speed, health, ammo, grenades)
+        super().__init__(x, y, 'player', speed, health, ammo, grenades, env,
+                         now)
         self.animations = Soldier.animations['player']
-        self.shoot_delay = ENVIRONMENT.PLAYER_SHOOT_DELAY
-        self.throw_delay = ENVIRONMENT.PLAYER_THROW_DELAY
+        self.shoot_delay = env.PLAYER_SHOOT_DELAY
+        self.throw_delay = env.PLAYER_THROW_DELAY
 
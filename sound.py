@@ -0,0 +1,66 @@
+
+from settings import SCREEN_WIDTH
+
+
+class PositionalAudio():
+    '''
+    Plays sound effects from where they happen in the world instead of at a
+    fixed volume. A sound gets quieter the further it is from the middle of
+    the screen and pans towards the side it came from; sounds that are too
+    far away to hear aren't played at all, so they don't take up a mixer
+    channel. Several copies of the same sound started within a few ms of
+    each other (e.g., a squad of enemies shooting on the same frame) are
+    played once.
+
+    The counters (played, culled, and coalesced) add up over the life of
+    the object, so anyone interested can see how much work was saved.
+    '''
+
+    AUDIBLE_RANGE = SCREEN_WIDTH   # pixels from the middle of the screen
+    COALESCE_TIME = 30             # ms
+
+    def __init__(self, enabled=True):
+        '''
+        Creates a player for the sounds of one engine. Headless engines pass
+        enabled=False and stay silent.
+        '''
+        self.enabled = enabled
+        self.last_played = {}
+        self.played = 0
+        self.culled = 0
+        self.coalesced = 0
+
+    def volumes(self, world_x, camera_scroll):
+        '''
+        Returns the (left, right) channel volumes of a sound at a position
+        in the world, or None if it is out of earshot.
+        '''
+        offset = world_x + camera_scroll - SCREEN_WIDTH / 2
+        distance = abs(offset)
+        if distance > PositionalAudio.AUDIBLE_RANGE:
+            return None
+        volume = 1.0 - distance / PositionalAudio.AUDIBLE_RANGE
+        pan = max(-1.0, min(1.0, offset / (SCREEN_WIDTH / 2)))
+        return volume * min(1.0, 1.0 - pan), volume * min(1.0, 1.0 + pan)
+
+    def play(self, sound, world_x, camera_scroll, now):
+        '''
+        Plays a sound coming from world_x, as heard with the camera at
+        camera_scroll at time now (ms). Returns True if it was played.
+        '''
+        if not self.enabled:
+            return False
+        volumes = self.volumes(world_x, camera_scroll)
+        if volumes is None:
+            self.culled += 1
+            return False
+        if now - self.last_played.get(sound, -PositionalAudio.COALESCE_TIME) \
+                < PositionalAudio.COALESCE_TIME:
+            self.coalesced += 1
+            return False
+        self.last_played[sound] = now
+        self.played += 1
+        channel = sound.play()
+        if channel is not None:
+            channel.set_volume(*volumes)
+        return True
@@ -0,0 +1,27 @@
+
+import os
+import sys
+
+# The tests run headless, from the repository root like the game itself
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pygame
+import pytest
+from engine import GameEngine
+from settings import GameModes
+
+
+@pytest.fixture
+def engine():
+    '''
+    Returns an engine with level 1 loaded.
+    '''
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    engine = GameEngine(None, GameModes.INTERACTIVE)
+    engine.load_current_level()
+    return engine
@@ -0,0 +1,39 @@
+import pytest
+from levelgen import LevelGenerator, LevelOptions, is_completable, write_level
+from settings import TILEMAP
+
+
+def generate(**options):
+    return LevelGenerator(LevelOptions(**options)).generate()
+
+
+def test_same_seed_writes_the_same_csv(tmp_path):
+    paths = [tmp_path / 'first.csv', tmp_path / 'second.csv']
+    for path in paths:
+        write_level(generate(seed=7), path)
+    assert paths[0].read_bytes() == paths[1].read_bytes()
+    write_level(generate(seed=8), paths[1])
+    assert paths[0].read_bytes() != paths[1].read_bytes()
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'width': 40},
+    {'width': 600, 'enemy_density': 0.2},
+    {'water_gap_chance': 0.6, 'max_gap_width': 5},
+    {'platform_complexity': 1.0, 'item_density': 0.2},
+])
+def test_generated_levels_can_be_completed(options):
+    for seed in range(10):
+        world_data = generate(seed=seed, **options)
+        assert sum(row.count(TILEMAP.PLAYER_TILE_ID)
+                   for row in world_data) == 1
+        assert is_completable(world_data)
+
+
+def test_a_player_over_a_pit_cannot_complete_the_level():
+    world_data = generate(seed=3)
+    for row in world_data:
+        row[2] = TILEMAP.EMPTY_TILE
+    world_data[0][2] = TILEMAP.PLAYER_TILE_ID
+    assert not is_completable(world_data)
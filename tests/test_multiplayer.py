@@ -0,0 +1,60 @@
+import asyncio
+from collections import Counter
+import pygame
+from multiplayer import GameServer, GameClient, KIND_PLAYER, KIND_ENEMY
+
+
+TICKS = 30
+
+
+async def play_over_loopback():
+    '''
+    Runs a server for TICKS ticks with two headless clients connected, and
+    returns the server, its final world state, and the clients once they
+    have received all of it.
+    '''
+    server = GameServer()
+    serving = asyncio.create_task(server.serve(port=0, max_ticks=TICKS))
+    await server.listening.wait()
+    clients = [GameClient(), GameClient()]
+    for client in clients:
+        await client.connect(port=server.port)
+    running = [asyncio.create_task(client.run()) for client in clients]
+    await serving
+    state = server.engine.world_state(server.net_ids)
+    while any(client.tick < TICKS for client in clients):
+        await asyncio.sleep(0.01)
+    for client in clients:
+        client.running = False
+    await asyncio.gather(*running)
+    return server, state, clients
+
+
+def test_two_clients_over_loopback():
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    server, state, clients = asyncio.run(play_over_loopback())
+
+    # Both players joined, and each client ended up with the server's world
+    assert sorted(client.player_id for client in clients) == [1, 2]
+    kinds = Counter(fields[0] for fields in state.values())
+    assert kinds[KIND_PLAYER] == 2
+    assert kinds[KIND_ENEMY] == len(server.engine.groups['enemy']) > 0
+    for client in clients:
+        assert client.tick == TICKS
+        assert client.entities == state
+        assert client.me is not None
+
+    # Snapshots are deltas: after the first one, idle entities aren't resent
+    snapshots = sum(client.stats.messages_received - 1 for client in clients)
+    assert snapshots >= TICKS
+    assert server.stats.entities_sent < snapshots * len(state)
+
+    # The counters on both ends agree
+    assert server.stats.messages_sent == sum(client.stats.messages_received
+                                             for client in clients)
+    assert server.stats.bytes_sent == sum(client.stats.bytes_received
+                                          for client in clients)
+    assert 0 < server.stats.messages_received <= sum(
+        client.stats.messages_sent for client in clients)
+    assert server.stats.last_rtt_ms > 0
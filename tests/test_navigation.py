@@ -0,0 +1,15 @@
+import dataclasses
+from levelgen import jump_reach, max_jump_rise
+from navigation import NavigationGraph
+from settings import ENVIRONMENT
+
+
+def test_jumps_follow_the_engine_environment(engine):
+    floaty = dataclasses.replace(ENVIRONMENT, GRAVITY=0.35)
+    assert jump_reach(5, floaty)[1] > jump_reach(5)[1]
+    assert max_jump_rise(env=floaty) > max_jump_rise()
+
+    engine.env = floaty
+    engine.load_current_level()
+    default = NavigationGraph(engine.world_data)
+    assert engine.navigation.max_jump_rows > default.max_jump_rows
@@ -0,0 +1,21 @@
+
+from sharding import ShardedEngine
+
+
+def test_owner_matches_assigned_strips():
+    '''
+    Every strip is owned by exactly the worker whose range contains it.
+    '''
+    for strip_count in range(1, 130):
+        for worker_count in range(1, 9):
+            engine = ShardedEngine.__new__(ShardedEngine)
+            engine.strip_count = strip_count
+            engine.worker_count = worker_count
+            engine.assign_strips()
+            covered = 0
+            for idx, (first, last) in enumerate(engine.strip_ranges):
+                for strip in range(first, last + 1):
+                    assert engine.owner(strip) == idx
+                covered += max(0, last - first + 1)
+            assert covered == strip_count
+
@@ -0,0 +1,38 @@
+from controller import GameController
+
+
+def place_player(engine, rect):
+    '''
+    Puts the player on top of rect, with nothing left to fall.
+    '''
+    engine.player.rect.midbottom = rect.midbottom
+    engine.player.vel_y = 0
+    engine.player.in_air = False
+
+
+def test_entering_an_item_box_collects_it(engine):
+    item = engine.groups['item'].sprites()[0]
+    place_player(engine, item.rect)
+    engine.update(GameController())
+    assert not item.alive()
+    assert [trigger.sprite for _, trigger in engine.trigger_events] == [item]
+    assert not engine.triggers.touching(item.rect, 'item')
+    assert all(trigger.sprite is not item
+               for trigger in engine.triggers.inside[engine.player])
+
+
+def test_entering_the_exit_finishes_the_level(engine):
+    exit_tile = next(iter(engine.groups['exit']))
+    place_player(engine, exit_tile.rect)
+    engine.update(GameController())
+    assert engine.level_complete
+    assert [trigger.kind for _, trigger in engine.trigger_events] == ['exit']
+
+
+def test_dead_players_are_forgotten(engine):
+    engine.update(GameController())
+    assert engine.player in engine.triggers.inside
+    engine.player.death()
+    engine.update(GameController())
+    assert engine.player not in engine.triggers.inside
+    assert engine.trigger_events == []
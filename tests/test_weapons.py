@@ -0,0 +1,41 @@
+import pygame
+from engine import GameEngine
+from controller import GameController
+from settings import GameModes, Direction, TICK_RATE
+from weapons import Bullet
+
+
+def test_bullets_leave_at_the_end_of_their_own_level():
+    '''
+    Each engine removes bullets at the width of the level it loaded, even
+    when another engine in the process loaded a narrower one.
+    '''
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    wide, narrow = (GameEngine(None, GameModes.INTERACTIVE) for _ in range(2))
+    for engine in (wide, narrow):
+        engine.load_current_level()
+    wide.world_width *= 2
+    for engine in (wide, narrow):
+        bullet = Bullet(narrow.world_width + 100, 0, Direction.RIGHT)
+        engine.groups['bullet'].add(bullet)
+        engine.update(GameController())
+    assert len(wide.groups['bullet']) == 1
+    assert len(narrow.groups['bullet']) == 0
+
+
+def test_shooting_delay_counts_ticks_not_wall_time():
+    '''
+    A second's worth of ticks fires as many shots as the delay allows, even
+    though headless ticks take a tiny fraction of that in real time.
+    '''
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    engine = GameEngine(None, GameModes.INTERACTIVE)
+    engine.load_current_level()
+    ammo = engine.player.ammo
+    for _ in range(TICK_RATE):
+        engine.update(GameController(shoot=True))
+    # With a 200 ms delay, the shots go off at 216, 433, 650, and 866 ms
+    assert engine.player.shoot_delay == 200
+    assert ammo - engine.player.ammo == 4
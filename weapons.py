@@ -1,8 +1,8 @@
 
 import pygame
-from pygame.time import get_ticks
 from pygame.image import load
-from settings import ENVIRONMENT, TILEMAP
+from settings import ENVIRONMENT
+from components import Animator
 from os import listdir
 
 
@@ -11,13 +11,16 @@ class ItemBox(pygame.sprite.Sprite):
     Supplies for the player to collect with ammo, grenades, or health.
     '''
     images = None
-    sound_fx = "audio/collect.mp3"   
+    sound_fx = None
 
     @classmethod
     def load_assets(cls):
         '''
         Preload assets into shared memory to optimize performance.
         '''
+        if cls.images is not None:
+            return
+        cls.sound_fx = pygame.mixer.Sound('audio/collect.mp3')
         cls.images = {
             'ammo': load(f'img/icons/ammo_box.png').convert_alpha(),
             'health': load(f'img/icons/health_box.png').convert_alpha(),
@@ -51,6 +54,7 @@ class Bullet(pygame.sprite.Sprite):
     Bullets for the Soldier to shoot.
     '''
     image = None
+    mask = None
     sound_fx = None    
 
     @classmethod
@@ -59,14 +63,15 @@ class Bullet(pygame.sprite.Sprite):
         Preload assets into shared memory to optimize performance.
         '''
         # Load media from disk into shared memory for each instance to copy
-        cls.image = pygame.image.load('img/icons/bullet.png').convert_alpha()
+        if cls.image is not None:
+            return
         cls.sound_fx = pygame.mixer.Sound('audio/shot.wav')
         cls.sound_fx.set_volume(0.4)
+        image = pygame.image.load('img/icons/bullet.png').convert_alpha()
+        cls.mask = pygame.mask.from_surface(image)
+        cls.image = image
 
-        # Bullets eventually go off the end of the level
-        cls.remove_at_x = TILEMAP.COLS * TILEMAP.TILE_SIZE
-
-    def __init__(self, x, y, direction):
+    def __init__(self, x, y, direction, env=ENVIRONMENT):
         '''
         Initialize Bullet object; a weapon Soldiers shoot.
         '''                
@@ -74,23 +79,21 @@ class Bullet(pygame.sprite.Sprite):
         if not Bullet.image or not Bullet.sound_fx:
             Bullet.load_assets()
 
-        self.vel_x = ENVIRONMENT.BULLET_VELOCITY_X
-        self.damage = ENVIRONMENT.BULLET_FULL_DAMAGE
+        self.vel_x = env.BULLET_VELOCITY_X
+        self.damage = env.BULLET_FULL_DAMAGE
         self.direction = direction
         self.image = Bullet.image
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
-        Bullet.sound_fx.play()
 
     def update(self):
         '''
         Updates the position of the bullet. Most other objects are controlled
         by the physics engine. But since bullets are not affected by gravity
         (we treat them more like lasers), we need a special handler here.
+        The engine removes the bullets that leave the level.
         '''
         self.rect.x += self.vel_x * self.direction
-        if self.rect.right < 0 or self.rect.left > Bullet.remove_at_x:
-            self.kill()        
 
     def draw(self, screen, camera_x):
         '''
@@ -112,28 +115,30 @@ class Grenade(pygame.sprite.Sprite):
         '''
         Preload assets into shared memory to optimize performance.
         '''
-        cls.image = pygame.image.load('img/icons/grenade.png').convert_alpha()
+        if cls.image is None:
+            cls.image = pygame.image.load('img/icons/grenade.png').convert_alpha()
 
-    def __init__(self, x, y, direction):
+    def __init__(self, x, y, direction, env=ENVIRONMENT, now=0):
         '''
-        Initialize Grenade object; a weapon thrown by soldiers.
+        Initialize Grenade object; a weapon thrown by soldiers at world time
+        now (in ms), which lights the fuse.
         '''        
         super().__init__()
-        if not Grenade.image or not Grenade.sound_fx:
+        if not Grenade.image:
             Grenade.load_assets()
 
         self.in_air = True
-        self.vel_x = ENVIRONMENT.GRENADE_VELOCITY_X
-        self.vel_y = ENVIRONMENT.GRENADE_VELOCITY_Y
-        self.inner_radius = ENVIRONMENT.GRENADE_INNER_RADIUS
-        self.outer_radius = ENVIRONMENT.GRENADE_OUTER_RADIUS
-        self.full_damage = ENVIRONMENT.GRENADE_FULL_DAMAGE
+        self.vel_x = env.GRENADE_VELOCITY_X
+        self.vel_y = env.GRENADE_VELOCITY_Y
+        self.inner_radius = env.GRENADE_INNER_RADIUS
+        self.outer_radius = env.GRENADE_OUTER_RADIUS
+        self.full_damage = env.GRENADE_FULL_DAMAGE
+        self.fuse_time = env.GRENADE_FUSE_TIME
         self.image = Grenade.image
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
         self.direction = direction
-        self.throw_time = get_ticks()
-        self.do_explosion = False
+        self.throw_time = now
 
     def damage_at(self, pos_rect):
         '''
@@ -164,12 +169,11 @@ class Grenade(pygame.sprite.Sprite):
         self.vel_x = 0
         self.in_air = False
 
-    def update(self):
+    def exploding(self, now):
         '''
-        Determines when the grade should explode.
+        Returns True once the fuse has burnt down at world time now.
         '''
-        if get_ticks() > self.throw_time + ENVIRONMENT.GRENADE_FUSE_TIME:
-            self.do_explosion = True
+        return now > self.throw_time + self.fuse_time
 
     def draw(self, screen, camera_x):
         '''
@@ -190,20 +194,24 @@ class Explosion(pygame.sprite.Sprite):
         '''
         Preload assets into shared memory to optimize performance.
         '''
-        cls.animations = []
+        if cls.animations is not None:
+            return
+        cls.sound_fx = pygame.mixer.Sound('audio/grenade.wav')
+        cls.sound_fx.set_volume(1)
+        animations = []
         num_of_frames = len(listdir(f'img/explosion'))
         for i in range(num_of_frames):
             img = pygame.image.load(f'img/explosion/exp{i}.png')
             new_width = int(img.get_width() * 2)
             new_height = int(img.get_height() * 2)
             img = pygame.transform.scale(img, (new_width, new_height))
-            cls.animations.append(img.convert_alpha())
-        cls.sound_fx = pygame.mixer.Sound('audio/grenade.wav')
-        cls.sound_fx.set_volume(1)
+            animations.append(img.convert_alpha())
+        cls.animations = animations
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, now=0):
         '''
-        Initialize Explosion object; an animation sequence for grenades.
+        Initialize Explosion object; an animation sequence for grenades that
+        starts at world time now.
         '''
         super().__init__()
         if not Explosion.animations or not Explosion.sound_fx:
@@ -215,20 +223,15 @@ class Explosion(pygame.sprite.Sprite):
         self.image = self.animations[self.frame_idx]
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
-        self.animation_time = get_ticks()
-        Explosion.sound_fx.play()
+        self.animation_time = now
+        self.animator = None
 
-    def update(self):
+    def animation_sequence(self):
         '''
-        Updates the explosion animation sequence.
+        Returns the explosion frames for the Animator, which removes the
+        explosion after the last one.
         '''
-        if get_ticks() > self.animation_time + ENVIRONMENT.ANIMATION_DELAY:
-            self.animation_time = get_ticks()
-            self.frame_idx += 1
-            if self.frame_idx >= len(self.animations):
-                self.kill()
-            else:
-                self.image = self.animations[self.frame_idx]
+        return self.animations, Animator.END
 
     def draw(self, screen, camera_x):
         '''
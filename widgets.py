@@ -1,5 +1,5 @@
 import pygame
-from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, COLOR
 from enum import IntEnum
 
 
@@ -23,12 +23,16 @@ class GameButton():
         self.rect = self.image.get_rect()
         self.rect.topleft = (x, y)
         self.clicked = False
+        self.hovered = False
 
     def draw(self, screen):
         '''
-        Draws the button to the given screen surface.
+        Draws the button to the given screen surface, with an outline while
+        the mouse is over it.
         '''
         screen.blit(self.image, (self.rect.x, self.rect.y))
+        if self.hovered:
+            pygame.draw.rect(screen, COLOR.WHITE, self.rect.inflate(8, 8), 3)
 	
     def is_clicked(self):
         '''
@@ -43,6 +47,26 @@ class GameButton():
         else:
             self.clicked = False
         return False
+
+    def clicked_by(self, event):
+        '''
+        Returns True if an event is a left click on the button. Unlike
+        is_clicked(), this works for menus that sleep until the next event
+        instead of polling the mouse every frame.
+        '''
+        return (event.type == pygame.MOUSEBUTTONDOWN
+                and event.button == pygame.BUTTON_LEFT
+                and self.rect.collidepoint(event.pos))
+
+    def hover(self, pos):
+        '''
+        Records whether the mouse at pos is over the button. Returns True if
+        that changed, i.e., the button may need to be redrawn.
+        '''
+        hovered = bool(self.rect.collidepoint(pos))
+        changed = hovered != self.hovered
+        self.hovered = hovered
+        return changed
     
     def reset(self):
         '''
@@ -51,6 +75,74 @@ class GameButton():
         self.clicked = False
 
 
+class TextBar():
+    '''
+    Text to visualize the player's stats.
+    '''
+
+    font = None
+
+    @classmethod
+    def load_assets(cls):
+        '''
+        Preload font renderer into shared memory for reuse.
+        '''
+        if cls.font is None:
+            cls.font = pygame.font.SysFont('Futura', 30)
+
+    def __init__(self, x, y, color):
+        '''
+        Initializes a status bar with the starting value.
+        '''
+        TextBar.load_assets()
+        self.x, self.y = x, y
+        self.color = color
+
+    def draw(self, screen, text):
+        '''
+        Draws a particular statistics to the given screen surface.
+        '''
+        img = TextBar.font.render(text, True, self.color)
+        screen.blit(img, (self.x, self.y))
+
+
+class LoadingBar():
+    '''
+    A thin progress bar with a caption, e.g., for assets that are loading in
+    the background.
+    '''
+
+    font = None
+
+    @classmethod
+    def load_assets(cls):
+        '''
+        Preload the (built-in) font into shared memory for reuse.
+        '''
+        if cls.font is None:
+            cls.font = pygame.font.Font(None, 24)
+
+    def __init__(self, x, y, color, width=300, height=6):
+        '''
+        Initializes the bar's position, color, and size.
+        '''
+        LoadingBar.load_assets()
+        self.rect = pygame.Rect(x, y, width, height)
+        self.color = color
+
+    def draw(self, screen, fraction, caption=''):
+        '''
+        Draws the bar filled to a fraction (0 to 1) with a caption above.
+        '''
+        filled = self.rect.copy()
+        filled.width = int(self.rect.width * min(1.0, fraction))
+        pygame.draw.rect(screen, self.color, self.rect, 1)
+        pygame.draw.rect(screen, self.color, filled)
+        if caption:
+            img = LoadingBar.font.render(caption, True, self.color)
+            screen.blit(img, (self.rect.x, self.rect.y - img.get_height() - 4))
+
+
 class FadeType(IntEnum):
     INTRO_EVENT = 0
     LEVEL_EVENT = 1
@@ -83,9 +175,11 @@ class GameFade():
     def end_fade(self):
         self.started = False
 
-    def draw_fade(self, screen):
+    def draw_fade(self, screen, ticks=1):
         '''
-        Draws a frame from a screen fade animation baed on the fade type.
+        Draws a frame from a screen fade animation baed on the fade type. The
+        fade advances once per simulation tick, so it takes the same time no
+        matter how fast frames are drawn.
         '''
         if self.fade_type == FadeType.INTRO_EVENT:
             pygame.draw.rect(screen, self.color, (0 - self.counter, 0, SCREEN_WIDTH // 2, SCREEN_HEIGHT))
@@ -103,7 +197,172 @@ class GameFade():
             pygame.draw.rect(screen, self.color, (0, 0, SCREEN_WIDTH, self.counter))
         
         # Stop when we reach a certain point.
-        self.counter += self.speed
+        self.counter += self.speed * ticks
         if self.counter >= SCREEN_WIDTH:
             self.finished = True
 
+
+
+class PerfOverlay():
+    '''
+    A panel with a frame-time graph and the live FrameStats counters, shown
+    and hidden with toggle(). It draws from cached surfaces so that it barely
+    shows up in what it measures: the labels are rendered once, a number is
+    only rendered again when it changes (and at most a few times a second),
+    and the graph scrolls by a pixel per frame with one new column drawn.
+    '''
+
+    font = None
+
+    WIDTH = 200
+    LINE_HEIGHT = 16
+    GRAPH_HEIGHT = 60
+    GRAPH_MS = 33.3      # frame time at the top of the graph
+    TARGET_MS = 16.7     # frame time drawn as a guide line
+    REFRESH_MS = 250     # how often the numbers are rendered again
+
+    BACKGROUND = (16, 16, 16)   # opaque, since blending costs more
+    TEXT = (230, 230, 230)
+    UPDATE = (80, 200, 255)
+    DRAW = (255, 170, 60)
+    GUIDE = (120, 120, 120)
+
+    # (label, FrameStats key) for the rows above the per-group counts
+    ROWS = [('update ms', 'update_ms'), ('draw ms', 'draw_ms'),
+            ('ticks', 'ticks'), ('enemies awake', 'enemies_awake'),
+            ('bullets', 'sprites_bullet'), ('grenades', 'sprites_grenade'),
+            ('rect tests', 'rect_tests'), ('blits', 'blits'),
+            ('sounds', 'sounds')]
+
+    @classmethod
+    def load_assets(cls):
+        '''
+        Preload the (built-in) font into shared memory for reuse.
+        '''
+        if cls.font is None:
+            cls.font = pygame.font.Font(None, 20)
+
+    def __init__(self, stats, x=None, y=10):
+        '''
+        Creates a hidden overlay for a FrameStats object, by default in the
+        top-right corner of the screen.
+        '''
+        PerfOverlay.load_assets()
+        self.stats = stats
+        self.x = SCREEN_WIDTH - PerfOverlay.WIDTH - 10 if x is None else x
+        self.y = y
+        self.visible = False
+        self.rows = None
+        self.panel = None
+        self.graph = None
+        self.graph_y = 0
+        self.values = {}
+        self.blit_list = []
+        self.drawn_frame = -1
+        self.next_refresh = 0
+
+    def toggle(self):
+        '''
+        Shows the overlay if it is hidden and hides it otherwise.
+        '''
+        self.visible = not self.visible
+        self.panel = None
+
+    def build(self):
+        '''
+        Renders the static parts of the panel: background, labels, and the
+        frame-time graph from the stats history.
+        '''
+        group_rows = [(key[len('sprites_'):], key) for key in self.stats.last
+                      if key.startswith('sprites_')]
+        self.rows = PerfOverlay.ROWS + [(f'  {label}', key) for label, key
+                                        in group_rows]
+        height = (len(self.rows) + 1) * PerfOverlay.LINE_HEIGHT
+        self.panel = pygame.Surface((PerfOverlay.WIDTH,
+                                     height + PerfOverlay.GRAPH_HEIGHT + 10))
+        self.panel.fill(PerfOverlay.BACKGROUND)
+        self.panel.blit(PerfOverlay.font.render('sprites per group:', True,
+                                                PerfOverlay.TEXT),
+                        (6, 6 + len(PerfOverlay.ROWS)
+                         * PerfOverlay.LINE_HEIGHT))
+        for row, (label, key) in enumerate(self.rows):
+            row_y = 6 + row * PerfOverlay.LINE_HEIGHT
+            if row >= len(PerfOverlay.ROWS):
+                row_y += PerfOverlay.LINE_HEIGHT
+            self.panel.blit(PerfOverlay.font.render(label, True,
+                                                    PerfOverlay.TEXT),
+                            (6, row_y))
+        self.graph_y = self.y + height + 4
+        self.graph = pygame.Surface((PerfOverlay.WIDTH - 12,
+                                     PerfOverlay.GRAPH_HEIGHT))
+        self.graph.fill(PerfOverlay.BACKGROUND)
+        history = zip(self.stats.history['update_ms'],
+                      self.stats.history['draw_ms'])
+        for update_ms, draw_ms in list(history)[-self.graph.get_width():]:
+            self.add_graph_column(update_ms, draw_ms)
+        self.values = {}
+        self.next_refresh = 0
+
+    def add_graph_column(self, update_ms, draw_ms):
+        '''
+        Scrolls the graph left by a pixel and draws one frame's update and
+        draw times, stacked, in the new rightmost column.
+        '''
+        graph = self.graph
+        width, height = graph.get_size()
+        scale = height / PerfOverlay.GRAPH_MS
+        graph.scroll(-1, 0)
+        column = width - 1
+        graph.fill(PerfOverlay.BACKGROUND, (column, 0, 1, height))
+        update_px = min(height, int(update_ms * scale))
+        draw_px = min(height - update_px, int(draw_ms * scale))
+        graph.fill(PerfOverlay.UPDATE,
+                   (column, height - update_px, 1, update_px))
+        graph.fill(PerfOverlay.DRAW,
+                   (column, height - update_px - draw_px, 1, draw_px))
+        graph.set_at((column, height - int(PerfOverlay.TARGET_MS * scale)),
+                     PerfOverlay.GUIDE)
+
+    def value_surface(self, key):
+        '''
+        Returns the rendered number for a counter, rendering it again only
+        if it changed.
+        '''
+        value = self.stats.last.get(key, 0)
+        if isinstance(value, float):
+            value = round(value, 1)
+        cached = self.values.get(key)
+        if cached is None or cached[0] != value:
+            cached = (value, PerfOverlay.font.render(
+                str(value), True, PerfOverlay.TEXT, PerfOverlay.BACKGROUND))
+            self.values[key] = cached
+        return cached[1]
+
+    def draw(self, screen):
+        '''
+        Draws the overlay (if visible) on top of whatever is on the screen.
+        '''
+        if not self.visible or not self.stats.last:
+            return
+        if self.panel is None:
+            self.build()
+        elif self.drawn_frame != self.stats.frames:
+            last = self.stats.last
+            self.add_graph_column(last['update_ms'], last['draw_ms'])
+        self.drawn_frame = self.stats.frames
+
+        # Work out where the numbers go only a few times a second
+        now = pygame.time.get_ticks()
+        if now >= self.next_refresh:
+            self.next_refresh = now + PerfOverlay.REFRESH_MS
+            right = self.x + PerfOverlay.WIDTH - 6
+            self.blit_list = [(self.panel, (self.x, self.y)),
+                              (self.graph, (self.x + 6, self.graph_y))]
+            for row, (label, key) in enumerate(self.rows):
+                row_y = self.y + 6 + row * PerfOverlay.LINE_HEIGHT
+                if row >= len(PerfOverlay.ROWS):
+                    row_y += PerfOverlay.LINE_HEIGHT
+                surface = self.value_surface(key)
+                self.blit_list.append((surface,
+                                       (right - surface.get_width(), row_y)))
+        screen.blits(self.blit_list, False)